@@ -0,0 +1,259 @@
+import numpy as np
+
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from database import db
+from models import Transaction, Price
+
+
+# Transaction history of a user as columns sorted by symbol, then date
+Trades = namedtuple("Trades", ["symbols", "code", "shares", "price", "days"])
+
+DAYS_PER_YEAR = 365.25
+
+
+def _fetch_all(query):
+    """Fetch the rows of query as plain tuples from the driver, skipping the ORM's per-row work"""
+    statement = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={"render_postcompile": True})
+    params = statement.params
+    if statement.positional:
+        params = [params[name] for name in statement.positiontup]
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute(str(statement), params)
+        return cursor.fetchall()
+    finally:
+        cursor.close()
+
+
+def load_trades(user_id):
+    """Load the transactions of the user into NumPy columns"""
+
+    # Read the dates as text, which NumPy parses much faster than datetime objects
+    query = db.session.query(Transaction.stocks_symbol, Transaction.shares, db.cast(Transaction.price, db.Float),
+                             db.type_coerce(Transaction.transaction_date, db.String)).\
+        filter_by(user_id=user_id).order_by(Transaction.transaction_date, Transaction.id)
+
+    rows = _fetch_all(query)
+    if not rows:
+        return Trades([], *(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64, np.float64, np.float64)))
+
+    symbols, shares, price, dates = zip(*rows)
+    dates = np.array([str(date) for date in dates], dtype="datetime64[us]")
+    days = (dates - np.datetime64(0, "us")) / np.timedelta64(1, "D")
+
+    # Number the symbols and sort by symbol, keeping the trades of a symbol in date order
+    symbols, code = np.unique(np.array(symbols, dtype=object).astype(str), return_inverse=True)
+    order = np.argsort(code, kind="stable")
+    return Trades(list(symbols), code[order], np.array(shares, dtype=np.int64)[order],
+                  np.array(price, dtype=np.float64)[order], days[order])
+
+
+def _group_cumsum(values, starts):
+    """Cumulative sum of values restarting at every index in starts"""
+    total = np.cumsum(values)
+    offset = total[starts] - values[starts]
+    return total - np.repeat(offset, np.diff(np.append(starts, len(values))))
+
+
+def _affine_scan(a, b):
+    """Solve x[i] = a[i] * x[i - 1] + b[i] for every i, with x[-1] = 0, in log2(n) vectorized passes"""
+    a, b = a.copy(), b.copy()
+    step = 1
+    while step < len(a):
+        b[step:] = a[step:] * b[:-step] + b[step:]
+        a[step:] = a[step:] * a[:-step]
+        step *= 2
+    return b
+
+
+def _irr(flows, years, groups, n_groups, iterations=50):
+    """Annual rate r solving sum(flows * (1 + r) ** years) = 0 for every group, by Newton's method"""
+    rate = np.full(n_groups, 0.1)
+    for _ in range(iterations):
+        growth = (1 + rate[groups]) ** years
+        value = np.bincount(groups, flows * growth, n_groups)
+        slope = np.bincount(groups, flows * years * growth / (1 + rate[groups]), n_groups)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = np.nan_to_num(value / slope)
+        rate = np.clip(rate - step, -0.99, 100)
+        if np.all(np.abs(step) < 1e-9):
+            break
+
+    # Groups without a root keep a meaningless rate
+    growth = (1 + rate[groups]) ** years
+    value = np.bincount(groups, flows * growth, n_groups)
+    scale = np.bincount(groups, np.abs(flows), n_groups)
+    rate[~(np.abs(value) <= 1e-6 * np.maximum(scale, 1))] = np.nan
+    return rate
+
+
+def analyze(trades, prices, cash, now=None):
+    """Compute the P&L, cost basis and returns of every position and of the whole portfolio.
+
+    prices maps symbols to their current price; positions without one are valued at their last trade price.
+    """
+    # Without trades there is nothing but cash
+    if not len(trades.symbols):
+        return {"positions": dict(), "portfolio": {
+            "cash": cash,
+            "market_value": 0.0,
+            "total_value": float(cash),
+            "realized_pnl": 0.0,
+            "unrealized_pnl": 0.0,
+            "return": 0.0 if cash else None,
+            "stocks_money_weighted_return": None
+        }}
+
+    now = now or datetime.utcnow()
+    now_days = (np.datetime64(now, "us") - np.datetime64(0, "us")) / np.timedelta64(1, "D")
+    n = len(trades.symbols)
+    code, shares, price = trades.code, trades.shares, trades.price
+    starts = np.flatnonzero(np.diff(code, prepend=-1)) if len(code) else np.empty(0, dtype=np.int64)
+    last = np.append(starts[1:], len(code)) - 1
+
+    # Shares held after and before every trade
+    held = _group_cumsum(shares, starts)
+    held_before = held - shares
+    buys, sells = shares > 0, shares < 0
+    amount = shares * price
+
+    # Average cost basis: buys add their cost, sells keep the average cost of the remaining shares
+    with np.errstate(divide="ignore", invalid="ignore"):
+        kept = np.where(sells, held / np.where(held_before > 0, held_before, 1), 1.0)
+    kept[starts] = 0
+    average_cost = _affine_scan(kept, np.where(buys, amount, 0.0))
+    average_cost_before = np.append(0.0, average_cost[:-1])
+    average_cost_before[starts] = 0
+    realized_average = np.where(sells, -amount - (average_cost_before - average_cost), 0.0)
+
+    # FIFO cost basis: the n-th share sold of a symbol is the n-th share bought of it.
+    # Lots are numbered across all symbols, so one searchsorted() finds the lots of every sale.
+    bought = np.where(buys, shares, 0)
+    first_share = np.cumsum(np.bincount(code, bought, n)) - np.bincount(code, bought, n)
+    lot_end = np.cumsum(bought[buys])
+    lot_cost_end = np.cumsum(amount[buys])
+    lot_price = price[buys]
+
+    def fifo_cost(units):
+        """Cost of the first units shares bought, all symbols included"""
+        if not len(lot_end):
+            return np.zeros(len(units))
+        lot = np.minimum(np.searchsorted(lot_end, units), len(lot_end) - 1)
+        return lot_cost_end[lot] - (lot_end[lot] - units) * lot_price[lot]
+
+    sold = _group_cumsum(np.where(sells, -shares, 0), starts)
+    first_cost = fifo_cost(first_share[code])
+    fifo_sold = fifo_cost(first_share[code] + sold) - first_cost
+    fifo_sold_before = fifo_cost(first_share[code] + sold + np.where(sells, shares, 0)) - first_cost
+    realized_fifo = np.where(sells, -amount - (fifo_sold - fifo_sold_before), 0.0)
+
+    # Totals of every symbol
+    shares_held = held[last]
+    current = np.array([prices.get(symbol, price[i]) for symbol, i in zip(trades.symbols, last)], dtype=np.float64)
+    market_value = shares_held * current
+    buy_cost = np.bincount(code, np.where(buys, amount, 0.0), n)
+    cost_average = average_cost[last]
+    cost_fifo = buy_cost - fifo_sold[last]
+    realized_average_total = np.bincount(code, realized_average, n)
+    realized_fifo_total = np.bincount(code, realized_fifo, n)
+
+    # Time-weighted return: chain the price moves of the periods when shares were held
+    relative = np.zeros(len(code))
+    not_first = np.ones(len(code), dtype=bool)
+    not_first[starts] = False
+    relative[not_first] = np.log(price[not_first] / np.roll(price, 1)[not_first])
+    relative[held_before <= 0] = 0
+    twr = np.expm1(np.bincount(code, relative, n) + np.log(current / price[last]) * (shares_held > 0))
+
+    # Money-weighted return: rate of the trades plus the current value of the shares held
+    years = np.append(now_days - trades.days, np.zeros(n)) / DAYS_PER_YEAR
+    flows = np.append(-amount, market_value)
+    groups = np.append(code, np.arange(n))
+    mwr = _irr(flows, years, groups, n) if n else np.empty(0)
+    portfolio_mwr = _irr(flows, years, np.zeros(len(flows), dtype=np.int64), 1)[0] if n else np.nan
+
+    positions = dict()
+    for i, symbol in enumerate(trades.symbols):
+        positions[symbol] = {
+            "shares": int(shares_held[i]),
+            "price": float(current[i]),
+            "market_value": float(market_value[i]),
+            "average_cost_basis": float(cost_average[i]),
+            "fifo_cost_basis": float(cost_fifo[i]),
+            "realized_pnl": float(realized_average_total[i]),
+            "realized_pnl_fifo": float(realized_fifo_total[i]),
+            "unrealized_pnl": float(market_value[i] - cost_average[i]),
+            "unrealized_pnl_fifo": float(market_value[i] - cost_fifo[i]),
+            "time_weighted_return": float(twr[i]),
+            "money_weighted_return": None if np.isnan(mwr[i]) else float(mwr[i])
+        }
+
+    # Without deposits or withdrawals, the account return is both time and money weighted
+    starting_cash = cash + amount.sum()
+    total_value = cash + market_value.sum()
+    portfolio = {
+        "cash": cash,
+        "market_value": float(market_value.sum()),
+        "total_value": float(total_value),
+        "realized_pnl": float(realized_average_total.sum()),
+        "unrealized_pnl": float((market_value - cost_average).sum()),
+        "return": float(total_value / starting_cash - 1) if starting_cash else None,
+        "stocks_money_weighted_return": None if np.isnan(portfolio_mwr) else float(portfolio_mwr)
+    }
+
+    return {"positions": positions, "portfolio": portfolio}
+
+
+def portfolio_value_series(user_id, cash, start, end):
+    """Daily value of the cash and stocks of the user from start to end (both included).
+
+    Stocks are valued at the stored close of the day, or the last one before it,
+    falling back to the last trade price for days without stored prices.
+    """
+    trades = load_trades(user_id)
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    n, m = len(trades.symbols), len(days)
+    first_day = days[0].astype(np.int64) if m else 0
+
+    # Trades before start count on the first day, trades after end are left out
+    day = np.maximum(np.floor(trades.days).astype(np.int64) - first_day, 0)
+    kept = day < m
+    code, day, shares, price = trades.code[kept], day[kept], trades.shares[kept], trades.price[kept]
+
+    # Shares held and cash at the end of every day, from the cash before the first trade
+    held = np.zeros((n, m))
+    np.add.at(held, (code, day), shares)
+    held = np.cumsum(held, axis=1)
+    spent = np.bincount(day, shares * price, m)
+    cash_held = cash + (trades.shares * trades.price).sum() - np.cumsum(spent)
+
+    # Last trade price of every day
+    close = np.full((n, m), np.nan)
+    close[code, day] = price
+
+    # Stored closes, starting a few days early to carry prices over weekends and holidays
+    codes = {symbol.upper(): i for i, symbol in enumerate(trades.symbols)}
+    if codes and m:
+        query = db.session.query(Price.stocks_symbol, db.type_coerce(Price.date, db.String), Price.close).\
+            filter(Price.stocks_symbol.in_(codes), Price.date.between(start - timedelta(days=7), end)).\
+            order_by(Price.date)
+        rows = _fetch_all(query)
+        if rows:
+            symbols, dates, closes = zip(*rows)
+            stored_day = np.maximum(np.array([str(date_) for date_ in dates], dtype="datetime64[D]").astype(np.int64) - first_day, 0)
+            close[np.array([codes[symbol] for symbol in symbols], dtype=np.int64), stored_day] = closes
+
+    # Carry the last known price forward to the days without one
+    last_known = np.where(np.isnan(close), 0, np.arange(m))
+    np.maximum.accumulate(last_known, axis=1, out=last_known)
+    close = close[np.arange(n)[:, None], last_known]
+
+    values = cash_held + np.nansum(held * close, axis=0)
+    return days.astype(date).tolist(), values.tolist()
+
+
+def portfolio_analytics(user_id, prices, cash):
+    """Load the transactions of the user and analyze them"""
+    return analyze(load_trades(user_id), prices, cash)
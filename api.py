@@ -0,0 +1,318 @@
+import time
+
+from datetime import date, datetime, timedelta
+from flask import Blueprint, current_app, jsonify, request, session
+from functools import wraps
+from werkzeug.exceptions import HTTPException
+
+from helpers import history_filters, lookup, lookup_many, quote_cache, symbol_index
+from models import User, Transaction, Position, Order
+from orders import OrderError, cancel_order, execute_order, place_order, trade_basket
+
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+
+def json_response(data, code=200):
+    """Return data as compact JSON, answering 304 Not Modified to a matching If-None-Match"""
+    response = jsonify(data)
+    response.status_code = code
+    if request.method == "GET":
+        response.add_etag()
+        response.make_conditional(request)
+    return response
+
+
+def error(message, code=400):
+    """Return message as a JSON error"""
+    return json_response({"error": message}, code)
+
+
+def api_login_required(f):
+    """Decorate API routes to require login, answering 401 instead of redirecting"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session.get("user_id") is None:
+            return error("login required", 401)
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+@api.after_request
+def after_request(response):
+    # Let clients cache read responses and revalidate them with their ETag
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+@api.errorhandler(HTTPException)
+def errorhandler(e):
+    """Handle error"""
+    return error(e.name, e.code)
+
+
+@api.route("/quote/<symbol>")
+@api_login_required
+def quote(symbol):
+    """Get the quote of a stock"""
+    quote_ = lookup(symbol) if symbol_index.is_valid(symbol) else None
+    if quote_ is None:
+        return error("invalid symbol", 404)
+    return json_response(quote_json(symbol.upper(), quote_))
+
+
+@api.route("/quotes")
+@api_login_required
+def quotes():
+    """Get the quotes of up to QuoteClient.BATCH_SIZE stocks, e.g. ?symbols=AAPL,MSFT"""
+    # requests is only loaded when asked for quotes, as by make_provider()
+    from quote_client import QuoteClient
+
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in request.args.get("symbols", "").split(",")
+                                 if symbol.strip()))
+    if not symbols:
+        return error("missing symbols")
+
+    # Ensure the quotes can come from a single request to IEX
+    if len(symbols) > QuoteClient.BATCH_SIZE:
+        return error(f"more than {QuoteClient.BATCH_SIZE} symbols")
+    quotes_ = lookup_many(symbol for symbol in symbols if symbol_index.is_valid(symbol))
+    return json_response({symbol: quote_json(symbol, quote_) for symbol, quote_ in quotes_.items()})
+
+
+@api.route("/symbols")
+@api_login_required
+def symbol_search():
+    """Search the stocks list by symbol or company name, e.g. ?q=app&sector=Information Technology"""
+    q = request.args.get("q", "")
+    if not q.strip():
+        return error("missing q")
+    limit = max(1, min(request.args.get("limit", 10, type=int), 50))
+    return json_response({"symbols": symbol_index.search(q, sector=request.args.get("sector"), limit=limit)})
+
+
+@api.route("/holdings")
+@api_login_required
+def holdings():
+    """Get the cash and the owned stocks with their current value"""
+
+    user_id = session["user_id"]
+    user = User.query.filter_by(id=user_id).first()
+    positions = Position.query.filter_by(user_id=user_id).filter(Position.shares > 0).all()
+    quotes_ = lookup_many(position.stocks_symbol for position in positions)
+
+    holdings_ = list()
+    for position in positions:
+        quote_ = quotes_.get(position.stocks_symbol.upper())
+        holdings_.append({
+            "symbol": position.stocks_symbol,
+            "shares": position.shares,
+            "cost_basis": float(position.cost_basis),
+            "price": quote_["price"] if quote_ else None,
+            "value": position.shares * quote_["price"] if quote_ else None
+        })
+
+    return json_response({"cash": float(user.cash), "holdings": holdings_})
+
+
+@api.route("/analytics")
+@api_login_required
+def analytics():
+    """Get the cost basis, P&L and returns of every stock traded and of the whole portfolio"""
+
+    user_id = session["user_id"]
+    user = User.query.filter_by(id=user_id).first()
+    positions = Position.query.filter_by(user_id=user_id).filter(Position.shares > 0).all()
+    quotes_ = lookup_many(position.stocks_symbol for position in positions)
+    prices = {position.stocks_symbol: quotes_[position.stocks_symbol.upper()]["price"]
+              for position in positions if position.stocks_symbol.upper() in quotes_}
+
+    # numpy is only loaded once a portfolio is analyzed
+    from analytics import portfolio_analytics
+    return json_response(portfolio_analytics(user_id, prices, float(user.cash)))
+
+
+@api.route("/portfolio/history")
+@api_login_required
+def portfolio_history():
+    """Get the daily value of the portfolio, e.g. ?start=2021-01-01&end=2021-12-31 (default: the last year)"""
+
+    try:
+        end = date.fromisoformat(request.args["end"]) if request.args.get("end") else date.today()
+        start = date.fromisoformat(request.args["start"]) if request.args.get("start") else end - timedelta(days=365)
+    except ValueError:
+        return error("dates must be YYYY-MM-DD")
+    if start > end:
+        return error("start must be before end")
+
+    from analytics import portfolio_value_series
+    user = User.query.filter_by(id=session["user_id"]).first()
+    dates, values = portfolio_value_series(user.id, float(user.cash), start, end)
+    return json_response({"dates": [day.isoformat() for day in dates], "values": [round(value, 2) for value in values]})
+
+
+@api.route("/history")
+@api_login_required
+def history():
+    """Get a page of the transactions of the user, newest first, e.g. ?symbol=AAPL&side=buy&cursor=..."""
+
+    try:
+        filters = history_filters(request.args)
+    except ValueError as e:
+        return error(str(e))
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
+
+    # Query one more transaction than asked to know if there's a next page
+    transactions = Transaction.history(session["user_id"], limit=limit + 1, **filters).all()
+    next_cursor = transactions[limit - 1].cursor if len(transactions) > limit else None
+
+    return json_response({
+        "next": next_cursor,
+        "transactions": [transaction_json(transaction) for transaction in transactions[:limit]]
+    })
+
+
+@api.route("/orders", methods=["POST"])
+@api_login_required
+def orders():
+    """Buy or sell shares of stock, e.g. {"symbol": "AAPL", "side": "buy", "shares": 10}, now or with a "type" of
+    limit, stop or stop_limit once "limit_price" or "stop_price" is reached, with a "time_in_force" of gtc or day"""
+
+    order = request.get_json(silent=True) or dict()
+    symbol = str(order.get("symbol") or "").upper()
+    side = order.get("side")
+    shares = order.get("shares")
+    type_ = order.get("type", "market")
+
+    # Ensure the order is complete and valid
+    if not symbol:
+        return error("missing symbol")
+    if side not in ("buy", "sell"):
+        return error("side must be buy or sell")
+    if not isinstance(shares, int) or isinstance(shares, bool) or shares < 1:
+        return error("shares must be an integer greater than or equal to 1")
+    for price in ("limit_price", "stop_price"):
+        if not isinstance(order.get(price), (int, float, type(None))) or isinstance(order.get(price), bool):
+            return error(f"{price} must be a number")
+
+    quote_ = lookup(symbol) if symbol_index.is_valid(symbol) else None
+    if quote_ is None:
+        return error("invalid symbol")
+
+    if type_ != "market":
+        try:
+            resting = place_order(session["user_id"], symbol, side, type_, shares, order.get("limit_price"),
+                                  order.get("stop_price"), order.get("time_in_force", "gtc"))
+        except OrderError as e:
+            return error(str(e))
+
+        current_app.extensions["order_book"].add(resting.id, resting.stocks_symbol, resting.side, resting.type,
+                                                 resting.limit_price, resting.stop_price)
+        current_app.extensions["order_matcher"].on_quotes({symbol: quote_})
+        return json_response(order_json(resting), 201)
+
+    try:
+        transaction = execute_order(session["user_id"], symbol, shares if side == "buy" else -shares, quote_["price"])
+    except OrderError as e:
+        return error(str(e))
+
+    return json_response(transaction_json(transaction), 201)
+
+
+@api.route("/baskets", methods=["POST"])
+@api_login_required
+def baskets():
+    """Trade several stocks at once, all or nothing, e.g. {"legs": [{"symbol": "AAPL", "side": "buy", "shares": 10},
+    {"symbol": "MSFT", "side": "sell", "shares": 5}]}, or rebalance to target weights, e.g. {"weights": {"AAPL": 0.6}}"""
+
+    basket = request.get_json(silent=True) or dict()
+    legs = basket.get("legs") or list()
+    weights = basket.get("weights") or dict()
+
+    # Ensure the basket is complete and valid
+    if not isinstance(legs, list) or not isinstance(weights, dict) or bool(legs) == bool(weights):
+        return error("basket must have either legs or weights")
+    for leg in legs:
+        if not isinstance(leg, dict) or not isinstance(leg.get("symbol"), str) or leg.get("side") not in ("buy", "sell"):
+            return error("every leg needs a symbol and a side of buy or sell")
+        if not isinstance(leg.get("shares"), int) or isinstance(leg["shares"], bool) or leg["shares"] < 1:
+            return error("shares must be an integer greater than or equal to 1")
+    if not all(isinstance(weight, (int, float)) and not isinstance(weight, bool) for weight in weights.values()):
+        return error("weights must be numbers")
+
+    try:
+        transactions = trade_basket(session["user_id"],
+                                    legs=[(leg["symbol"], leg["shares"] if leg["side"] == "buy" else -leg["shares"])
+                                          for leg in legs],
+                                    weights=weights)
+    except OrderError as e:
+        return error(str(e))
+
+    return json_response({"transactions": [transaction_json(transaction) for transaction in transactions]}, 201)
+
+
+@api.route("/orders")
+@api_login_required
+def resting_orders():
+    """Get the resting orders of the user, newest first, e.g. ?status=open"""
+    query = Order.query.filter_by(user_id=session["user_id"])
+    if request.args.get("status"):
+        query = query.filter_by(status=request.args["status"])
+    limit = max(1, min(request.args.get("limit", 50, type=int), 500))
+    return json_response({"orders": [order_json(order) for order in query.order_by(Order.id.desc()).limit(limit)]})
+
+
+@api.route("/leaderboard")
+@api_login_required
+def leaderboard():
+    """Get the top users by portfolio value and return, the most held and traded stocks and the sector exposure"""
+    return json_response(current_app.extensions["leaderboard"].current())
+
+
+@api.route("/orders/<int:order_id>", methods=["DELETE"])
+@api_login_required
+def cancel(order_id):
+    """Cancel an open order"""
+    try:
+        order = cancel_order(session["user_id"], order_id)
+    except OrderError as e:
+        return error(str(e))
+
+    current_app.extensions["order_book"].remove(order_id)
+    return json_response(order_json(order))
+
+
+def quote_json(symbol, quote_):
+    """Return quote_ as a dict for JSON responses, with when it was fetched (UTC)"""
+    age = quote_cache.age(symbol)
+    as_of = datetime.utcfromtimestamp(time.time() - age).isoformat(timespec="seconds") if age is not None else None
+    return dict(quote_, as_of=as_of)
+
+
+def transaction_json(transaction):
+    """Return transaction as a dict for JSON responses"""
+    return {
+        "id": transaction.id,
+        "symbol": transaction.stocks_symbol,
+        "shares": transaction.shares,
+        "price": float(transaction.price),
+        "date": transaction.transaction_date.isoformat()
+    }
+
+
+def order_json(order):
+    """Return order as a dict for JSON responses"""
+    return {
+        "id": order.id,
+        "symbol": order.stocks_symbol,
+        "side": order.side,
+        "type": order.type,
+        "shares": order.shares,
+        "limit_price": float(order.limit_price) if order.limit_price is not None else None,
+        "stop_price": float(order.stop_price) if order.stop_price is not None else None,
+        "time_in_force": order.time_in_force,
+        "status": order.status,
+        "created": order.created.isoformat(),
+        "expires": order.expires.isoformat() if order.expires else None,
+        "transaction_id": order.transaction_id
+    }
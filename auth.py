@@ -0,0 +1,172 @@
+from flask import Blueprint, flash, redirect, render_template, request, session
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from database import db
+from helpers import apology
+from models import User
+
+
+auth = Blueprint("auth", __name__)
+
+
+@auth.route("/login", methods=["GET", "POST"])
+def login():
+    """Log user in"""
+
+    # Forget any user_id
+    session.clear()
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Ensure username was submitted
+        if not request.form.get("username"):
+            return apology("must provide username", 403)
+
+        # Ensure password was submitted
+        elif not request.form.get("password"):
+            return apology("must provide password", 403)
+
+        # Query database for username
+        rows = User.query.filter_by(username=request.form.get("username")).all()
+
+        # Ensure username exists and password is correct
+        if len(rows) != 1 or not check_password_hash(rows[0].password, request.form.get("password")):
+            return apology("invalid username and/or password", 403)
+
+        # Remember which user has logged in
+        session["user_id"] = rows[0].id
+
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("login.html")
+
+
+@auth.route("/logout")
+def logout():
+    """Log user out"""
+
+    # Forget any user_id
+    session.clear()
+
+    # Redirect user to login form
+    return redirect("/")
+
+
+@auth.route("/register", methods=["GET", "POST"])
+def register():
+    """Register user"""
+
+    # Forget any user_id
+    session.clear()
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Get the username, password and confirmation from the form
+        username = request.form.get("username")
+        email = request.form.get("email")
+        password = request.form.get("password")
+        confirmation = request.form.get("confirmation")
+
+        # Ensure username was submitted
+        if not username:
+            return apology("must provide username", 403)
+
+        # Ensure email was submitted
+        if not email:
+            return apology("must provide email", 403)
+
+        # Ensure password was submitted
+        elif not password:
+            return apology("must provide password", 403)
+
+        # Ensure entered passwords are the same
+        elif password != confirmation:
+            return apology("passwords don't match")
+
+        # Check if username doesn't exist
+        rows = User.query.filter_by(username=username).first()
+        if rows:
+            return apology("username already exists", 403)
+
+        # Check if email doesn't exist
+        rows = User.query.filter_by(email=email).first()
+        if rows:
+            return apology("email already exists", 403)
+
+        # Enter the new user to the users table
+        hashed_password = generate_password_hash(password)
+        user = User(username=username, email=email, password=hashed_password)
+        db.session.add(user)
+        db.session.commit()
+
+        # Remember which user has registered
+        session["user_id"] = user.id
+
+        flash("Your account has been created! You are now able to log in!")
+
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("register.html")
+
+
+@auth.route("/change_password", methods=["GET", "POST"])
+def changepassword():
+    """Change password of user"""
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Forget any user_id
+        session.clear()
+
+        # Get the username, password and confirmation from the form
+        username = request.form.get("username")
+        old_password = request.form.get("password")
+        new_password = request.form.get("new_password")
+        confirmation = request.form.get("confirmation")
+
+        # Ensure username was submitted
+        if not username:
+            return apology("must provide username", 403)
+
+        # Ensure password was submitted
+        elif not old_password:
+            return apology("must provide password", 403)
+
+        # Query database for username
+        users = User.query.filter_by(username=username).all()
+
+        # Ensure username exists and password is correct
+        if len(users) != 1 or not check_password_hash(users[0].password, old_password):
+            return apology("invalid username and/or password", 403)
+
+        # Ensure new password was submitted
+        if not new_password:
+            return apology("must provide new password", 403)
+
+        # Ensure entered passwords are the same
+        elif new_password != confirmation:
+            return apology("passwords don't match")
+
+        # Update the new password of the user
+        users[0].password = generate_password_hash(new_password)
+        db.session.commit()
+
+        # Remember which user has registered
+        session["user_id"] = users[0].id
+
+        flash("Successfully changed password!")
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("change_password.html")
@@ -0,0 +1,264 @@
+import multiprocessing
+import numpy as np
+
+from collections import namedtuple
+from datetime import date
+from functools import partial
+
+from sqlalchemy import create_engine
+
+from analytics import _fetch_all
+from database import db, same_database
+from models import User, Transaction, Position, Price
+
+
+# Cash and stocks of the simulated account, passed to the strategy every day (not to be modified by it)
+Portfolio = namedtuple("Portfolio", ["cash", "shares", "cost_basis"])
+
+# Outcome of a backtest: daily value and cash, final shares and cost basis, and every trade filled
+Backtest = namedtuple("Backtest", ["values", "cash", "shares", "cost_basis", "trades", "rejected"])
+
+# Columns of the filled trades
+TRADE = np.dtype([("day", np.int64), ("symbol", np.int64), ("shares", np.int64), ("price", np.float64)])
+
+TRADING_DAYS_PER_YEAR = 252
+
+
+def load_prices(symbols, start, end):
+    """Return the business days from start to end and the matrix of stored closes, one column per symbol.
+
+    A day without a close keeps the one before it; days before the first
+    close of a symbol are NaN, so it can't be traded yet.
+    """
+    days = np.arange(np.datetime64(start, "D"), np.datetime64(end, "D") + 1)
+    days = days[np.is_busday(days)]
+    codes = {symbol.upper(): i for i, symbol in enumerate(symbols)}
+    prices = np.full((len(days), len(symbols)), np.nan)
+
+    query = db.session.query(Price.stocks_symbol, db.type_coerce(Price.date, db.String), Price.close).\
+        filter(Price.stocks_symbol.in_(codes), Price.date.between(start, end))
+    rows = _fetch_all(query)
+    if rows:
+        stored_symbols, dates, closes = zip(*rows)
+        day = np.searchsorted(days, np.array([str(date_) for date_ in dates], dtype="datetime64[D]"))
+        kept = day < len(days)
+        column = np.array([codes[symbol.upper()] for symbol in stored_symbols], dtype=np.int64)
+        prices[day[kept], column[kept]] = np.array(closes, dtype=np.float64)[kept]
+
+    # Carry the last close forward to the days without one
+    last_known = np.where(np.isnan(prices), 0, np.arange(len(days))[:, None])
+    np.maximum.accumulate(last_known, axis=0, out=last_known)
+    return days.astype(date).tolist(), prices[last_known, np.arange(len(symbols))]
+
+
+def simulate_prices(n_symbols, n_days, seed=0, volatility=0.02):
+    """Return daily closes following a geometric random walk, one column per symbol"""
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(10, 500, n_symbols)
+    returns = rng.normal(0, volatility, (n_days, n_symbols))
+    returns[0] = 0
+    return np.round(start * np.exp(np.cumsum(returns, axis=0)), 2)
+
+
+def target_weights(portfolio, price, weights):
+    """Return the orders bringing the portfolio to weights, fractions of its total value by symbol.
+
+    The vectorized counterpart of orders.basket_from_weights(): what the
+    weights leave over stays in cash, and symbols without a price aren't traded.
+    """
+    priced = np.isfinite(price) & (price > 0)
+    total_value = portfolio.cash + np.dot(portfolio.shares[priced], price[priced])
+    target = np.zeros_like(portfolio.shares)
+    target[priced] = np.floor(weights[priced] * total_value / price[priced])
+    return np.where(priced, target - portfolio.shares, 0)
+
+
+def execute(orders, price, cash, shares, cost_basis):
+    """Fill the orders of a day (shares < 0 when selling) at price, returning (cash, filled shares, rejected orders).
+
+    The checks of orders.trade() apply to every order: no selling stocks
+    not owned or more shares than owned, no buying without the cash. Sales
+    are filled first, then purchases in symbol order until the cash runs
+    out. shares and cost_basis are updated in place, like Position.apply().
+    """
+    wanted = (orders != 0) & np.isfinite(price) & (price > 0)
+
+    # Sell only owned shares
+    sells = wanted & (orders < 0)
+    sold = sells & (shares > 0) & (-orders <= shares)
+    filled = np.where(sold, orders, 0)
+    cash -= np.dot(filled[sold], price[sold])
+
+    # Buy while the cash lasts
+    buys = np.flatnonzero(wanted & (orders > 0))
+    costs = orders[buys] * price[buys]
+    bought = buys[np.cumsum(costs) <= cash]
+    filled[bought] = orders[bought]
+    cash -= costs[:len(bought)].sum()
+
+    # Selling keeps the average cost of the remaining shares
+    cost_basis[sold] *= (shares[sold] + filled[sold]) / shares[sold]
+    cost_basis[bought] += filled[bought] * price[bought]
+    shares += filled
+
+    rejected = int(wanted.sum() - len(bought) - sold.sum())
+    return cash, filled, rejected
+
+
+def run(strategy, prices, cash=10000.0):
+    """Backtest strategy over prices, a matrix of daily closes with one column per symbol.
+
+    strategy(day, history, portfolio) is called every day with the closes
+    up to that day (history[-1] being today's) and returns the number of
+    shares to trade of every symbol at today's close, or None to hold.
+    """
+    n_days, n_symbols = prices.shape
+    shares = np.zeros(n_symbols, dtype=np.int64)
+    cost_basis = np.zeros(n_symbols)
+    values = np.empty(n_days)
+    cash_held = np.empty(n_days)
+    trades = list()
+    rejected = 0
+
+    valued = np.nan_to_num(prices)
+    for day in range(n_days):
+        orders = strategy(day, prices[:day + 1], Portfolio(cash, shares, cost_basis))
+        if orders is not None:
+            cash, filled, rejected_ = execute(np.asarray(orders, dtype=np.int64), prices[day], cash, shares, cost_basis)
+            rejected += rejected_
+
+            # Record the day's trades as one block of rows
+            traded = np.flatnonzero(filled)
+            if len(traded):
+                block = np.empty(len(traded), dtype=TRADE)
+                block["day"], block["symbol"] = day, traded
+                block["shares"], block["price"] = filled[traded], prices[day, traded]
+                trades.append(block)
+
+        cash_held[day] = cash
+        values[day] = cash + np.dot(shares, valued[day])
+
+    return Backtest(values, cash_held, shares, cost_basis,
+                    np.concatenate(trades) if trades else np.empty(0, dtype=TRADE), rejected)
+
+
+def summary(result, starting_cash=10000.0):
+    """Return the return, volatility, Sharpe ratio and drawdown of a backtest, annualized over trading days"""
+    values = np.concatenate(([starting_cash], result.values))
+    returns = values[1:] / values[:-1] - 1
+    years = len(result.values) / TRADING_DAYS_PER_YEAR
+    total_return = values[-1] / starting_cash - 1
+    volatility = returns.std() * np.sqrt(TRADING_DAYS_PER_YEAR)
+    return {
+        "final_value": float(values[-1]),
+        "return": float(total_return),
+        "annualized_return": float((1 + total_return) ** (1 / years) - 1) if years and total_return > -1 else None,
+        "volatility": float(volatility),
+        "sharpe": float(returns.mean() * TRADING_DAYS_PER_YEAR / volatility) if volatility else None,
+        "max_drawdown": float((1 - values / np.maximum.accumulate(values)).max()),
+        "trades": len(result.trades),
+        "rejected": result.rejected
+    }
+
+
+# Prices of the sweep, sent once to every worker process instead of with every backtest
+_prices = None
+
+
+def _init_worker(prices):
+    global _prices
+    _prices = prices
+
+
+def _run_summary(strategy, cash, params):
+    return summary(run(partial(strategy, **params), _prices, cash), cash)
+
+
+def sweep(strategy, grid, prices, cash=10000.0, processes=None):
+    """Backtest strategy with every dict of keyword arguments in grid, in parallel processes.
+
+    strategy must be a module-level function so the processes can load it.
+    Returns the summary of every backtest, in the order of grid.
+    """
+    with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(prices,)) as pool:
+        return pool.map(partial(_run_summary, strategy, cash), grid)
+
+
+def save(result, symbols, dates, uri, username="backtest", starting_cash=10000.0, protected=(), overwrite=False):
+    """Write a backtest as the user, transactions and positions of a scratch database.
+
+    Raise ValueError if uri is one of the protected URIs, e.g. the
+    application's database, or if its tables already hold rows and
+    overwrite isn't set.
+    """
+    if any(same_database(uri, other) for other in protected):
+        raise ValueError(f"{uri} is the database of the application, save backtests to a scratch database")
+
+    engine = create_engine(uri)
+    tables = [User.__table__, Transaction.__table__, Position.__table__]
+    try:
+        db.metadata.create_all(engine, tables=tables)
+        with engine.begin() as connection:
+            # Only replace an earlier backtest when asked to
+            if not overwrite and any(connection.execute(db.select([table.c.id]).limit(1)).first() for table in tables):
+                raise ValueError(f"{uri} already holds users or transactions, pass --overwrite to replace them")
+            for table in reversed(tables):
+                connection.execute(table.delete())
+            connection.execute(User.__table__.insert(), {"id": 1, "username": username, "email": f"{username}@localhost",
+                                                         "password": "", "cash": float(result.cash[-1])
+                                                         if len(result.cash) else starting_cash})
+
+            # Insert the trades in chunks so memory stays flat for long backtests
+            for i in range(0, len(result.trades), 10000):
+                connection.execute(Transaction.__table__.insert(), [
+                    {"stocks_symbol": symbols[trade["symbol"]], "shares": int(trade["shares"]),
+                     "price": float(trade["price"]), "transaction_date": dates[trade["day"]], "user_id": 1}
+                    for trade in result.trades[i:i + 10000]])
+
+            held = np.flatnonzero(result.shares)
+            if len(held):
+                connection.execute(Position.__table__.insert(), [
+                    {"stocks_symbol": symbols[i], "shares": int(result.shares[i]),
+                     "cost_basis": float(result.cost_basis[i]), "user_id": 1} for i in held])
+    finally:
+        engine.dispose()
+
+
+def buy_and_hold(day, history, portfolio):
+    """Spend the cash on equal weights of every stock on the first day, then hold"""
+    if day == 0:
+        n_symbols = history.shape[1]
+        return target_weights(portfolio, history[-1], np.full(n_symbols, 1 / n_symbols))
+    return None
+
+
+def moving_average_crossover(day, history, portfolio, short=20, long=100, rebalance=5):
+    """Hold equal weights of the stocks whose short moving average is above the long one, every rebalance days"""
+    if day < long or day % rebalance:
+        return None
+    rising = history[-short:].mean(axis=0) > history[-long:].mean(axis=0)
+    return target_weights(portfolio, history[-1], rising / max(rising.sum(), 1))
+
+
+def momentum(day, history, portfolio, lookback=60, top=20, rebalance=20):
+    """Hold equal weights of the top stocks by return over lookback days, every rebalance days"""
+    if day < lookback or day % rebalance:
+        return None
+    returns = np.nan_to_num(history[-1] / history[-lookback - 1] - 1, nan=-np.inf)
+    weights = np.zeros(history.shape[1])
+    weights[np.argsort(returns)[-top:]] = 1 / top
+    return target_weights(portfolio, history[-1], weights)
+
+
+# Strategies of the flask backtest command
+STRATEGIES = {
+    "buy_and_hold": buy_and_hold,
+    "moving_average_crossover": moving_average_crossover,
+    "momentum": momentum,
+}
+
+
+def business_days(end, n_days):
+    """Return the n_days business days up to end, e.g. the dates of simulated prices"""
+    days = np.busday_offset(np.datetime64(end, "D"), -np.arange(n_days)[::-1], roll="backward")
+    return days.astype(date).tolist()
@@ -0,0 +1,815 @@
+import json
+import math
+import multiprocessing
+import os
+import random
+import selectors
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from datetime import datetime, timedelta
+
+import click
+
+from fake_iex import FakeIEX
+
+
+# Routes driven by the benchmark, as (method, path, form) built for a user holding symbols
+ROUTES = {
+    "index": lambda symbols: ("GET", "/", None),
+    "history": lambda symbols: ("GET", "/history", None),
+    "quote": lambda symbols: ("GET", f"/quote/{random.choice(symbols)}", None),
+    "stocks_list": lambda symbols: ("GET", "/stocks_list", None),
+    "buy": lambda symbols: ("POST", "/buy", {"symbol": random.choice(symbols), "shares": "1"}),
+    "sell": lambda symbols: ("POST", "/sell", {"symbol": random.choice(symbols), "shares": "1"}),
+}
+
+# Password of every seeded user
+PASSWORD = "benchmark"
+
+# SQLite pragmas of the database benchmark, as SQLite and Python default to without tuning, and as configured
+DATABASE_SETUPS = {
+    "untuned": {"SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL", "SQLITE_BUSY_TIMEOUT": 5000,
+                "SQLITE_CACHE_SIZE": -2000, "SQLITE_MMAP_SIZE": 0},
+    "wal": {},
+}
+
+
+class DelayedProvider:
+    """Market data provider answering after a fixed latency, like an upstream API would"""
+
+    def __init__(self, provider, latency):
+        self.provider = provider
+        self.latency = latency
+        self.calls = 0
+
+    def quote_many(self, symbols):
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.provider.quote_many(symbols)
+
+    def chart(self, symbol, range_="1y"):
+        time.sleep(self.latency)
+        return self.provider.chart(symbol, range_)
+
+
+def percentile(values, p):
+    """Return the p-th percentile (nearest rank) of sorted values"""
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+def copy_database(database):
+    """Return the path of a copy of the SQLite database, so benchmarks leave it untouched"""
+    path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "finance.db")
+    with sqlite3.connect(database) as source, sqlite3.connect(path) as copy:
+        source.backup(copy)
+    return path
+
+
+def seed(db, users, transactions, holdings):
+    """Add users with transactions in holdings stocks each, returning {username: symbols held}"""
+    from werkzeug.security import generate_password_hash
+    from models import User, Transaction, Position, Stocks
+
+    symbols = [symbol.upper() for symbol, in db.session.query(Stocks.symbol)]
+    if len(symbols) < holdings:
+        raise click.ClickException(f"only {len(symbols)} stocks listed, fewer than {holdings} holdings")
+
+    # Hashing is slow on purpose, so every user shares the same password hash
+    password = generate_password_hash(PASSWORD)
+    run = datetime.utcnow().strftime("%H%M%S")
+    db.session.execute(User.__table__.insert(), [
+        {"username": f"bench{run}_{i}", "email": f"bench{run}_{i}@example.com", "password": password,
+         "cash": 1000000000} for i in range(users)])
+    user_ids = {username: id_ for id_, username in
+                db.session.query(User.id, User.username).filter(User.username.like(f"bench{run}_%"))}
+
+    # Buy every holding first, then trade random ones, oldest first, keeping the positions up to date
+    held = dict()
+    now = datetime.utcnow()
+    for username, user_id in user_ids.items():
+        held[username] = random.sample(symbols, holdings)
+        positions = {symbol: Position(user_id=user_id, stocks_symbol=symbol, shares=0, cost_basis=0)
+                     for symbol in held[username]}
+        rows = list()
+        for i in range(transactions):
+            symbol = held[username][i] if i < holdings else random.choice(held[username])
+            shares = random.randint(10, 100) if i < holdings or random.random() < 0.7 \
+                else -random.randint(1, max(1, positions[symbol].shares // 2))
+            price = round(random.uniform(10, 500), 2)
+            positions[symbol].apply(shares, price)
+            rows.append({"stocks_symbol": symbol, "shares": shares, "price": price, "user_id": user_id,
+                         "transaction_date": now - timedelta(minutes=transactions - i)})
+        if rows:
+            db.session.execute(Transaction.__table__.insert(), rows)
+        db.session.execute(Position.__table__.insert(), [
+            {"stocks_symbol": symbol, "shares": position.shares, "cost_basis": position.cost_basis,
+             "user_id": user_id} for symbol, position in positions.items() if position.shares])
+    db.session.commit()
+    return held
+
+
+class Worker(threading.Thread):
+    """Logged in user sending the requests of one route, recording the latency of each"""
+
+    def __init__(self, client, symbols, route, count):
+        super().__init__(daemon=True)
+        self.client = client
+        self.symbols = symbols
+        self.route = route
+        self.count = count
+        self.latencies = list()
+        self.errors = 0
+
+    def run(self):
+        for i in range(self.count):
+            method, path, form = ROUTES[self.route](self.symbols)
+            started = time.perf_counter()
+            try:
+                status = self.client(method, path, form)
+            except Exception:
+                status = None
+            self.latencies.append(time.perf_counter() - started)
+
+            # Pages answer 200 and trades redirect home, anything else is an error page
+            if status not in (200, 302):
+                self.errors += 1
+
+
+def wsgi_client(app):
+    """Return a function sending requests to app in-process, keeping the cookies of one user"""
+    client = app.test_client()
+
+    def send(method, path, form):
+        return client.open(path, method=method, data=form).status_code
+    return send
+
+
+def http_client(url):
+    """Return a function sending requests to the server at url, keeping the cookies of one user"""
+    import requests
+    client = requests.Session()
+
+    def send(method, path, form):
+        return client.request(method, url + path, data=form, allow_redirects=False).status_code
+    return send
+
+
+def serve(app):
+    """Serve app from a local threaded HTTP server, a thread per connection, returning its URL"""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    # Logging every request would slow the server down more than the routes
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    httpd = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_port}"
+
+
+def run_route(clients, held, route, count):
+    """Send count requests of route split across the clients, returning its results"""
+    workers = [Worker(client, held[username], route, count // len(clients) + (i < count % len(clients)))
+               for i, (username, client) in enumerate(clients)]
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for worker in workers for latency in worker.latencies)
+    return {
+        "requests": len(latencies),
+        "errors": sum(worker.errors for worker in workers),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """Return the descriptions of the routes slower than baseline by more than tolerance (a fraction).
+
+    p99 is reported but not compared, as a few requests are enough to move it.
+    """
+    found = list()
+    for route, result in results.items():
+        before = baseline.get(route)
+        if before is None:
+            continue
+        for key in ("p50", "p95"):
+            if before[key] and result[key] > before[key] * (1 + tolerance):
+                found.append(f"{route}: {key} {result[key] * 1000:.1f} ms, was {before[key] * 1000:.1f} ms")
+        if result["throughput"] < before["throughput"] / (1 + tolerance):
+            found.append(f"{route}: {result['throughput']:.1f} req/s, was {before['throughput']:.1f} req/s")
+    return found
+
+
+@click.group()
+def benchmark():
+    """Benchmarks of the application, run from the directory of finance.db"""
+
+
+@benchmark.command("routes")
+@click.option("--users", default=100, show_default=True, help="Number of users seeded.")
+@click.option("--transactions", default=200, show_default=True, help="Number of transactions of every user.")
+@click.option("--holdings", default=10, show_default=True, help="Number of stocks held by every user.")
+@click.option("--latency", default=0.05, show_default=True, help="Seconds the fake market data takes to answer.")
+@click.option("--quote-cache-ttl", default=15.0, show_default=True,
+              help="Seconds quotes are cached (0 to wait on the fake market data every lookup).")
+@click.option("--routes", default=",".join(ROUTES), show_default=True, help="Comma separated routes to drive.")
+@click.option("--requests", "count", default=200, show_default=True, help="Number of requests per route.")
+@click.option("--concurrency", default=4, show_default=True, help="Number of users sending requests at once.")
+@click.option("--warmup", default=10, show_default=True, help="Requests per route sent before measuring.")
+@click.option("--server", is_flag=True, help="Drive a local threaded HTTP server instead of the app in-process.")
+@click.option("--database", type=click.Path(exists=True, dir_okay=False), default="finance.db", show_default=True,
+              help="SQLite database copied before seeding, so it's left untouched.")
+@click.option("--save", type=click.File("w"), help="Write the results as JSON, e.g. to keep as a baseline.")
+@click.option("--baseline", type=click.File("r"), help="Fail if slower than the results saved in this file.")
+@click.option("--tolerance", default=0.2, show_default=True,
+              help="Fraction by which a route may be slower than the baseline.")
+def benchmark_routes(users, transactions, holdings, latency, quote_cache_ttl, routes, count, concurrency, warmup, server,
+                     database, save, baseline, tolerance):
+    """Seed a copy of the database and report the throughput and latency of the trading routes"""
+
+    routes = [route.strip() for route in routes.split(",") if route.strip()]
+    for route in routes:
+        if route not in ROUTES:
+            raise click.BadParameter(f"unknown route {route}, expected one of {', '.join(ROUTES)}", param_hint="--routes")
+
+    # Work on a copy of the database, with quotes simulated and no background threads
+    from application import create_app
+    from database import db
+    from helpers import set_market_data
+    from market_data import RandomWalkProvider
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{copy_database(database)}",
+        "MARKET_DATA": "random_walk",
+        "QUOTE_CACHE_TTL": quote_cache_ttl,
+        "QUOTE_CACHE_MAX_STALE": 60.0 if quote_cache_ttl else 0.0,
+        "PRICE_POLLER": "0",
+        "ORDER_MATCHER": "0",
+    })
+
+    with app.app_context():
+        # Prices don't move (no ticks), and every upstream call takes latency seconds
+        provider = set_market_data(DelayedProvider(RandomWalkProvider(tick_rate=0), latency))
+
+        db.create_all()
+        started = time.perf_counter()
+        held = seed(db, users, transactions, holdings)
+        click.echo(f"Seeded {users} users with {transactions} transactions each in {time.perf_counter() - started:.2f} s")
+
+    if server:
+        url = serve(app)
+        make_client = lambda: http_client(url)
+    else:
+        make_client = lambda: wsgi_client(app)
+
+    # Log in as a different user in every client
+    clients = list()
+    for username in random.sample(list(held), min(concurrency, len(held))):
+        client = make_client()
+        if client("POST", "/login", {"username": username, "password": PASSWORD}) != 302:
+            raise click.ClickException(f"couldn't log in as {username}")
+        clients.append((username, client))
+
+    results = dict()
+    for route in routes:
+        if warmup:
+            run_route(clients, held, route, warmup)
+        results[route] = run_route(clients, held, route, count)
+
+    # Report the routes, in milliseconds
+    click.echo(f"{'route':<12} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route, result in results.items():
+        click.echo(f"{route:<12} {result['requests']:>8} {result['errors']:>6} {result['throughput']:>8.1f} "
+                   f"{result['p50'] * 1000:>8.1f} {result['p95'] * 1000:>8.1f} {result['p99'] * 1000:>8.1f}")
+    click.echo(f"{provider.calls} market data calls of {latency * 1000:.0f} ms")
+
+    settings = {"users": users, "transactions": transactions, "holdings": holdings, "latency": latency,
+                "quote_cache_ttl": quote_cache_ttl, "concurrency": concurrency, "server": server}
+    if save:
+        json.dump({"settings": settings, "results": results}, save, indent=2)
+
+    if baseline:
+        saved = json.load(baseline)
+        if saved["settings"] != settings:
+            click.echo(f"Warning: the baseline was run with other settings: {saved['settings']}", err=True)
+        found = regressions(results, saved["results"], tolerance)
+        for regression in found:
+            click.echo(f"Regression: {regression}", err=True)
+        if found:
+            sys.exit(1)
+        click.echo(f"No route slower than the baseline by more than {tolerance:.0%}.")
+
+    errors = sum(result["errors"] for result in results.values())
+    if errors:
+        raise click.ClickException(f"{errors} requests failed")
+
+
+# Measures the startup of one process, printed as JSON for startup() to collect
+STARTUP_SCRIPT = """
+import json, resource, time
+started = time.perf_counter()
+import application
+imported = time.perf_counter()
+app = application.create_app()
+created = time.perf_counter()
+app.test_client().get("/login")
+served = time.perf_counter()
+print(json.dumps({"import": imported - started, "create_app": created - imported, "first_request": served - created,
+                  "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+@benchmark.command()
+@click.option("--runs", default=10, show_default=True, help="Number of processes started.")
+@click.option("--preload", is_flag=True, help="Load everything in create_app(), as with gunicorn --preload.")
+@click.option("--database", type=click.Path(exists=True, dir_okay=False), default="finance.db", show_default=True,
+              help="SQLite database copied before starting, so it's left untouched.")
+def startup(runs, preload, database):
+    """Report how long a fresh process takes to import the application, create it and serve a first request"""
+
+    environ = dict(os.environ, SQLALCHEMY_DATABASE_URI=f"sqlite:///{copy_database(database)}",
+                   MARKET_DATA="random_walk", PRICE_POLLER="0", ORDER_MATCHER="0", PRELOAD="1" if preload else "0")
+    samples = list()
+    for i in range(runs):
+        output = subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=environ, check=True,
+                                capture_output=True, text=True).stdout
+        samples.append(json.loads(output.splitlines()[-1]))
+
+    # Report the median of every step, in milliseconds
+    click.echo(f"{'step':<14} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for step in ("import", "create_app", "first_request"):
+        values = sorted(sample[step] for sample in samples)
+        click.echo(f"{step:<14} {percentile(values, 50) * 1000:>10.1f} {values[0] * 1000:>8.1f} {values[-1] * 1000:>8.1f}")
+    click.echo(f"{'max RSS':<14} {percentile(sorted(sample['max_rss_mb'] for sample in samples), 50):>9.1f}M")
+
+
+
+@benchmark.command()
+@click.option("--trades", default=100000, show_default=True, help="Number of transactions of the account.")
+@click.option("--symbols", default=50, show_default=True, help="Number of stocks traded.")
+@click.option("--runs", default=5, show_default=True, help="Number of times the account is analyzed.")
+@click.option("--limit", default=1.0, show_default=True, help="Fail if the median analysis takes more seconds.")
+def analytics(trades, symbols, runs, limit):
+    """Seed an account in a scratch database and report how long its analytics take"""
+    from application import create_app
+    from database import db
+    from models import User, Transaction
+    import analytics as engine
+
+    path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "finance.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "MARKET_DATA": "random_walk"})
+    with app.app_context():
+        db.create_all()
+        db.session.add(User(id=1, username="bench", email="bench@example.com", password="", cash=0))
+
+        # Buy, or sell at most the shares held, once a minute
+        held, rows = dict(), list()
+        started = datetime.utcnow() - timedelta(minutes=trades)
+        for i in range(trades):
+            symbol = f"S{random.randrange(symbols)}"
+            shares = random.randint(1, 100)
+            if held.get(symbol, 0) >= shares and random.random() < 0.4:
+                shares = -shares
+            held[symbol] = held.get(symbol, 0) + shares
+            rows.append({"stocks_symbol": symbol, "shares": shares, "price": round(random.uniform(10, 500), 2),
+                         "transaction_date": started + timedelta(minutes=i), "user_id": 1})
+        db.session.execute(Transaction.__table__.insert(), rows)
+        db.session.commit()
+        prices = {symbol: random.uniform(10, 500) for symbol in held}
+
+        samples = list()
+        for i in range(runs):
+            started = time.perf_counter()
+            loaded = engine.load_trades(1)
+            analyzed = time.perf_counter()
+            engine.analyze(loaded, prices, 10000.0)
+            samples.append((analyzed - started, time.perf_counter() - analyzed))
+            db.session.remove()
+
+    click.echo(f"{'step':<10} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for step, values in (("load", sorted(load for load, analyze in samples)),
+                         ("analyze", sorted(analyze for load, analyze in samples)),
+                         ("total", sorted(load + analyze for load, analyze in samples))):
+        click.echo(f"{step:<10} {percentile(values, 50) * 1000:>10.1f} {values[0] * 1000:>8.1f} {values[-1] * 1000:>8.1f}")
+
+    median = percentile(sorted(load + analyze for load, analyze in samples), 50)
+    if median > limit:
+        raise click.ClickException(f"analyzing {trades} trades took {median:.2f} s, more than {limit} s")
+
+
+@benchmark.command()
+@click.option("--holdings", default="1,10,25,50,100", show_default=True, help="Comma separated numbers of holdings.")
+@click.option("--latency", default=0.05, show_default=True, help="Seconds the fake IEX server takes to answer.")
+@click.option("--runs", default=10, show_default=True, help="Number of times the portfolio page is loaded.")
+def portfolio(holdings, latency, runs):
+    """Report the latency of the portfolio page as holdings grow, with quotes from a fake IEX server over HTTP"""
+    from application import create_app
+    from database import db
+    from models import User, Position
+
+    fake_iex = FakeIEX(latency).start()
+    path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "finance.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "MARKET_DATA": "iex", "API_KEY": "benchmark",
+                      "IEX_BASE_URL": fake_iex.url, "QUOTE_CACHE_TTL": 0, "QUOTE_CACHE_MAX_STALE": 0,
+                      "SYMBOLS_LISTED_ONLY": "0", "ORDER_MATCHER": "0", "SESSION_BACKEND": "cookie",
+                      "SECRET_KEY": "benchmark"})
+    market_data = app.extensions["market_data"]
+    with app.app_context():
+        db.create_all()
+
+    # Every portfolio is the same user holding a different number of stocks
+    click.echo(f"{'holdings':>8} {'page ms':>8} {'requests':>8} {'one per holding ms':>19} {'requests':>8}")
+    for count in [int(count) for count in holdings.split(",") if count.strip()]:
+        symbols = [f"S{i}" for i in range(count)]
+        with app.app_context():
+            db.session.query(Position).delete()
+            db.session.query(User).delete()
+            db.session.add(User(id=1, username="bench", email="bench@example.com", password="", cash=10000))
+            db.session.add_all([Position(user_id=1, stocks_symbol=symbol, shares=1, cost_basis=100)
+                                for symbol in symbols])
+            db.session.commit()
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session["user_id"] = 1
+
+        # The page fetches every quote in one batch request
+        pages, requests_before = list(), fake_iex.requests
+        for i in range(runs):
+            started = time.perf_counter()
+            if client.get("/").status_code != 200:
+                raise click.ClickException(f"the portfolio page of {count} holdings failed")
+            pages.append(time.perf_counter() - started)
+        batched_requests = (fake_iex.requests - requests_before) / runs
+
+        # As the page did before, with one request per holding
+        sequential, requests_before = list(), fake_iex.requests
+        for i in range(runs):
+            started = time.perf_counter()
+            for symbol in symbols:
+                market_data.quote_many([symbol])
+            sequential.append(time.perf_counter() - started)
+        sequential_requests = (fake_iex.requests - requests_before) / runs
+
+        click.echo(f"{count:>8} {percentile(sorted(pages), 50) * 1000:>8.1f} {batched_requests:>8.0f} "
+                   f"{percentile(sorted(sequential), 50) * 1000:>19.1f} {sequential_requests:>8.0f}")
+
+
+@benchmark.command()
+@click.option("--symbols", default="100,500,1000", show_default=True, help="Comma separated numbers of symbols quoted.")
+@click.option("--latency", default=0.05, show_default=True, help="Seconds the fake IEX server takes to answer.")
+@click.option("--pool-size", default=10, show_default=True, help="Connections, and batches fetched at once, of the client.")
+@click.option("--runs", default=5, show_default=True, help="Number of times the symbols are quoted.")
+def quotes(symbols, latency, pool_size, runs):
+    """Report the throughput of the IEX quote client against a fake IEX server over HTTP"""
+    import requests
+    from quote_client import QuoteClient
+
+    fake_iex = FakeIEX(latency).start()
+    client = QuoteClient(base_url=fake_iex.url, api_key="benchmark", pool_size=pool_size)
+
+    def new_connections(symbols):
+        # Every batch on a new connection, as without a session
+        for i in range(0, len(symbols), client.BATCH_SIZE):
+            batch = ",".join(symbols[i:i + client.BATCH_SIZE])
+            requests.get(f"{fake_iex.url}/stock/market/batch?symbols={batch}&types=quote&token=benchmark",
+                         timeout=client.timeout).json()
+
+    def one_batch_at_a_time(symbols):
+        for i in range(0, len(symbols), client.BATCH_SIZE):
+            client._quote_batch(symbols[i:i + client.BATCH_SIZE])
+
+    modes = (("new connection per batch", new_connections), ("pooled, one batch at a time", one_batch_at_a_time),
+             ("pooled, batches at once", client.quote_many))
+
+    click.echo(f"{'symbols':>7} {'mode':<28} {'median ms':>10} {'quotes/s':>10}")
+    for count in [int(count) for count in symbols.split(",") if count.strip()]:
+        quoted = [f"S{i}" for i in range(count)]
+        for mode, fetch in modes:
+            samples = list()
+            for i in range(runs):
+                started = time.perf_counter()
+                fetch(quoted)
+                samples.append(time.perf_counter() - started)
+            median = percentile(sorted(samples), 50)
+            click.echo(f"{count:>7} {mode:<28} {median * 1000:>10.1f} {count / median:>10.0f}")
+
+
+@benchmark.command()
+@click.option("--transactions", default=1000000, show_default=True, help="Number of transactions seeded.")
+@click.option("--users", default=1000, show_default=True, help="Number of users the transactions are split across.")
+@click.option("--symbols", default=100, show_default=True, help="Number of stocks traded.")
+@click.option("--runs", default=20, show_default=True, help="Number of users whose holdings are looked up.")
+def holdings(transactions, users, symbols, runs):
+    """Seed transactions in a scratch database and report how long looking up holdings takes before and after
+    the transaction indexes and the position table"""
+    from application import create_app
+    from bulk import rebuild_positions
+    from database import db
+    from models import Transaction, Position, User
+
+    path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "finance.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "MARKET_DATA": "random_walk",
+                      "SLOW_QUERY_SECONDS": 3600})
+    with app.app_context():
+        db.create_all()
+
+        # Seed without the indexes, as the transaction table was before them
+        for index in Transaction.__table__.indexes:
+            index.drop(db.engine)
+        db.session.execute(User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "email": f"bench{i}@example.com", "password": "", "cash": 10000}
+            for i in range(1, users + 1)])
+        db.session.commit()
+        started = time.perf_counter()
+        connection = db.engine.raw_connection()
+        now = datetime.utcnow()
+        for offset in range(0, transactions, 100000):
+            connection.cursor().executemany(
+                'INSERT INTO "transaction" (stocks_symbol, shares, price, transaction_date, user_id) '
+                'VALUES (?, ?, ?, ?, ?)',
+                [(f"S{random.randrange(symbols)}", random.choice((1, 1, -1)) * random.randint(1, 100),
+                  round(random.uniform(10, 500), 2), str(now - timedelta(minutes=transactions - i)),
+                  random.randint(1, users)) for i in range(offset, min(offset + 100000, transactions))])
+            connection.commit()
+        connection.close()
+        click.echo(f"Seeded {transactions} transactions in {time.perf_counter() - started:.1f} s")
+
+        def python_sum(user_id):
+            # As the routes did first: every transaction of the user, summed in Python
+            owned = dict()
+            for transaction in Transaction.query.filter_by(user_id=user_id):
+                owned[transaction.stocks_symbol] = owned.get(transaction.stocks_symbol, 0) + transaction.shares
+            return {symbol: shares for symbol, shares in owned.items() if shares > 0}
+
+        def sql_sum(user_id):
+            return {symbol: shares for _, symbol, shares in Transaction.holdings().filter(Transaction.user_id == user_id)}
+
+        def positions(user_id):
+            return {position.stocks_symbol: position.shares
+                    for position in Position.query.filter_by(user_id=user_id).filter(Position.shares > 0)}
+
+        def history(user_id):
+            return Transaction.history(user_id).all()
+
+        sampled = random.sample(range(1, users + 1), min(runs, users))
+
+        def measure(step, lookup):
+            samples = list()
+            for user_id in sampled:
+                started = time.perf_counter()
+                lookup(user_id)
+                samples.append(time.perf_counter() - started)
+                db.session.remove()
+            samples.sort()
+            click.echo(f"{step:<36} {percentile(samples, 50) * 1000:>10.2f} {samples[0] * 1000:>8.2f} "
+                       f"{samples[-1] * 1000:>8.2f}")
+
+        click.echo(f"{'step':<36} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+        measure("holdings, Python sum, no index", python_sum)
+        measure("holdings, GROUP BY, no index", sql_sum)
+        measure("history page, no index", history)
+
+        started = time.perf_counter()
+        for index in Transaction.__table__.indexes:
+            index.create(db.engine)
+        click.echo(f"Created the indexes in {time.perf_counter() - started:.1f} s")
+        measure("holdings, Python sum, indexed", python_sum)
+        measure("holdings, GROUP BY, indexed", sql_sum)
+        measure("history page, indexed", history)
+
+        started = time.perf_counter()
+        rebuild_positions(range(1, users + 1))
+        click.echo(f"Built the position table in {time.perf_counter() - started:.1f} s")
+        measure("holdings, position table", positions)
+
+        # The position table must hold what the transactions sum to
+        for user_id in sampled:
+            if positions(user_id) != sql_sum(user_id):
+                raise click.ClickException(f"the positions of user {user_id} don't match the transactions")
+
+
+def load_database(app, kind, user_ids, symbols, deadline, results):
+    """Trade (write) or read the portfolio and history (read) of random users until deadline, in a worker process,
+    putting the latencies and the numbers of locked and other errors on results"""
+    from sqlalchemy.exc import OperationalError
+    from database import db
+    from models import Position, Transaction
+    from orders import OrderError, execute_order
+
+    # Forked processes would all draw the same users otherwise
+    random.seed()
+
+    latencies, locked, errors = list(), 0, 0
+    with app.app_context():
+        while time.perf_counter() < deadline:
+            user_id = random.choice(user_ids)
+            started = time.perf_counter()
+            try:
+                if kind == "write":
+                    execute_order(user_id, random.choice(symbols), random.choice((1, -1)), 100)
+                else:
+                    Position.query.filter_by(user_id=user_id).filter(Position.shares > 0).all()
+                    Transaction.history(user_id).all()
+                latencies.append(time.perf_counter() - started)
+            except OrderError:
+                latencies.append(time.perf_counter() - started)
+            except OperationalError as e:
+                if "locked" in str(e):
+                    locked += 1
+                else:
+                    errors += 1
+            finally:
+                db.session.remove()
+    results.put((kind, latencies, locked, errors))
+
+
+@benchmark.command()
+@click.option("--users", default=100, show_default=True, help="Number of users seeded.")
+@click.option("--transactions", default=100, show_default=True, help="Number of transactions of every user.")
+@click.option("--readers", default=8, show_default=True, help="Number of processes reading portfolios and histories.")
+@click.option("--writers", default=4, show_default=True, help="Number of processes trading.")
+@click.option("--seconds", default=10.0, show_default=True, help="Seconds every setup is loaded for.")
+@click.option("--setups", default=",".join(DATABASE_SETUPS), show_default=True,
+              help="Comma separated setups: untuned (rollback journal, no pool) or wal (the configured pragmas and pool).")
+def database(users, transactions, readers, writers, seconds, setups):
+    """Report the latency of concurrent reads and trades on a scratch SQLite database, with and without WAL and the pool"""
+    from sqlalchemy.pool import NullPool
+    from application import create_app
+    from database import db
+    from models import User, Position, Transaction
+
+    symbols = [f"S{i}" for i in range(20)]
+    click.echo(f"{'setup':<8} {'kind':<6} {'ops':>7} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7} {'errors':>7}")
+    for setup in [setup.strip() for setup in setups.split(",") if setup.strip()]:
+        if setup not in DATABASE_SETUPS:
+            raise click.BadParameter(f"unknown setup {setup}, expected one of {', '.join(DATABASE_SETUPS)}",
+                                     param_hint="--setups")
+
+        path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "finance.db")
+        app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "MARKET_DATA": "random_walk",
+                          "SLOW_QUERY_SECONDS": 3600, "REQUEST_QUERIES_WARNING": 1000000, **DATABASE_SETUPS[setup]})
+        if setup == "untuned":
+            # A new connection for every session, as SQLAlchemy does for SQLite files by default
+            app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+                "poolclass": NullPool, "sqlite_pragmas": app.config["SQLALCHEMY_ENGINE_OPTIONS"]["sqlite_pragmas"]}
+
+        with app.app_context():
+            db.create_all()
+            db.session.execute(User.__table__.insert(), [
+                {"id": i, "username": f"bench{i}", "email": f"bench{i}@example.com", "password": "",
+                 "cash": 1000000000} for i in range(1, users + 1)])
+            db.session.execute(Position.__table__.insert(), [
+                {"user_id": i, "stocks_symbol": symbol, "shares": 1000, "cost_basis": 100000}
+                for i in range(1, users + 1) for symbol in symbols])
+            now = datetime.utcnow()
+            db.session.execute(Transaction.__table__.insert(), [
+                {"user_id": i, "stocks_symbol": random.choice(symbols), "shares": 1, "price": 100,
+                 "transaction_date": now - timedelta(minutes=j)} for i in range(1, users + 1)
+                for j in range(transactions)])
+            db.session.commit()
+
+        # Every reader and writer is a process of its own, like a gunicorn worker, forked without connections
+        with app.app_context():
+            db.engine.dispose()
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        deadline = time.perf_counter() + seconds
+        workers = [context.Process(target=load_database, args=(app, kind, list(range(1, users + 1)), symbols,
+                                                              deadline, results))
+                   for kind in ["read"] * readers + ["write"] * writers]
+        for worker in workers:
+            worker.start()
+        done = [results.get() for worker in workers]
+        for worker in workers:
+            worker.join()
+
+        for kind in ("read", "write"):
+            if not any(kind_ == kind for kind_, samples, locked, errors in done):
+                continue
+            latencies = sorted(latency for kind_, samples, locked, errors in done if kind_ == kind for latency in samples)
+            locked = sum(locked for kind_, samples, locked, errors in done if kind_ == kind)
+            errors = sum(errors for kind_, samples, locked, errors in done if kind_ == kind)
+            p50, p99 = (f"{percentile(latencies, p) * 1000:>8.1f}" if latencies else f"{'-':>8}" for p in (50, 99))
+            click.echo(f"{setup:<8} {kind:<6} {len(latencies):>7} {len(latencies) / seconds:>8.1f} {p50} {p99} "
+                       f"{locked:>7} {errors:>7}")
+
+
+@benchmark.command()
+@click.option("--streams", default=500, show_default=True, help="Number of users streaming their portfolio at once.")
+@click.option("--holdings", default=10, show_default=True, help="Number of stocks held by every user.")
+@click.option("--symbols", default=100, show_default=True, help="Number of stocks the holdings are drawn from.")
+@click.option("--interval", default=1.0, show_default=True, help="Seconds between lookups of the price feed.")
+@click.option("--seconds", default=10.0, show_default=True, help="Seconds the streams are read for once all are open.")
+def streams(streams, holdings, symbols, interval, seconds):
+    """Open live portfolio streams over HTTP and report the upstream lookups, threads, database connections and
+    delivery latency of the price feed"""
+    from application import create_app
+    from database import db
+    from helpers import set_market_data
+    from market_data import RandomWalkProvider
+    from models import User, Position
+
+    path = os.path.join(tempfile.mkdtemp(prefix="benchmark-"), "finance.db")
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{path}", "MARKET_DATA": "random_walk",
+                      "PRICE_FEED_INTERVAL": interval, "QUOTE_CACHE_TTL": 0, "QUOTE_CACHE_MAX_STALE": 0,
+                      "PRICE_POLLER": "0", "ORDER_MATCHER": "0",
+                      "SESSION_BACKEND": "cookie", "SECRET_KEY": "benchmark", "SLOW_QUERY_SECONDS": 3600})
+
+    # Prices move several times per interval, and every lookup of the feed is counted, with the time it ended
+    with app.app_context():
+        provider = set_market_data(DelayedProvider(RandomWalkProvider(tick_rate=10 / interval), 0))
+    lookups = list()
+    quote_many = provider.quote_many
+    provider.quote_many = lambda symbols_: (quote_many(symbols_), lookups.append((time.perf_counter(), len(symbols_))))[0]
+
+    listed = [f"S{i}" for i in range(symbols)]
+    with app.app_context():
+        db.create_all()
+        db.session.execute(User.__table__.insert(), [
+            {"id": i, "username": f"bench{i}", "email": f"bench{i}@example.com", "password": "", "cash": 10000}
+            for i in range(1, streams + 1)])
+        db.session.execute(Position.__table__.insert(), [
+            {"user_id": i, "stocks_symbol": symbol, "shares": 10, "cost_basis": 1000}
+            for i in range(1, streams + 1) for symbol in random.sample(listed, holdings)])
+        db.session.commit()
+    serializer = app.session_interface.get_signing_serializer(app)
+    port = int(serve(app).rsplit(":", 1)[1])
+
+    # Open every stream, reading all of them from this thread
+    selector = selectors.DefaultSelector()
+    opening = dict()
+    started = time.perf_counter()
+    for user_id in range(1, streams + 1):
+        client = socket.create_connection(("127.0.0.1", port))
+        client.sendall(f"GET /stream/portfolio HTTP/1.1\r\nHost: localhost\r\n"
+                       f"Cookie: {app.session_cookie_name}={serializer.dumps({'user_id': user_id})}\r\n\r\n".encode())
+        client.setblocking(False)
+        selector.register(client, selectors.EVENT_READ)
+        opening[client] = b""
+
+    # Headers are sent with the first event, so wait for them, dropping the events sent meanwhile
+    while opening:
+        ready = selector.select(timeout=max(15.0, 2 * interval))
+        if not ready:
+            raise click.ClickException(f"{len(opening)} streams didn't answer")
+        for key, mask in ready:
+            data = key.fileobj.recv(65536)
+            if key.fileobj in opening:
+                opening[key.fileobj] += data
+                if b"\r\n" in opening[key.fileobj]:
+                    status = opening.pop(key.fileobj).split(b"\r\n", 1)[0]
+                    if b" 200 " not in status:
+                        raise click.ClickException(f"a stream failed: {status.decode()}")
+    click.echo(f"Opened {streams} streams in {time.perf_counter() - started:.1f} s")
+
+    # Read the events, timing each from the end of the lookup it came from
+    with app.app_context():
+        feed = app.extensions["price_feed"]
+    lookups_before, events, latencies = len(lookups), 0, list()
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        for key, mask in selector.select(timeout=0.1):
+            received = time.perf_counter()
+            count = key.fileobj.recv(65536).count(b"data: ")
+            events += count
+            latencies.extend([received - lookups[-1][0]] * count)
+    with app.app_context():
+        connections = db.engine.pool.checkedout()
+    threads = threading.enumerate()
+
+    latencies.sort()
+    rounds = lookups[lookups_before:]
+    click.echo(f"subscribers                {len(feed)}")
+    click.echo(f"upstream lookups           {len(rounds)} in {seconds:.0f} s "
+               f"({len(rounds) / seconds * interval:.1f} per interval), "
+               f"{max((count for _, count in rounds), default=0)} symbols each")
+    click.echo(f"events received            {events} ({events / seconds:.0f}/s)")
+    if latencies:
+        click.echo(f"delivery latency           p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+                   f"p99 {percentile(latencies, 99) * 1000:.1f} ms")
+    click.echo(f"threads                    {len(threads)}: "
+               f"{sum('process_request_thread' in thread.name for thread in threads)} serving the streams, "
+               f"{sum(thread.name == 'price-feed' for thread in threads)} price feed")
+    click.echo(f"database connections held {connections}")
+
+    for key in list(selector.get_map().values()):
+        key.fileobj.close()
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,199 @@
+import csv
+
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from database import db
+from models import User, Transaction, Position, Stocks
+
+
+def _decimal(value):
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(f"not a number: {value!r}")
+
+
+def _datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(value)
+
+
+# Columns of the files of every kind of data, with the type of their values and the column of the table they fill
+KINDS = {
+    "users": (User.__table__, [
+        ("id", int, "id"),
+        ("username", str, "username"),
+        ("email", str, "email"),
+        ("password", str, "password"),
+        ("cash", _decimal, "cash"),
+    ]),
+    "transactions": (Transaction.__table__, [
+        ("id", int, "id"),
+        ("user_id", int, "user_id"),
+        ("symbol", str.upper, "stocks_symbol"),
+        ("shares", int, "shares"),
+        ("price", _decimal, "price"),
+        ("transaction_date", _datetime, "transaction_date"),
+    ]),
+    "stocks": (Stocks.__table__, [
+        ("symbol", str.upper, "symbol"),
+        ("company_name", str, "company_name"),
+        ("sector", str, "sector"),
+    ]),
+}
+
+# Rows inserted or written per statement and commit
+CHUNK_SIZE = 10000
+
+
+def read_rows(path, chunk_size=CHUNK_SIZE):
+    """Yield the rows of a CSV file, or of a Parquet file if pyarrow is installed, as dicts keyed by column"""
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet files need the pyarrow package")
+        for batch in pyarrow.parquet.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield from batch.to_pylist()
+    else:
+        with open(path, newline="") as file:
+            yield from csv.DictReader(file)
+
+
+class RowWriter:
+    """Writer of rows to a CSV file, or to a Parquet file if pyarrow is installed, one chunk at a time"""
+
+    def __init__(self, path, columns):
+        self.path = path
+        self.columns = columns
+        if path.endswith(".parquet"):
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("Parquet files need the pyarrow package")
+            self._pyarrow = pyarrow
+            self._writer = None
+        else:
+            self._pyarrow = None
+            self._file = open(path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(columns)
+
+    def write(self, rows):
+        """Write a chunk of rows, tuples of the values of the columns"""
+        if self._pyarrow is None:
+            self._writer.writerows(rows)
+            return
+        table = self._pyarrow.Table.from_pydict({column: [row[i] for row in rows]
+                                                 for i, column in enumerate(self.columns)})
+        if self._writer is None:
+            self._writer = self._pyarrow.parquet.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._pyarrow is None:
+            self._file.close()
+        elif self._writer is not None:
+            self._writer.close()
+
+
+def import_rows(kind, rows, chunk_size=CHUNK_SIZE, on_chunk=None, user_ids=None):
+    """Insert rows of kind (users, transactions or stocks), dicts keyed by column, a chunk per statement and commit.
+
+    Rows keep their id when the file has one. Stocks already listed are
+    replaced. Returns the number of rows and, for transactions, the ids of
+    their users, whose positions need rebuilding. on_chunk(count) is called
+    after every commit. Raise ValueError at the first invalid row, once
+    the chunks before it are committed; the users of their transactions
+    are added to user_ids, if given, as every chunk is committed.
+    """
+    table, columns = KINDS[kind]
+    count, chunk, chunk_user_ids = 0, list(), set()
+    user_ids = set() if user_ids is None else user_ids
+
+    def insert(chunk):
+        if kind == "stocks":
+            # Replace the stocks already listed instead of listing them twice
+            db.session.execute(table.delete().where(table.c.symbol.in_([row["symbol"] for row in chunk])))
+        db.session.execute(table.insert(), chunk)
+        db.session.commit()
+        user_ids.update(chunk_user_ids)
+        chunk_user_ids.clear()
+        if on_chunk:
+            on_chunk(count)
+
+    for row in rows:
+        values = dict()
+        for name, type_, column in columns:
+            value = row.get(name)
+            if value is None or value == "":
+                if name == "id":
+                    continue
+                raise ValueError(f"row {count + 1}: missing {name}")
+            try:
+                values[column] = type_(value)
+            except (ValueError, TypeError, AttributeError):
+                # Parquet columns keep their type, e.g. a number where a symbol is expected
+                raise ValueError(f"row {count + 1}: invalid {name} {value!r}")
+        chunk.append(values)
+        count += 1
+        if kind == "transactions":
+            chunk_user_ids.add(values["user_id"])
+
+        # Commit in chunks so memory stays flat for large files
+        if len(chunk) == chunk_size:
+            insert(chunk)
+            chunk = list()
+
+    if chunk:
+        insert(chunk)
+    return count, user_ids
+
+
+def export_rows(kind, writer, chunk_size=CHUNK_SIZE):
+    """Write every row of kind to writer in id order, a chunk at a time, returning the number of rows"""
+    table, columns = KINDS[kind]
+
+    # Read amounts as floats and dates as the text stored, skipping the conversions to Decimal and datetime
+    selected = list()
+    for name, type_, column in columns:
+        if isinstance(table.c[column].type, db.Numeric):
+            selected.append(db.cast(table.c[column], db.Float))
+        elif isinstance(table.c[column].type, db.DateTime):
+            selected.append(db.type_coerce(table.c[column], db.String))
+        else:
+            selected.append(table.c[column])
+
+    result = db.session.execute(db.select(selected).order_by(table.c.id).execution_options(stream_results=True))
+    count = 0
+    for chunk in result.partitions(chunk_size):
+        writer.write(chunk)
+        count += len(chunk)
+    return count
+
+
+def rebuild_positions(user_ids, chunk_size=500):
+    """Recompute the positions of the users from their transactions, a chunk of users per commit, returning their number"""
+    user_ids = sorted(user_ids)
+    count = 0
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        positions = dict()
+        transactions = db.session.query(Transaction.user_id, Transaction.stocks_symbol, Transaction.shares,
+                                        Transaction.price).\
+            filter(Transaction.user_id.in_(chunk)).order_by(Transaction.transaction_date, Transaction.id)
+        for user_id, symbol, shares, price in transactions:
+            key = (user_id, symbol)
+            if key not in positions:
+                positions[key] = Position(user_id=user_id, stocks_symbol=symbol, shares=0, cost_basis=0)
+            positions[key].apply(shares, price)
+
+        Position.query.filter(Position.user_id.in_(chunk)).delete(synchronize_session=False)
+        if positions:
+            db.session.execute(Position.__table__.insert(), [
+                {"stocks_symbol": position.stocks_symbol, "shares": position.shares,
+                 "cost_basis": position.cost_basis, "user_id": position.user_id} for position in positions.values()])
+        db.session.commit()
+        count += len(positions)
+    return count
@@ -0,0 +1,315 @@
+import csv
+import itertools
+import time
+from datetime import date, timedelta
+
+import click
+from flask import Blueprint, current_app
+
+import bulk
+import helpers
+from database import db
+from market import polled_symbols
+from helpers import fragment_cache, symbol_index
+from market_data import RandomWalkProvider
+from models import Transaction, Position, Price
+from sessions import DatabaseSessionInterface
+
+
+# Maintenance commands of the flask CLI, e.g. flask init-db
+commands = Blueprint("commands", __name__, cli_group=None)
+
+
+@commands.cli.command("rebuild-positions")
+def rebuild_positions():
+    """Recompute the positions table from the transaction table"""
+
+    # Make sure the positions table exists
+    db.create_all()
+
+    positions = Position.replay()
+    Position.query.delete()
+    db.session.add_all(positions.values())
+    db.session.commit()
+    click.echo(f"Rebuilt {len(positions)} positions.")
+
+
+@commands.cli.command("verify-positions")
+@click.option("--cost-basis", is_flag=True, help="Also replay every transaction to check the cost basis.")
+def verify_positions(cost_basis):
+    """Check the positions table against the transaction table"""
+
+    stored = {(position.user_id, position.stocks_symbol): position for position in Position.query}
+
+    # Compare the owned shares with the totals summed by the database
+    expected = {(user_id, symbol): shares for user_id, symbol, shares in Transaction.holdings()}
+    mismatches = 0
+    for key in expected.keys() | stored.keys():
+        want = expected.get(key, 0)
+        have = stored[key].shares if key in stored else 0
+        if want != have:
+            mismatches += 1
+            click.echo(f"user {key[0]} {key[1]}: expected {want} shares, found {have}")
+
+    # Compare the cost basis with a full replay of the transactions
+    if cost_basis:
+        for key, position in Position.replay().items():
+            want = round(float(position.cost_basis), 2)
+            have = round(float(stored[key].cost_basis), 2) if key in stored else 0
+            if want != have:
+                mismatches += 1
+                click.echo(f"user {key[0]} {key[1]}: expected cost basis {want}, found {have}")
+
+    if mismatches:
+        raise click.ClickException(f"{mismatches} positions don't match the transactions")
+    click.echo(f"All {len(stored)} positions match the transactions.")
+
+
+@commands.cli.command("import-prices")
+@click.argument("symbols", nargs=-1)
+@click.option("--range", "range_", default="1y", show_default=True, help="How far back to fetch, e.g. 1m, 1y, 5y.")
+def import_prices(symbols, range_):
+    """Store the daily prices of SYMBOLS (default: every held and listed stock) from the market data provider"""
+
+    db.create_all()
+    for symbol in symbols or polled_symbols():
+        prices = helpers.market_data.chart(symbol, range_)
+        Price.store(prices)
+        db.session.commit()
+        click.echo(f"{symbol.upper()}: {len(prices)} days")
+
+
+@commands.cli.command("import-prices-csv")
+@click.argument("file", type=click.File())
+def import_prices_csv(file):
+    """Store daily prices from a CSV file with columns symbol, date, open, high, low, close, volume"""
+
+    db.create_all()
+
+    def optional(value, type_):
+        return type_(value) if value not in (None, "") else None
+
+    count = 0
+    rows = list()
+    for row in csv.DictReader(file):
+        rows.append({
+            "stocks_symbol": row["symbol"].upper(),
+            "date": date.fromisoformat(row["date"]),
+            "open": optional(row.get("open"), float),
+            "high": optional(row.get("high"), float),
+            "low": optional(row.get("low"), float),
+            "close": float(row["close"]),
+            "volume": optional(row.get("volume"), int)
+        })
+
+        # Commit in chunks so memory stays flat for large files
+        if len(rows) == 10000:
+            Price.store(rows)
+            db.session.commit()
+            count += len(rows)
+            rows = list()
+
+    Price.store(rows)
+    db.session.commit()
+    click.echo(f"Stored {count + len(rows)} daily prices.")
+
+
+@commands.cli.command("import-data")
+@click.argument("kind", type=click.Choice(list(bulk.KINDS)))
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--chunk-size", default=bulk.CHUNK_SIZE, show_default=True, help="Rows inserted per statement and commit.")
+@click.option("--positions/--no-positions", default=True, show_default=True,
+              help="Rebuild the positions of the users of imported transactions.")
+def import_data(kind, path, chunk_size, positions):
+    """Insert the users, transactions or stocks of a CSV file (or Parquet, with pyarrow) at PATH
+
+    Columns: users id, username, email, password (hash), cash; transactions
+    id, user_id, symbol, shares, price, transaction_date; stocks symbol,
+    company_name, sector. The id column is optional.
+    """
+
+    db.create_all()
+    started = time.perf_counter()
+    user_ids = set()
+    try:
+        count, user_ids = bulk.import_rows(kind, bulk.read_rows(path, chunk_size), chunk_size=chunk_size,
+                                           on_chunk=lambda count: click.echo(f"{count} {kind}...", err=True),
+                                           user_ids=user_ids)
+        click.echo(f"Imported {count} {kind} in {time.perf_counter() - started:.1f} s.")
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    except ValueError as e:
+        db.session.rollback()
+        raise click.ClickException(f"{e} (the rows before this chunk were imported)")
+    finally:
+        # Core inserts skip the session events that reload the stocks list
+        if kind == "stocks":
+            symbol_index.invalidate()
+            fragment_cache.invalidate()
+
+        # Keep the positions in line with the chunks committed, even when a later one failed
+        if kind == "transactions" and positions and user_ids:
+            db.session.rollback()
+            started = time.perf_counter()
+            click.echo(f"Rebuilt {bulk.rebuild_positions(user_ids)} positions of {len(user_ids)} users "
+                       f"in {time.perf_counter() - started:.1f} s.")
+
+
+@commands.cli.command("export-data")
+@click.argument("kind", type=click.Choice(list(bulk.KINDS)))
+@click.argument("path", type=click.Path(dir_okay=False, writable=True))
+@click.option("--chunk-size", default=bulk.CHUNK_SIZE, show_default=True, help="Rows read and written at a time.")
+def export_data(kind, path, chunk_size):
+    """Write every user, transaction or stock to a CSV file (or Parquet, with pyarrow) at PATH, in the columns of import-data"""
+
+    started = time.perf_counter()
+    try:
+        writer = bulk.RowWriter(path, [name for name, type_, column in bulk.KINDS[kind][1]])
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    try:
+        count = bulk.export_rows(kind, writer, chunk_size=chunk_size)
+    finally:
+        writer.close()
+    click.echo(f"Exported {count} {kind} in {time.perf_counter() - started:.1f} s.")
+
+
+# Indexes dropped from the models, with their columns: (user_id, stocks_symbol) is the prefix of
+# (user_id, stocks_symbol, transaction_date)
+DROPPED_INDEXES = {
+    "transaction": [("ix_transaction_user_id_stocks_symbol", ("user_id", "stocks_symbol"))],
+}
+
+
+@commands.cli.command("init-db")
+def init_db():
+    """Create any missing tables and indexes, and drop the indexes the models no longer have"""
+
+    db.create_all()
+
+    # create_all() skips the indexes of tables that already exist
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=db.engine, checkfirst=True)
+
+    # Drop through a copy of the table, so the models don't get the index back
+    for name, indexes in DROPPED_INDEXES.items():
+        table = db.metadata.tables[name].to_metadata(db.MetaData())
+        for index_name, columns in indexes:
+            db.Index(index_name, *(table.c[column] for column in columns)).drop(bind=db.engine, checkfirst=True)
+    click.echo("Database is up to date.")
+
+
+@commands.cli.command("record-ticks")
+@click.argument("file", type=click.File("w"))
+@click.argument("symbols", nargs=-1)
+@click.option("--count", default=60, show_default=True, help="Number of quotes of every symbol.")
+@click.option("--interval", default=1.0, show_default=True, help="Seconds between quotes.")
+def record_ticks(file, symbols, count, interval):
+    """Record the quotes of SYMBOLS (default: every held and listed stock) into FILE for MARKET_DATA=replay"""
+
+    market_data = helpers.market_data
+    symbols = sorted(set(symbol.upper() for symbol in symbols or polled_symbols()))
+    writer = csv.writer(file)
+    writer.writerow(["time", "symbol", "price", "name"])
+    started = time.time()
+    for i in range(count):
+        if isinstance(market_data, RandomWalkProvider):
+            # Simulated prices don't need to wait for time to pass
+            seconds = started + i * interval
+            tick = int(i * interval * market_data.tick_rate)
+            quotes = {symbol: {"price": market_data.price(symbol, tick), "name": market_data.names.get(symbol, symbol)}
+                      for symbol in symbols}
+        else:
+            time.sleep(max(0.0, started + i * interval - time.time()))
+            seconds = time.time()
+            quotes = market_data.quote_many(symbols)
+
+        for symbol, quote_ in quotes.items():
+            writer.writerow([f"{seconds:.3f}", symbol, quote_["price"], quote_["name"]])
+    click.echo(f"Recorded {count} quotes of {len(symbols)} symbols.")
+
+
+@commands.cli.command("sweep-sessions")
+def sweep_sessions():
+    """Delete the expired sessions from the database"""
+    if not isinstance(current_app.session_interface, DatabaseSessionInterface):
+        raise click.ClickException("sessions aren't kept in the database")
+    click.echo(f"Deleted {current_app.session_interface.sweep()} expired sessions.")
+
+
+def parameter(value):
+    """Parse a strategy parameter as a number when it is one"""
+    for type_ in (int, float):
+        try:
+            return type_(value)
+        except ValueError:
+            pass
+    return value
+
+
+@commands.cli.command("backtest")
+@click.argument("strategy")
+@click.argument("symbols", nargs=-1)
+@click.option("--start", type=click.DateTime(["%Y-%m-%d"]), help="First day of stored prices (default: a year ago).")
+@click.option("--end", type=click.DateTime(["%Y-%m-%d"]), help="Last day of stored prices (default: today).")
+@click.option("--simulate", default=0, help="Number of days of simulated prices to use instead of the stored ones.")
+@click.option("--seed", default=0, show_default=True, help="Seed of the simulated prices.")
+@click.option("--cash", default=10000.0, show_default=True, help="Starting cash.")
+@click.option("--param", "params", multiple=True, help="Parameter of the strategy, e.g. --param short=20.")
+@click.option("--sweep", "sweeps", multiple=True, help="Values of a parameter to try, e.g. --sweep short=10,20,50.")
+@click.option("--processes", type=int, help="Number of processes of a sweep (default: one per CPU).")
+@click.option("--save", help="Database URI to write the trades of the backtest to, e.g. sqlite:///backtest.db.")
+@click.option("--overwrite", is_flag=True, help="Replace the users and transactions already in the --save database.")
+def backtest(strategy, symbols, start, end, simulate, seed, cash, params, sweeps, processes, save, overwrite):
+    """Backtest STRATEGY on SYMBOLS (default: every listed stock) with the trading rules of the app"""
+    import backtest as engine
+
+    if strategy not in engine.STRATEGIES:
+        raise click.BadParameter(f"expected one of {', '.join(engine.STRATEGIES)}", param_hint="STRATEGY")
+    symbols = [symbol.upper() for symbol in symbols] or [stock["symbol"] for stock in symbol_index]
+
+    # Prices from the price table (see flask import-prices), or simulated
+    if simulate:
+        dates = engine.business_days(date.today(), simulate)
+        prices = engine.simulate_prices(len(symbols), simulate, seed=seed)
+    else:
+        end = end.date() if end else date.today()
+        start = start.date() if start else end - timedelta(days=365)
+        dates, prices = engine.load_prices(symbols, start, end)
+    if not len(dates):
+        raise click.ClickException("no prices to backtest on")
+
+    fixed = dict(param.split("=", 1) for param in params)
+    fixed = {name: parameter(value) for name, value in fixed.items()}
+
+    started = time.perf_counter()
+    if sweeps:
+        names = [sweep.split("=", 1)[0] for sweep in sweeps]
+        values = [[parameter(value) for value in sweep.split("=", 1)[1].split(",")] for sweep in sweeps]
+        grid = [{**fixed, **dict(zip(names, combination))} for combination in itertools.product(*values)]
+        summaries = engine.sweep(engine.STRATEGIES[strategy], grid, prices, cash=cash, processes=processes)
+        click.echo(f"Ran {len(grid)} backtests of {len(dates)} days and {len(symbols)} stocks "
+                   f"in {time.perf_counter() - started:.2f} s")
+
+        # Best Sharpe ratio first
+        ranked = sorted(zip(grid, summaries), key=lambda pair: pair[1]["sharpe"] or float("-inf"), reverse=True)
+        for params_, summary in ranked:
+            click.echo(f"{params_}: return {summary['return']:+.2%}, sharpe {summary['sharpe'] or 0:.2f}, "
+                       f"max drawdown {summary['max_drawdown']:.2%}, {summary['trades']} trades")
+        return
+
+    result = engine.run(lambda day, history, portfolio: engine.STRATEGIES[strategy](day, history, portfolio, **fixed),
+                        prices, cash=cash)
+    click.echo(f"Ran {len(dates)} days of {len(symbols)} stocks in {time.perf_counter() - started:.2f} s")
+    for name, value in engine.summary(result, cash).items():
+        click.echo(f"{name}: {value}")
+
+    if save:
+        # Never write over the accounts of the application
+        try:
+            engine.save(result, symbols, dates, save, starting_cash=cash, overwrite=overwrite,
+                        protected=[current_app.config["SQLALCHEMY_DATABASE_URI"], db.engine.url])
+        except ValueError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Saved {len(result.trades)} trades to {save}.")
@@ -0,0 +1,103 @@
+import os
+import sqlite3
+
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.pool import QueuePool
+
+
+def set_sqlite_pragmas(engine, pragmas):
+    """Let readers and writers of different workers share the SQLite database of engine"""
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, connection_record):
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+
+class Database(SQLAlchemy):
+    """SQLAlchemy running the sqlite_pragmas of the engine options of every app on its new connections"""
+
+    def create_engine(self, sa_url, engine_opts):
+        pragmas = engine_opts.pop("sqlite_pragmas", None)
+        engine = super().create_engine(sa_url, engine_opts)
+        if pragmas:
+            set_sqlite_pragmas(engine, pragmas)
+        return engine
+
+
+# Bound to an application by create_app(), so models can be imported without one
+db = Database()
+
+
+# How SQLite, PostgreSQL and MySQL say a table doesn't exist
+MISSING_TABLE_MESSAGES = ("no such table", "does not exist", "doesn't exist")
+
+
+def rows_or_none_before_init(query):
+    """Return the rows of query, or none if its table doesn't exist until init-db.
+
+    Any other error, e.g. a locked database, is raised, so callers don't
+    mistake it for an empty table.
+    """
+    try:
+        return query.all()
+    except (OperationalError, ProgrammingError) as e:
+        if not any(message in str(e.orig).lower() for message in MISSING_TABLE_MESSAGES):
+            raise
+        db.session.rollback()
+        return list()
+
+
+def same_database(uri, other):
+    """Check whether the SQLAlchemy URIs uri and other point at the same database"""
+    url, other = make_url(str(uri)), make_url(str(other))
+    if url.get_backend_name() != other.get_backend_name():
+        return False
+
+    # Relative SQLite paths are relative to the working directory, and in-memory databases are never shared
+    if url.get_backend_name() == "sqlite":
+        if url.database in (None, "", ":memory:") or other.database in (None, "", ":memory:"):
+            return False
+        return os.path.realpath(url.database) == os.path.realpath(other.database)
+    return (url.host, url.port, url.database) == (other.host, other.port, other.database)
+
+
+def engine_options(config):
+    """Return the create_engine() options for the connection pool of the database of config, an app.config"""
+    uri = config["SQLALCHEMY_DATABASE_URI"]
+    options = {
+        "pool_size": int(config["DB_POOL_SIZE"]),
+        "max_overflow": int(config["DB_MAX_OVERFLOW"]),
+        "pool_timeout": float(config["DB_POOL_TIMEOUT"]),
+    }
+
+    if make_url(uri).get_backend_name() == "sqlite":
+        # SQLAlchemy opens a new SQLite connection per checkout unless told to pool them,
+        # and pooled connections are handed to whichever thread serves the request
+        options["poolclass"] = QueuePool
+        options["connect_args"] = {"check_same_thread": False}
+        options["sqlite_pragmas"] = sqlite_pragmas(config)
+    else:
+        # Replace server connections dropped while sitting in the pool
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = int(config["DB_POOL_RECYCLE"])
+
+    return options
+
+
+def sqlite_pragmas(config):
+    """Return the pragmas run on every new SQLite connection, busy_timeout first so the others wait for locks too"""
+    return {
+        "busy_timeout": int(config["SQLITE_BUSY_TIMEOUT"]),
+        "journal_mode": config["SQLITE_JOURNAL_MODE"],
+        "synchronous": config["SQLITE_SYNCHRONOUS"],
+        "cache_size": int(config["SQLITE_CACHE_SIZE"]),
+        "mmap_size": int(config["SQLITE_MMAP_SIZE"]),
+    }
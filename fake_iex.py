@@ -0,0 +1,70 @@
+import json
+import threading
+import time
+import urllib.parse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeIEX(ThreadingHTTPServer):
+    """Local HTTP server answering IEX batch quote requests after latency seconds, for tests and benchmarks.
+
+    Records the symbols of every batch, and the most batches answered at
+    once. The symbol UNKNOWN has no quote, like a symbol IEX doesn't list.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency=0.0):
+        super().__init__(("127.0.0.1", 0), FakeIEXHandler)
+        self.latency = latency
+        self.batches = list()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.url = f"http://127.0.0.1:{self.server_port}/stable"
+
+    @property
+    def requests(self):
+        return len(self.batches)
+
+    def start(self):
+        """Serve from a thread of its own, returning the server"""
+        threading.Thread(target=self.serve_forever, name="fake-iex", daemon=True).start()
+        return self
+
+    def close(self):
+        """Stop serving and close the socket"""
+        self.shutdown()
+        self.server_close()
+
+
+class FakeIEXHandler(BaseHTTPRequestHandler):
+    # Keep connections alive, as IEX does, without waiting to send the body after the headers
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if not url.path.endswith("/stock/market/batch"):
+            self.send_error(404)
+            return
+        symbols = urllib.parse.parse_qs(url.query).get("symbols", [""])[0].split(",")
+        with self.server.lock:
+            self.server.batches.append(symbols)
+            self.server.in_flight += 1
+            self.server.max_in_flight = max(self.server.max_in_flight, self.server.in_flight)
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            self.server.in_flight -= 1
+
+        body = json.dumps({symbol: {"quote": {"companyName": f"{symbol} Inc", "latestPrice": 100.0, "symbol": symbol}}
+                           for symbol in symbols if symbol and symbol != "UNKNOWN"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
@@ -1,9 +1,7 @@
-import os
-import requests
-import urllib.parse
-
-from flask import redirect, render_template, request, session
+from datetime import date, datetime
+from flask import current_app, redirect, render_template, request, session
 from functools import wraps
+from werkzeug.local import LocalProxy
 
 
 def apology(message, code=400):
@@ -35,30 +33,76 @@ def login_required(f):
     return decorated_function
 
 
+def app_extension(name):
+    """Return a proxy to the extension name of the current app, e.g. for a module to import before any app exists"""
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+# Quotes shared by the requests of the current app, and where they come from (created by create_app())
+quote_cache = app_extension("quote_cache")
+market_data = app_extension("market_data")
+
+# Stocks list searched by the autocomplete and used to check symbols before contacting IEX
+symbol_index = app_extension("symbol_index")
+
+# Rendered pages of the stocks list, dropped whenever it changes
+fragment_cache = app_extension("fragment_cache")
+
+
 def lookup(symbol):
     """Look up quote for symbol."""
+    return lookup_many([symbol]).get(symbol.upper())
+
+
+def lookup_many(symbols):
+    """Look up quotes for several symbols, returning a dict keyed by symbol."""
+
+    # Remove duplicates while keeping the order of the symbols
+    symbols = list(dict.fromkeys(symbol.upper() for symbol in symbols if symbol))
+
+    return quote_cache.get_many(symbols, market_data.quote_many)
 
-    # Contact API
-    try:
-        api_key = os.environ.get("API_KEY")
-        url = f"https://cloud.iexapis.com/stable/stock/{urllib.parse.quote_plus(symbol)}/quote?token={api_key}"
-        response = requests.get(url)
-        response.raise_for_status()
-    except requests.RequestException:
-        return None
-
-    # Parse response
-    try:
-        quote = response.json()
-        return {
-            "name": quote["companyName"],
-            "price": float(quote["latestPrice"]),
-            "symbol": quote["symbol"]
-        }
-    except (KeyError, TypeError, ValueError):
-        return None
+
+def set_market_data(provider):
+    """Get the quotes of the current app from provider from now on, e.g. a ReplayProvider or a RandomWalkProvider"""
+    current_app.extensions["market_data"] = provider
+    quote_cache.clear()
+    return provider
+
+
+def history_filters(args):
+    """Parse the filters of the transaction history from the query string args.
+
+    Raise ValueError if any of them is invalid.
+    """
+    filters = {
+        "symbol": args.get("symbol", "").strip().upper() or None,
+        "side": args.get("side") or None,
+        "start": None,
+        "end": None,
+        "cursor": None
+    }
+
+    if filters["side"] not in (None, "buy", "sell"):
+        raise ValueError("side must be buy or sell")
+    if args.get("start"):
+        filters["start"] = date.fromisoformat(args["start"])
+    if args.get("end"):
+        filters["end"] = date.fromisoformat(args["end"])
+
+    # The cursor is the date and id of the last transaction already shown
+    if args.get("cursor"):
+        transaction_date, id_ = args["cursor"].rsplit("_", 1)
+        filters["cursor"] = (datetime.fromisoformat(transaction_date), int(id_))
+
+    return filters
 
 
 def usd(value):
     """Format value as USD."""
     return f"${value:,.2f}"
+
+
+def percent(value):
+    """Format value as a percentage, or a dash if it's unknown."""
+    return "-" if value is None else f"{value:+.2%}"
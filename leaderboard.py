@@ -0,0 +1,189 @@
+import heapq
+import threading
+import time
+
+from periodic import PeriodicWorker
+
+
+class _Account:
+    """Cash, shares and value of one user, as known to the leaderboard"""
+    __slots__ = ("username", "cash", "invested", "shares", "value")
+
+    def __init__(self):
+        self.username = None
+        self.cash = 0.0
+        self.invested = 0.0
+        self.shares = dict()
+        self.value = 0.0
+
+    @property
+    def return_(self):
+        """Return of the account since it started, without deposits or withdrawals"""
+        starting_cash = self.cash + self.invested
+        return self.value / starting_cash - 1 if starting_cash > 0 else None
+
+
+class Leaderboard(PeriodicWorker):
+    """Background thread ranking the users by portfolio value and return, with stats of the whole market.
+
+    trades(after_id, limit) returns up to limit (id, user_id, symbol,
+    shares, price) transaction rows after after_id in id order, so every
+    refresh only reads the trades made since the last one, whichever
+    process made them. accounts(user_ids) returns (id, username, cash)
+    rows and sectors() a dict of the sector of every listed symbol.
+
+    New quotes are kept until the next refresh, which applies the last
+    price of every symbol to the users holding it. The top lists are then
+    rebuilt once, so serving them takes the same time for any number of
+    users.
+    """
+
+    # Transactions read per query, so catching up on a long history takes constant memory
+    BATCH_SIZE = 5000
+
+    def __init__(self, trades, accounts, sectors, size=10, interval=30.0):
+        super().__init__("leaderboard", interval)
+        self.trades = trades
+        self.accounts = accounts
+        self.sectors = sectors
+        self.size = size
+        self.refreshes = 0
+        self._last_id = 0
+        self._users = dict()
+        self._holders = dict()
+        self._held = dict()
+        self._volume = dict()
+        self._prices = dict()
+        self._pending = dict()
+        self._top = None
+        self._lock = threading.Lock()
+        self._refreshing = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def on_quotes(self, quotes):
+        """Keep the last price of every symbol for the next refresh, which applies them all at once"""
+        prices = {symbol.upper(): quote["price"] for symbol, quote in quotes.items()}
+        with self._lock:
+            self._pending.update(prices)
+
+    def current(self):
+        """Return the top lists, refreshing them first if they were never built"""
+        if self._top is None:
+            self.refresh()
+        return self._top
+
+    def refresh(self):
+        """Apply the new trades and prices, then rebuild the top lists if anything changed"""
+        with self._lock:
+            pending, self._pending = self._pending, dict()
+
+        # Only one refresh at a time updates the accounts
+        with self._refreshing:
+            changed = self._apply_trades()
+            changed |= self._apply_prices(pending)
+            if changed or self._top is None:
+                self._top = self._rank()
+            self.refreshes += 1
+        return self._top
+
+    def _apply_trades(self):
+        """Add the trades made since the last refresh, returning whether there were any"""
+        touched = set()
+        while True:
+            rows = self.trades(self._last_id, self.BATCH_SIZE)
+            for id_, user_id, symbol, shares, price in rows:
+                symbol = symbol.upper()
+                account = self._users.get(user_id)
+                if account is None:
+                    account = self._users[user_id] = _Account()
+                account.invested += shares * price
+                held = account.shares.get(symbol, 0) + shares
+                if held:
+                    account.shares[symbol] = held
+                    self._holders.setdefault(symbol, dict())[user_id] = held
+                else:
+                    account.shares.pop(symbol, None)
+                    holders = self._holders.get(symbol, dict())
+                    holders.pop(user_id, None)
+                    if not holders:
+                        self._holders.pop(symbol, None)
+                self._held[symbol] = self._held.get(symbol, 0) + shares
+
+                volume = self._volume.setdefault(symbol, [0, 0.0])
+                volume[0] += abs(shares)
+                volume[1] += abs(shares * price)
+
+                # Value stocks at their last trade price until a quote comes in
+                self._prices.setdefault(symbol, price)
+                self._last_id = id_
+                touched.add(user_id)
+            if len(rows) < self.BATCH_SIZE:
+                break
+
+        # Read the cash of the users who traded, then value their accounts again
+        touched = list(touched)
+        for i in range(0, len(touched), 500):
+            for user_id, username, cash in self.accounts(touched[i:i + 500]):
+                account = self._users[user_id]
+                account.username, account.cash = username, cash
+        for user_id in touched:
+            account = self._users[user_id]
+            account.value = account.cash + sum(shares * self._prices[symbol] for symbol, shares in account.shares.items())
+        return bool(touched)
+
+    def _apply_prices(self, prices):
+        """Move the value of the users holding every stock whose price changed, returning whether any did"""
+        changed = False
+        for symbol, price in prices.items():
+            previous = self._prices.get(symbol)
+            self._prices[symbol] = price
+            if previous is None or previous == price:
+                continue
+            change = price - previous
+            for user_id, shares in self._holders.get(symbol, dict()).items():
+                self._users[user_id].value += shares * change
+                changed = True
+        return changed
+
+    def _rank(self):
+        """Build the top lists from the accounts and stocks"""
+        accounts = [account for account in self._users.values() if account.username is not None]
+        ranked = [account for account in accounts if account.return_ is not None]
+        sectors = self.sectors()
+
+        # Market value of the stocks held, by sector
+        exposure, market_value = dict(), 0.0
+        for symbol, shares in self._held.items():
+            if shares > 0:
+                value = shares * self._prices[symbol]
+                sector = sectors.get(symbol, "Unlisted")
+                exposure[sector] = exposure.get(sector, 0.0) + value
+                market_value += value
+
+        def user(account):
+            return {"username": account.username, "value": account.value, "return": account.return_}
+
+        return {
+            "updated": time.time(),
+            "users": len(accounts),
+            "market_value": market_value,
+            "value": [user(account) for account in heapq.nlargest(self.size, accounts, key=lambda account: account.value)],
+            "return": [user(account) for account in heapq.nlargest(self.size, ranked, key=lambda account: account.return_)],
+            "most_held": [
+                {"symbol": symbol, "holders": len(holders), "shares": self._held[symbol],
+                 "value": self._held[symbol] * self._prices[symbol]}
+                for symbol, holders in heapq.nlargest(self.size, self._holders.items(),
+                                                      key=lambda item: (len(item[1]), self._held[item[0]]))
+            ],
+            "volume": [
+                {"symbol": symbol, "shares": shares, "amount": amount}
+                for symbol, (shares, amount) in heapq.nlargest(self.size, self._volume.items(),
+                                                               key=lambda item: item[1][1])
+            ],
+            "sectors": [
+                {"sector": sector, "value": value, "weight": value / market_value}
+                for sector, value in sorted(exposure.items(), key=lambda item: -item[1])
+            ]
+        }
@@ -0,0 +1,107 @@
+from flask import Blueprint, current_app, render_template, request
+from markupsafe import Markup
+
+from database import db, rows_or_none_before_init
+from helpers import apology, fragment_cache, login_required, lookup, symbol_index, usd
+from models import User, Transaction, Position, Stocks, Order
+
+
+market = Blueprint("market", __name__)
+
+
+def listed_stocks():
+    """Return the symbol, company name and sector of every listed stock"""
+    return rows_or_none_before_init(db.session.query(Stocks.symbol, Stocks.company_name, Stocks.sector))
+
+
+def polled_symbols():
+    """Return the symbols of every held stock, of the stocks list and of the resting orders"""
+    held = db.session.query(Position.stocks_symbol).filter(Position.shares > 0).distinct()
+    listed = db.session.query(Stocks.symbol)
+    ordered = db.session.query(Order.stocks_symbol).filter_by(status="open")
+    return [symbol for symbol, in held.union(listed, ordered)]
+
+
+def trades_since(after_id, limit):
+    """Return the id, user, symbol, shares and price of up to limit transactions after after_id, in id order"""
+    return rows_or_none_before_init(
+        db.session.query(Transaction.id, Transaction.user_id, Transaction.stocks_symbol, Transaction.shares,
+                         db.cast(Transaction.price, db.Float)).
+        filter(Transaction.id > after_id).order_by(Transaction.id).limit(limit))
+
+
+def accounts(user_ids):
+    """Return the id, username and cash of the users"""
+    return db.session.query(User.id, User.username, db.cast(User.cash, db.Float)).filter(User.id.in_(user_ids)).all()
+
+
+def stock_sectors():
+    """Return the sector of every listed symbol"""
+    return {stock["symbol"]: stock["sector"] for stock in symbol_index}
+
+
+@market.route("/quote", methods=["GET", "POST"])
+@login_required
+def quote():
+    """Get stock quote."""
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        symbol = request.form.get("symbol").upper()
+
+        # Ensure symbol was entered
+        if not symbol:
+            return apology("missing symbol", 400)
+
+        # Get the info. of the symbol and check if symbol is valid
+        quote_ = lookup(symbol) if symbol_index.is_valid(symbol) else None
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        # Render the html with the name of the company and the price of the stocks
+        return render_template("quoted.html", name=quote_["name"], symbol=quote_["symbol"], price=usd(quote_["price"]))
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("quote.html")
+
+
+@market.route("/quote/<stocks_symbol>")
+@login_required
+def quote_stocks(stocks_symbol):
+    quote_ = lookup(stocks_symbol) if symbol_index.is_valid(stocks_symbol) else None
+    if quote_ is None:
+        return apology("invalid symbol", 400)
+
+    # Render the html with the name of the company and the price of the stocks
+    return render_template("quoted.html", name=quote_["name"], symbol=quote_["symbol"], price=usd(quote_["price"]))
+
+
+@market.route("/stocks_list")
+@login_required
+def stocks_list():
+    page = request.args.get('page', 1, type=int)
+    q = request.args.get("q", "").strip()
+    sector = request.args.get("sector", "")
+
+    # Search the stocks in memory, or page through them
+    if q:
+        return render_template("stocks_list.html", results=symbol_index.search(q, sector=sector, limit=50),
+                               q=q, sector=sector, sectors=symbol_index.sectors())
+
+    # Render a page of the stocks list once, until the stocks list changes
+    def render_page():
+        query = Stocks.query.filter_by(sector=sector) if sector else Stocks.query
+        stocks = query.paginate(page=page, per_page=15)
+        return Markup(render_template("stocks_table.html", rows=stocks.items, pages=stocks, sector=sector))
+
+    table = fragment_cache.get(("stocks_list", sector, page), render_page)
+    return render_template("stocks_list.html", table=table, q=q, sector=sector, sectors=symbol_index.sectors())
+
+
+@market.route("/leaderboard")
+@login_required
+def leaderboard():
+    """Show the top users by portfolio value and return, and the most held and traded stocks"""
+    return render_template("leaderboard.html", top=current_app.extensions["leaderboard"].current())
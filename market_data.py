@@ -0,0 +1,193 @@
+import csv
+import math
+import random
+import re
+import threading
+import time
+import zlib
+
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+
+def range_days(range_):
+    """Return the number of days of an IEX chart range, e.g. 5d, 1m, 1y, ytd"""
+    if range_ == "ytd":
+        return (date.today() - date(date.today().year, 1, 1)).days + 1
+    match = re.fullmatch(r"(\d+)([dmy])", range_)
+    if not match:
+        raise ValueError(f"unknown range {range_}")
+    return int(match.group(1)) * {"d": 1, "m": 31, "y": 366}[match.group(2)]
+
+
+def daily_bars(symbol, closes):
+    """Return chart rows, oldest first, from a list of (date, close) pairs"""
+    return [{"stocks_symbol": symbol, "date": day, "open": close, "high": close, "low": close,
+             "close": close, "volume": None} for day, close in closes]
+
+
+class ReplayProvider:
+    """Quotes replayed from a file of recorded or synthetic price ticks.
+
+    The file is a CSV with columns time, symbol, price and optionally name,
+    where time is in seconds or ISO format. The first tick is replayed when
+    the provider is created and the next ones as time goes by, speed times
+    faster than recorded; with loop, the ticks start over once they run out.
+    The quote of a symbol is always its last tick replayed so far.
+    """
+
+    def __init__(self, path, speed=1.0, loop=True, clock=time.monotonic):
+        self.speed = speed
+        self.loop = loop
+        self.clock = clock
+        self._times = dict()
+        self._prices = dict()
+        self._names = dict()
+
+        ticks = list()
+        with open(path, newline="") as file:
+            for row in csv.DictReader(file):
+                symbol = row["symbol"].upper()
+                ticks.append((self._seconds(row["time"]), symbol, float(row["price"])))
+                if row.get("name"):
+                    self._names[symbol] = row["name"]
+        if not ticks:
+            raise ValueError(f"no ticks in {path}")
+
+        # Keep the times and prices of every symbol in order for bisection
+        ticks.sort()
+        self.first, self.last = ticks[0][0], ticks[-1][0]
+        for seconds, symbol, price in ticks:
+            self._times.setdefault(symbol, list()).append(seconds)
+            self._prices.setdefault(symbol, list()).append(price)
+        self.started = clock()
+
+    @staticmethod
+    def _seconds(value):
+        try:
+            return float(value)
+        except ValueError:
+            return datetime.fromisoformat(value).timestamp()
+
+    def now(self):
+        """Return the time of the ticks being replayed"""
+        elapsed = (self.clock() - self.started) * self.speed
+        duration = self.last - self.first
+        if self.loop and duration > 0:
+            elapsed %= duration
+        return self.first + elapsed
+
+    def price(self, symbol, at=None):
+        """Return the last price of symbol at time at (default: now), None before its first tick"""
+        times = self._times.get(symbol.upper())
+        if times is None:
+            return None
+        i = bisect_right(times, self.now() if at is None else at)
+        return self._prices[symbol.upper()][i - 1] if i else None
+
+    def quote_many(self, symbols):
+        """Return quotes for symbols, leaving out the symbols without ticks"""
+        quotes = dict()
+        now = self.now()
+        for symbol in symbols:
+            price = self.price(symbol, now)
+            if price is not None:
+                quotes[symbol] = {"name": self._names.get(symbol.upper(), symbol.upper()), "price": price,
+                                  "symbol": symbol.upper()}
+        return quotes
+
+    def chart(self, symbol, range_="1y"):
+        """Return the last price of every day with ticks in the last range_ of the file"""
+        times = self._times.get(symbol.upper(), list())
+        first_day = date.fromtimestamp(self.last) - timedelta(days=range_days(range_))
+        closes = dict()
+        for seconds, price in zip(times, self._prices.get(symbol.upper(), list())):
+            day = date.fromtimestamp(seconds)
+            if day > first_day:
+                closes[day] = price
+        return daily_bars(symbol.upper(), sorted(closes.items()))
+
+
+class RandomWalkProvider:
+    """Simulated quotes following a geometric random walk.
+
+    Every symbol ticks tick_rate times per second, each tick moving its
+    price by a normally distributed return of standard deviation
+    volatility. The n ticks since a symbol was last priced add up to a
+    single return of standard deviation volatility * sqrt(n), drawn from a
+    generator seeded by the symbol and the tick, so pricing a symbol takes
+    the same time however long ago it was last asked for, and runs asking
+    for the same ticks are reproducible.
+    """
+
+    def __init__(self, seed=0, tick_rate=1.0, volatility=0.001, names=None, clock=time.monotonic):
+        self.seed = seed
+        self.tick_rate = tick_rate
+        self.volatility = volatility
+        self.names = names or dict()
+        self.clock = clock
+        self.started = clock()
+        self._walks = dict()
+        self._lock = threading.Lock()
+
+    def _random(self, symbol, stream):
+        return random.Random(f"{self.seed}:{stream}:{zlib.crc32(symbol.encode())}")
+
+    def price(self, symbol, tick=None):
+        """Return the price of symbol after tick ticks (default: the ticks so far)"""
+        symbol = symbol.upper()
+        if tick is None:
+            tick = int((self.clock() - self.started) * self.tick_rate)
+
+        with self._lock:
+            # Start the walk of the symbol over when asked for an earlier tick
+            walk = self._walks.get(symbol)
+            if walk is None or walk[0] > tick:
+                walk = [0, round(self._random(symbol, "walk").uniform(10, 500), 2)]
+                self._walks[symbol] = walk
+
+            # Only the last price is kept, so memory doesn't grow with time
+            if walk[0] < tick:
+                steps = tick - walk[0]
+                walk[1] *= math.exp(self._random(symbol, f"tick{tick}").gauss(0, self.volatility * math.sqrt(steps)))
+                walk[0] = tick
+            return round(walk[1], 2)
+
+    def quote_many(self, symbols):
+        """Return a quote for every symbol"""
+        return {symbol: {"name": self.names.get(symbol.upper(), symbol.upper()), "price": self.price(symbol),
+                         "symbol": symbol.upper()} for symbol in symbols}
+
+    def chart(self, symbol, range_="1y"):
+        """Return simulated daily closes over range_ ending at the current price"""
+        days = range_days(range_)
+        rng = self._random(symbol.upper(), "chart")
+        close = self.price(symbol)
+
+        # Walk backwards from today with a daily volatility
+        closes = list()
+        for offset in range(days):
+            closes.append((date.today() - timedelta(days=offset), round(close, 2)))
+            close /= math.exp(rng.gauss(0, 0.02))
+        return daily_bars(symbol.upper(), closes[::-1])
+
+
+def make_provider(name, environ):
+    """Return the market data provider called name, configured from environ (or any dict of settings)"""
+    if name == "iex":
+        # requests is only loaded when quotes come from IEX
+        from quote_client import QuoteClient
+        return QuoteClient(api_key=environ.get("API_KEY") or None,
+                           base_url=environ.get("IEX_BASE_URL", "https://cloud.iexapis.com/stable"),
+                           timeout=(float(environ.get("IEX_CONNECT_TIMEOUT", 3.05)),
+                                    float(environ.get("IEX_READ_TIMEOUT", 10))))
+    if name == "replay":
+        if not environ.get("MARKET_DATA_FILE"):
+            raise RuntimeError("MARKET_DATA_FILE not set")
+        return ReplayProvider(environ["MARKET_DATA_FILE"], speed=float(environ.get("REPLAY_SPEED", 1)),
+                              loop=environ.get("REPLAY_LOOP", "1") == "1")
+    if name == "random_walk":
+        return RandomWalkProvider(seed=int(environ.get("SIMULATOR_SEED", 0)),
+                                  tick_rate=float(environ.get("SIMULATOR_TICK_RATE", 1)),
+                                  volatility=float(environ.get("SIMULATOR_VOLATILITY", 0.001)))
+    raise RuntimeError(f"unknown market data provider {name}")
@@ -0,0 +1,180 @@
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Upper bounds of the buckets of SQL queries per request
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+# Queries slower than this are logged, unless the current app sets its own SLOW_QUERY_SECONDS
+SLOW_QUERY_SECONDS = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+
+class Counter:
+    """Prometheus counter, one value per combination of labels"""
+
+    type = "counter"
+
+    def __init__(self, name, help_, labels=()):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.labels, labels), value) for labels, value in self._values.items()]
+
+
+class Histogram:
+    """Prometheus histogram, counting the observed values below every bucket bound"""
+
+    type = "histogram"
+
+    def __init__(self, name, help_, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self.buckets = buckets
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        samples = list()
+        with self._lock:
+            for labels, counts in self._values.items():
+                for bound, count in zip((*self.buckets, "+Inf"), counts):
+                    samples.append((f"{self.name}_bucket", _labels((*self.labels, "le"), (*labels, bound)), count))
+                samples.append((f"{self.name}_count", _labels(self.labels, labels), counts[-2]))
+                samples.append((f"{self.name}_sum", _labels(self.labels, labels), counts[-1]))
+        return samples
+
+
+class FunctionMetric:
+    """Prometheus gauge, or counter kept elsewhere, read from a callable when scraped"""
+
+    def __init__(self, name, help_, value, type_="gauge"):
+        self.name = name
+        self.help = help_
+        self.value = value
+        self.type = type_
+
+    def samples(self):
+        return [(self.name, "", self.value())]
+
+
+class Registry:
+    """Every metric of the process, rendered in the Prometheus text format.
+
+    Adding a metric under a name already taken replaces it, e.g. when
+    create_app() runs again in the same process.
+    """
+
+    def __init__(self):
+        self.metrics = dict()
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = list()
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_seconds = registry.add(Histogram(
+    "http_request_duration_seconds", "Time to handle a request", ("endpoint", "method", "status")))
+request_queries = registry.add(Histogram(
+    "http_request_sql_queries", "SQL queries run by a request", ("endpoint",), buckets=QUERY_BUCKETS))
+request_query_seconds = registry.add(Histogram(
+    "http_request_sql_duration_seconds", "Time a request spent in SQL queries", ("endpoint",)))
+sql_queries = registry.add(Counter("sql_queries_total", "SQL queries run, in requests or not"))
+sql_seconds = registry.add(Counter("sql_query_duration_seconds_total", "Time spent in SQL queries"))
+upstream_seconds = registry.add(Histogram(
+    "upstream_request_duration_seconds", "Time of the requests to the market data API", ("endpoint",)))
+upstream_errors = registry.add(Counter(
+    "upstream_request_errors_total", "Failed requests to the market data API", ("endpoint",)))
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info.setdefault("query_started", list()).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    seconds = time.perf_counter() - connection.info["query_started"].pop()
+    sql_queries.inc()
+    sql_seconds.inc(amount=seconds)
+    if seconds > (current_app.config["SLOW_QUERY_SECONDS"] if has_app_context() else SLOW_QUERY_SECONDS):
+        logger.warning("slow query (%.3f s): %s", seconds, statement)
+
+    # Add the query to the request running it, if any
+    if has_request_context() and "sql_queries" in g:
+        g.sql_queries += 1
+        g.sql_seconds += seconds
+
+
+def start_request():
+    """Start measuring the current request"""
+    g.request_started = time.perf_counter()
+    g.sql_queries = 0
+    g.sql_seconds = 0.0
+
+
+def end_request(endpoint, method, status):
+    """Record the time and queries of the current request"""
+    if "request_started" not in g:
+        return
+    request_seconds.observe(time.perf_counter() - g.request_started, endpoint, method, status)
+    request_queries.observe(g.sql_queries, endpoint)
+    request_query_seconds.observe(g.sql_seconds, endpoint)
+    # Requests running more queries than this likely look up rows one by one (N+1)
+    if g.sql_queries > current_app.config["REQUEST_QUERIES_WARNING"]:
+        logger.warning("%s ran %d queries", endpoint, g.sql_queries)
+
+
+def observe_upstream(endpoint, seconds, error):
+    """Record a request to the market data API, e.g. as a QuoteClient listener"""
+    upstream_seconds.observe(seconds, endpoint)
+    if error:
+        upstream_errors.inc(endpoint)
@@ -1,5 +1,7 @@
-from datetime import datetime
-from application import db
+from datetime import datetime, time, timedelta, timezone
+from decimal import Decimal
+from zoneinfo import ZoneInfo
+from database import db
 
 
 class User(db.Model):
@@ -19,6 +21,10 @@ class User(db.Model):
 class Transaction(db.Model):
     """Stocks transaction"""
     __tablename__ = 'transaction'
+    __table_args__ = (
+        db.Index('ix_transaction_user_id_transaction_date', 'user_id', 'transaction_date'),
+        db.Index('ix_transaction_user_id_stocks_symbol_transaction_date', 'user_id', 'stocks_symbol', 'transaction_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     stocks_symbol = db.Column(db.String(10), nullable=False)
     shares = db.Column(db.Integer, nullable=False)
@@ -29,6 +35,43 @@ class Transaction(db.Model):
     def __repr__(self):
         return f"Transaction('{self.stocks_symbol}', '{self.shares}', '{self.price}', '{self.transaction_date}')"
 
+    @property
+    def cursor(self):
+        """Position of the transaction in the history, to continue the history after it"""
+        return f"{self.transaction_date.isoformat()}_{self.id}"
+
+    @classmethod
+    def history(cls, user_id, symbol=None, side=None, start=None, end=None, cursor=None, limit=50):
+        """Query the transactions of the user newest first, starting after cursor=(transaction_date, id)"""
+        query = cls.query.filter_by(user_id=user_id)
+
+        # Filter by stocks, buy or sell, and dates (both included)
+        if symbol:
+            query = query.filter_by(stocks_symbol=symbol)
+        if side == "buy":
+            query = query.filter(cls.shares > 0)
+        elif side == "sell":
+            query = query.filter(cls.shares < 0)
+        if start:
+            query = query.filter(cls.transaction_date >= datetime.combine(start, datetime.min.time()))
+        if end:
+            query = query.filter(cls.transaction_date < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+
+        # Seek past the transactions already shown instead of counting them with OFFSET
+        if cursor:
+            transaction_date, id_ = cursor
+            query = query.filter(db.or_(cls.transaction_date < transaction_date,
+                                        db.and_(cls.transaction_date == transaction_date, cls.id < id_)))
+
+        return query.order_by(cls.transaction_date.desc(), cls.id.desc()).limit(limit)
+
+    @classmethod
+    def holdings(cls):
+        """Query the owned shares (only positive) of every user and stock, summed in the database"""
+        shares = db.func.sum(cls.shares)
+        return db.session.query(cls.user_id, cls.stocks_symbol, shares).\
+            group_by(cls.user_id, cls.stocks_symbol).having(shares > 0)
+
 
 class Stocks(db.Model):
     """List of Stocks"""
@@ -39,3 +82,143 @@ class Stocks(db.Model):
 
     def __repr__(self):
         return f"Stocks('{self.symbol}', '{self.company_name}', '{self.sector}')"
+
+
+class Position(db.Model):
+    """Net shares and cost basis of a stock owned by a user"""
+    __tablename__ = 'position'
+    __table_args__ = (db.UniqueConstraint('user_id', 'stocks_symbol'),)
+    id = db.Column(db.Integer, primary_key=True)
+    stocks_symbol = db.Column(db.String(10), nullable=False)
+    shares = db.Column(db.Integer, nullable=False, default=0)
+    cost_basis = db.Column(db.Numeric, nullable=False, default=0)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    def __repr__(self):
+        return f"Position('{self.stocks_symbol}', '{self.shares}', '{self.cost_basis}')"
+
+    def apply(self, shares, price):
+        """Add a trade of shares (negative when selling) at price to the position"""
+        if shares > 0:
+            self.cost_basis = Decimal(self.cost_basis or 0) + shares * Decimal(str(price))
+        elif self.shares:
+            # Selling keeps the average cost of the remaining shares
+            self.cost_basis = Decimal(self.cost_basis or 0) * (self.shares + shares) / self.shares
+        self.shares = (self.shares or 0) + shares
+
+    @classmethod
+    def record(cls, transaction):
+        """Update the position of the user with transaction (caller commits)"""
+        position = cls.query.filter_by(user_id=transaction.user_id, stocks_symbol=transaction.stocks_symbol).first()
+        if position is None:
+            position = cls(user_id=transaction.user_id, stocks_symbol=transaction.stocks_symbol, shares=0, cost_basis=0)
+            db.session.add(position)
+        position.apply(transaction.shares, transaction.price)
+        return position
+
+    @classmethod
+    def replay(cls):
+        """Recompute every position from the transaction table, keyed by (user_id, stocks_symbol)"""
+        positions = dict()
+        transactions = Transaction.query.order_by(Transaction.transaction_date, Transaction.id).yield_per(1000)
+        for transaction in transactions:
+            key = (transaction.user_id, transaction.stocks_symbol)
+            if key not in positions:
+                positions[key] = cls(user_id=transaction.user_id, stocks_symbol=transaction.stocks_symbol,
+                                     shares=0, cost_basis=0)
+            positions[key].apply(transaction.shares, transaction.price)
+        return positions
+
+
+class Price(db.Model):
+    """Daily prices of a stock"""
+    __tablename__ = 'price'
+    stocks_symbol = db.Column(db.String(10), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    open = db.Column(db.Float)
+    high = db.Column(db.Float)
+    low = db.Column(db.Float)
+    close = db.Column(db.Float, nullable=False)
+    volume = db.Column(db.Integer)
+
+    def __repr__(self):
+        return f"Price('{self.stocks_symbol}', '{self.date}', '{self.close}')"
+
+    @classmethod
+    def store(cls, rows):
+        """Insert or replace the daily prices in rows, dicts keyed by column name (caller commits)"""
+        if not rows:
+            return
+
+        # Remove the days already stored, one range per symbol
+        dates = dict()
+        for row in rows:
+            dates.setdefault(row["stocks_symbol"], []).append(row["date"])
+        for symbol, days in dates.items():
+            cls.query.filter(cls.stocks_symbol == symbol, cls.date.between(min(days), max(days))).\
+                delete(synchronize_session=False)
+
+        db.session.execute(cls.__table__.insert(), rows)
+
+
+class Order(db.Model):
+    """Limit, stop or stop-limit order resting until its price is reached"""
+    __tablename__ = 'order'
+    __table_args__ = (
+        db.Index('ix_order_status_stocks_symbol', 'status', 'stocks_symbol'),
+        db.Index('ix_order_user_id_status', 'user_id', 'status'),
+    )
+
+    TYPES = ('limit', 'stop', 'stop_limit')
+
+    # Day orders expire at the close of the New York market, 4 pm local time whether EST or EDT
+    MARKET_TIMEZONE = ZoneInfo('America/New_York')
+    MARKET_CLOSE = time(16, 0)
+
+    id = db.Column(db.Integer, primary_key=True)
+    stocks_symbol = db.Column(db.String(10), nullable=False)
+    side = db.Column(db.String(4), nullable=False)
+    type = db.Column(db.String(10), nullable=False)
+    shares = db.Column(db.Integer, nullable=False)
+    limit_price = db.Column(db.Numeric)
+    stop_price = db.Column(db.Numeric)
+    time_in_force = db.Column(db.String(3), nullable=False, default='gtc')
+    status = db.Column(db.String(9), nullable=False, default='open')
+    triggered = db.Column(db.Boolean, nullable=False, default=False)
+    created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    expires = db.Column(db.DateTime)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transaction.id'))
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+
+    def __repr__(self):
+        return f"Order('{self.side}', '{self.type}', '{self.stocks_symbol}', '{self.shares}', '{self.status}')"
+
+    @classmethod
+    def day_end(cls, now):
+        """Return when a day order placed at now (naive UTC) expires, in naive UTC"""
+        local = now.replace(tzinfo=timezone.utc).astimezone(cls.MARKET_TIMEZONE)
+        close = datetime.combine(local.date(), cls.MARKET_CLOSE, tzinfo=cls.MARKET_TIMEZONE)
+        if local >= close:
+            # Combine again rather than add 24 hours, so the close stays at 4 pm across DST changes
+            close = datetime.combine(local.date() + timedelta(days=1), cls.MARKET_CLOSE, tzinfo=cls.MARKET_TIMEZONE)
+        return close.astimezone(timezone.utc).replace(tzinfo=None)
+
+    @classmethod
+    def expire(cls, now):
+        """Expire the open orders past their expiry and return their ids (caller commits)"""
+        query = cls.query.filter(cls.status == 'open', cls.expires <= now)
+        expired = [id_ for id_, in query.with_entities(cls.id)]
+        if expired:
+            query.update({"status": "expired"}, synchronize_session=False)
+        return expired
+
+
+class StoredSession(db.Model):
+    """Session data of a user, keyed by the hash of the session cookie"""
+    __tablename__ = 'session'
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    expires = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"StoredSession('{self.id}', '{self.expires}')"
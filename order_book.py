@@ -0,0 +1,159 @@
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+
+class OrderBook:
+    """Resting orders of every symbol, sorted by the price that sets them off.
+
+    Each symbol has a min-heap of the orders set off when the price rises
+    to their trigger (sell limits, buy stops) and a max-heap of those set
+    off when it falls to it (buy limits, sell stops), so matching a price
+    only pops the orders it crosses. Removed orders are left in the heaps
+    and skipped when they reach the top.
+    """
+
+    def __init__(self):
+        self._rising = dict()
+        self._falling = dict()
+        self._live = dict()
+        self._limits = dict()
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._live)
+
+    def __contains__(self, order_id):
+        return order_id in self._live
+
+    def symbols(self):
+        """Return the symbols with resting orders"""
+        with self._lock:
+            return [symbol for symbol in set(self._rising) | set(self._falling)
+                    if self._rising.get(symbol) or self._falling.get(symbol)]
+
+    def add(self, order_id, symbol, side, type_, limit_price=None, stop_price=None, triggered=False):
+        """Rest an order; stop-limit orders become limit orders once triggered"""
+        symbol = symbol.upper()
+        with self._lock:
+            if type_ == "stop_limit" and not triggered:
+                self._limits[order_id] = float(limit_price)
+                self._push(order_id, symbol, "trigger", float(stop_price), rising=side == "buy")
+            elif type_ == "stop":
+                self._push(order_id, symbol, "fill", float(stop_price), rising=side == "buy")
+            else:
+                self._push(order_id, symbol, "fill", float(limit_price), rising=side == "sell")
+
+    def _push(self, order_id, symbol, action, price, rising):
+        sequence = next(self._sequence)
+        self._live[order_id] = sequence
+        if rising:
+            heapq.heappush(self._rising.setdefault(symbol, list()), (price, sequence, order_id, action))
+        else:
+            heapq.heappush(self._falling.setdefault(symbol, list()), (-price, sequence, order_id, action))
+
+    def remove(self, order_id):
+        """Stop matching an order, e.g. once cancelled or expired"""
+        with self._lock:
+            self._live.pop(order_id, None)
+            self._limits.pop(order_id, None)
+
+    def match(self, symbol, price):
+        """Pop the orders set off by price, returning (ids to fill, ids of stop-limit orders triggered)"""
+        symbol = symbol.upper()
+        fills, triggered = list(), list()
+        with self._lock:
+            # Triggered stop-limit orders rest again as limit orders, which price may fill right away
+            while True:
+                popped = self._pop(self._rising.get(symbol), lambda key: key <= price, rising=True)
+                popped += self._pop(self._falling.get(symbol), lambda key: -key >= price, rising=False)
+                if not popped:
+                    break
+                for order_id, action, rising in popped:
+                    if action == "fill":
+                        fills.append(order_id)
+                        del self._live[order_id]
+                    else:
+                        triggered.append(order_id)
+                        self._push(order_id, symbol, "fill", self._limits.pop(order_id), rising=not rising)
+        return fills, triggered
+
+    def _pop(self, heap, crossed, rising):
+        """Pop the live orders at the top of heap whose key is crossed"""
+        popped = list()
+        while heap and crossed(heap[0][0]):
+            key, sequence, order_id, action = heapq.heappop(heap)
+            if self._live.get(order_id) == sequence:
+                popped.append((order_id, action, rising))
+        return popped
+
+
+class OrderMatcher(threading.Thread):
+    """Background thread matching the order book against every new quote.
+
+    fill(order_id, price) executes an order and trigger(order_id) records
+    that a stop-limit order became a limit order. expire() returns the ids
+    of the orders that just expired, and is called every interval seconds.
+    """
+
+    def __init__(self, book, fill, trigger, expire, interval=60.0):
+        super().__init__(name="order-matcher", daemon=True)
+        self.book = book
+        self.fill = fill
+        self.trigger = trigger
+        self.expire = expire
+        self.interval = interval
+        self.fills = 0
+        self.errors = 0
+        self._quotes = queue.Queue()
+        self._stopped = threading.Event()
+
+    def on_quotes(self, quotes):
+        """Queue new quotes for matching, without slowing down the thread that fetched them"""
+        # Nothing would take them off the queue with ORDER_MATCHER=0 or once stopped
+        if self.is_alive() and not self._stopped.is_set():
+            self._quotes.put(quotes)
+
+    def run(self):
+        expired_at = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                quotes = self._quotes.get(timeout=max(0.0, expired_at + self.interval - time.monotonic()))
+            except queue.Empty:
+                quotes = None
+
+            try:
+                if quotes:
+                    self.match(quotes)
+                if time.monotonic() >= expired_at + self.interval:
+                    expired_at = time.monotonic()
+                    for order_id in self.expire():
+                        self.book.remove(order_id)
+            except Exception:
+                # Keep matching the next quotes
+                self.errors += 1
+
+    def stop(self):
+        """Stop the thread after the quotes being matched"""
+        self._stopped.set()
+
+        # Wake the thread up if it's waiting for quotes
+        self._quotes.put(None)
+
+    def match(self, quotes):
+        """Fill the orders set off by quotes"""
+        for symbol, quote in quotes.items():
+            fills, triggered = self.book.match(symbol, quote["price"])
+            for order_id in triggered:
+                self.trigger(order_id)
+
+            # One failed fill mustn't stop the others
+            for order_id in fills:
+                try:
+                    self.fill(order_id, quote["price"])
+                    self.fills += 1
+                except Exception:
+                    self.errors += 1
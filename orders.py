@@ -0,0 +1,265 @@
+import math
+
+from datetime import datetime
+from decimal import Decimal
+
+from database import db
+from helpers import lookup_many, symbol_index
+from models import User, Transaction, Position, Order
+
+
+class OrderError(Exception):
+    """Order rejected because of the cash or shares of the user"""
+
+
+# Most legs of a basket, so it's priced with one IEX batch request
+MAX_BASKET_LEGS = 100
+
+
+def lock_account(user_id):
+    """Start a write transaction and return the user, locked until commit or rollback"""
+
+    # SQLite has no row locks, so take the database write lock up front
+    if db.engine.dialect.name == "sqlite":
+        connection = db.session.connection().connection
+        if not connection.in_transaction:
+            db.session.execute(db.text("BEGIN IMMEDIATE"))
+
+    # Read the user again in case it was loaded before the lock was taken
+    return User.query.with_for_update().populate_existing().filter_by(id=user_id).one()
+
+
+def trade(user, symbol, shares, price):
+    """Buy (shares > 0) or sell (shares < 0) shares of symbol at price for the locked user (caller commits)"""
+
+    position = Position.query.populate_existing().filter_by(user_id=user.id, stocks_symbol=symbol).first()
+    owned = position.shares if position else 0
+
+    # Check the cash for buying and the owned shares for selling
+    transaction_price = shares * price
+    if shares > 0 and Decimal(user.cash) < transaction_price:
+        raise OrderError("can't afford")
+    if shares < 0 and owned <= 0:
+        raise OrderError("no shares own")
+    if shares < 0 and -shares > owned:
+        raise OrderError("too many shares")
+
+    # Update the cash, then record the transaction and the position with it
+    user.cash = Decimal(user.cash) - transaction_price
+    transaction = Transaction(stocks_symbol=symbol, shares=shares, price=price, user_id=user.id)
+    db.session.add(transaction)
+    Position.record(transaction)
+    return transaction
+
+
+def execute_order(user_id, symbol, shares, price):
+    """Buy (shares > 0) or sell (shares < 0) shares of symbol at price in a single commit"""
+
+    try:
+        transaction = trade(lock_account(user_id), symbol, shares, Decimal(str(price)))
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+
+    return transaction
+
+
+def execute_basket(user_id, legs, prices):
+    """Trade every leg, (symbol, shares) with shares < 0 when selling, at prices in a single commit: all legs or none"""
+
+    if not legs:
+        raise OrderError("empty basket")
+    if len(legs) > MAX_BASKET_LEGS:
+        raise OrderError(f"more than {MAX_BASKET_LEGS} legs")
+    if len(set(symbol for symbol, shares in legs)) < len(legs):
+        raise OrderError("symbol listed twice")
+
+    try:
+        user = lock_account(user_id)
+        positions = {position.stocks_symbol.upper(): position
+                     for position in Position.query.populate_existing().filter_by(user_id=user_id)}
+
+        # Check the owned shares of every sale, then the cash left once everything is traded
+        for symbol, shares in legs:
+            owned = positions[symbol].shares if symbol in positions else 0
+            if shares < 0 and owned <= 0:
+                raise OrderError(f"no shares own of {symbol}")
+            if shares < 0 and -shares > owned:
+                raise OrderError(f"too many shares of {symbol}")
+        transaction_price = sum(shares * Decimal(str(prices[symbol])) for symbol, shares in legs)
+        if Decimal(user.cash) < transaction_price:
+            raise OrderError("can't afford")
+
+        # Update the cash and the positions, then insert every transaction and new position with one statement each
+        user.cash = Decimal(user.cash) - transaction_price
+        now = datetime.utcnow()
+        rows, new_positions = list(), list()
+        for symbol, shares in legs:
+            position = positions.get(symbol)
+            if position is None:
+                position = Position(user_id=user_id, stocks_symbol=symbol, shares=0, cost_basis=0)
+                new_positions.append(position)
+            price = Decimal(str(prices[symbol]))
+            position.apply(shares, price)
+            rows.append({"stocks_symbol": position.stocks_symbol, "shares": shares, "price": price,
+                         "transaction_date": now, "user_id": user_id})
+        db.session.execute(Transaction.__table__.insert(), rows)
+        if new_positions:
+            db.session.execute(Position.__table__.insert(), [
+                {"stocks_symbol": position.stocks_symbol, "shares": position.shares,
+                 "cost_basis": position.cost_basis, "user_id": user_id} for position in new_positions])
+
+        # Read the transactions back while the account is locked, and keep them loaded after the commit
+        transactions = Transaction.query.filter_by(user_id=user_id).\
+            order_by(Transaction.id.desc()).limit(len(rows)).all()[::-1]
+        for transaction in transactions:
+            db.session.expunge(transaction)
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+
+    return transactions
+
+
+def basket_from_weights(weights, owned, prices, cash):
+    """Return the legs bringing the owned shares to weights, fractions of the total value by symbol.
+
+    Owned stocks without a weight are sold, and what the weights leave over stays in cash.
+    """
+    if any(weight < 0 for weight in weights.values()) or sum(weights.values()) > 1 + 1e-9:
+        raise OrderError("weights must be positive and add up to at most 1")
+
+    total_value = cash + sum(shares * prices[symbol] for symbol, shares in owned.items())
+    legs = list()
+    for symbol in dict.fromkeys([*weights, *owned]):
+        target = math.floor(weights.get(symbol, 0) * total_value / prices[symbol])
+        if target != owned.get(symbol, 0):
+            legs.append((symbol, target - owned.get(symbol, 0)))
+    return legs
+
+
+def trade_basket(user_id, legs=None, weights=None):
+    """Price a basket of legs, or of target weights, with one batch of quotes and trade it in a single commit"""
+
+    legs = [(symbol.upper(), shares) for symbol, shares in legs or list()]
+    weights = {symbol.upper(): weight for symbol, weight in (weights or dict()).items()}
+    for symbol in [symbol for symbol, shares in legs] + list(weights):
+        if not symbol_index.is_valid(symbol):
+            raise OrderError(f"invalid symbol {symbol}")
+
+    owned = dict()
+    if weights:
+        owned = {position.stocks_symbol.upper(): position.shares
+                 for position in Position.query.filter_by(user_id=user_id).filter(Position.shares > 0)}
+
+    # Get the price of every stock of the basket at once
+    symbols = [symbol for symbol, shares in legs] + list(weights) + list(owned)
+    quotes = lookup_many(symbols)
+    for symbol in symbols:
+        if symbol not in quotes:
+            raise OrderError(f"invalid symbol {symbol}")
+    prices = {symbol: quote["price"] for symbol, quote in quotes.items()}
+
+    if weights:
+        cash = float(User.query.filter_by(id=user_id).first().cash)
+        legs = basket_from_weights(weights, owned, prices, cash)
+
+        # Nothing to trade when the portfolio already matches the weights
+        if not legs:
+            return list()
+    return execute_basket(user_id, legs, prices)
+
+
+def place_order(user_id, symbol, side, type_, shares, limit_price=None, stop_price=None, time_in_force="gtc"):
+    """Store a resting order after checking it, returning it"""
+
+    # Ensure the order is complete and its prices are positive
+    if side not in ("buy", "sell"):
+        raise OrderError("side must be buy or sell")
+    if type_ not in Order.TYPES:
+        raise OrderError("type must be limit, stop or stop_limit")
+    if time_in_force not in ("gtc", "day"):
+        raise OrderError("time in force must be gtc or day")
+    if shares < 1:
+        raise OrderError("value must be greater than or equal to 1")
+    if type_ in ("limit", "stop_limit") and not (limit_price and limit_price > 0):
+        raise OrderError("missing limit price")
+    if type_ in ("stop", "stop_limit") and not (stop_price and stop_price > 0):
+        raise OrderError("missing stop price")
+
+    now = datetime.utcnow()
+    order = Order(user_id=user_id, stocks_symbol=symbol, side=side, type=type_, shares=shares,
+                  limit_price=Decimal(str(limit_price)) if type_ != "stop" else None,
+                  stop_price=Decimal(str(stop_price)) if type_ != "limit" else None,
+                  time_in_force=time_in_force, created=now,
+                  expires=Order.day_end(now) if time_in_force == "day" else None)
+    db.session.add(order)
+    db.session.commit()
+    return order
+
+
+def fill_order(order_id, price):
+    """Execute an open order at price in a single commit, rejecting it if the user can't trade it any more"""
+
+    try:
+        order = Order.query.get(order_id)
+        if order is None:
+            return None
+        user = lock_account(order.user_id)
+        order = Order.query.populate_existing().filter_by(id=order_id).one()
+
+        # Another process may have filled, cancelled or expired the order already
+        if order.status != "open":
+            db.session.rollback()
+            return order
+        if order.expires and order.expires <= datetime.utcnow():
+            order.status = "expired"
+        else:
+            # trade() checks the cash and shares before changing anything
+            shares = order.shares if order.side == "buy" else -order.shares
+            try:
+                transaction = trade(user, order.stocks_symbol, shares, Decimal(str(price)))
+                db.session.flush()
+                order.transaction_id = transaction.id
+                order.status = "filled"
+            except OrderError:
+                order.status = "rejected"
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+
+    return order
+
+
+def trigger_order(order_id):
+    """Record that the stop price of a stop-limit order was reached"""
+    Order.query.filter_by(id=order_id, status="open").update({"triggered": True}, synchronize_session=False)
+    db.session.commit()
+
+
+def expire_orders():
+    """Expire the open orders past their expiry in a single commit, returning their ids"""
+    expired = Order.expire(datetime.utcnow())
+    db.session.commit()
+    return expired
+
+
+def cancel_order(user_id, order_id):
+    """Cancel an open order of the user, returning it"""
+    try:
+        lock_account(user_id)
+        order = Order.query.populate_existing().filter_by(id=order_id, user_id=user_id).first()
+        if order is None:
+            raise OrderError("no such order")
+        if order.status != "open":
+            raise OrderError(f"order already {order.status}")
+        order.status = "cancelled"
+        db.session.commit()
+    except:
+        db.session.rollback()
+        raise
+
+    return order
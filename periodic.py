@@ -0,0 +1,34 @@
+import threading
+import time
+
+
+class PeriodicWorker(threading.Thread):
+    """Background thread calling refresh() every interval seconds until stopped.
+
+    A failed refresh is counted in errors and tried again at the next
+    interval, so subclasses keep serving what their last refresh built.
+    """
+
+    def __init__(self, name, interval):
+        super().__init__(name=name, daemon=True)
+        self.interval = interval
+        self.errors = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.is_set():
+            started = time.monotonic()
+            try:
+                self.refresh()
+            except Exception:
+                self.errors += 1
+
+            # Wait for the rest of the interval, or until stopped
+            self._stopped.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def refresh(self):
+        raise NotImplementedError
+
+    def stop(self):
+        """Stop the thread after the refresh in progress"""
+        self._stopped.set()
@@ -0,0 +1,98 @@
+import queue
+import threading
+
+
+class Subscription:
+    """Symbols watched by one client and the price changes waiting for it"""
+
+    def __init__(self, symbols):
+        self.symbols = set(symbols)
+        self.changes = queue.Queue()
+
+    def get(self, timeout=None):
+        """Wait for the next dict of changed quotes, None if nothing changed before timeout"""
+        try:
+            return self.changes.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class PriceFeed:
+    """Fan-out of price changes to every subscribed client.
+
+    A single thread looks up the quotes of the symbols watched by any
+    subscriber every interval seconds, so however many clients watch a
+    symbol, it's fetched once per interval. Each subscriber only receives
+    the symbols it watches whose price changed.
+    """
+
+    def __init__(self, lookup_many, interval=5.0):
+        self.lookup_many = lookup_many
+        self.interval = interval
+        self._subscriptions = set()
+        self._prices = dict()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def subscribe(self, symbols):
+        """Start receiving the price changes of symbols"""
+        subscription = Subscription(symbol.upper() for symbol in symbols)
+        with self._condition:
+            self._subscriptions.add(subscription)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="price-feed", daemon=True)
+                self._thread.start()
+
+            # Wake the thread up if it was waiting for a first subscriber
+            elif len(self._subscriptions) == 1:
+                self._condition.notify()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stop receiving price changes"""
+        with self._condition:
+            self._subscriptions.discard(subscription)
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+    def stop(self):
+        """Stop the thread after the lookup in progress"""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # Sleep until somebody subscribes
+                while not self._subscriptions and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                subscriptions = list(self._subscriptions)
+
+            self.publish(subscriptions)
+
+            with self._condition:
+                if not self._stopped:
+                    self._condition.wait(self.interval)
+
+    def publish(self, subscriptions):
+        """Look up the watched symbols once and send the changed prices to the subscribers"""
+        symbols = set().union(*(subscription.symbols for subscription in subscriptions))
+        try:
+            quotes = self.lookup_many(symbols)
+        except Exception:
+            return
+
+        changed = {symbol: quote for symbol, quote in quotes.items()
+                   if self._prices.get(symbol) != quote["price"]}
+        for symbol, quote in changed.items():
+            self._prices[symbol] = quote["price"]
+
+        for subscription in subscriptions:
+            changes = {symbol: changed[symbol] for symbol in subscription.symbols if symbol in changed}
+            if changes:
+                subscription.changes.put(changes)
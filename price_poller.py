@@ -0,0 +1,29 @@
+import time
+
+from periodic import PeriodicWorker
+
+
+class PricePoller(PeriodicWorker):
+    """Background thread refreshing the cached quotes of a set of symbols.
+
+    symbols is a callable returning the symbols to refresh, called again
+    before every refresh so newly held or listed stocks are picked up.
+    """
+
+    def __init__(self, symbols, cache, client, interval=10.0):
+        super().__init__("price-poller", interval)
+        self.symbols = symbols
+        self.cache = cache
+        self.client = client
+        self.refreshes = 0
+        self.last_refresh = None
+
+    def refresh(self):
+        """Fetch the quotes of every symbol in batches and store them in the cache"""
+        symbols = sorted(set(symbol.upper() for symbol in self.symbols()))
+
+        # Through the cache, so symbols a page is already fetching aren't requested twice
+        quotes = self.cache.refresh(symbols, self.client.quote_many)
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        return quotes
@@ -0,0 +1,178 @@
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Flight:
+    """Upstream request in progress for a group of symbols"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.quotes = dict()
+
+
+class QuoteCache:
+    """Thread-safe quote cache with a freshness TTL and LRU eviction.
+
+    Concurrent misses for the same symbol are deduplicated, so only one
+    thread contacts the upstream API while the others wait for its result.
+    Quotes expired less than max_stale seconds ago are returned at once
+    and refreshed in the background, so a slow upstream API doesn't hold
+    up pages. When the upstream API has no quote for a symbol, the last
+    known quote is returned whatever its age. Every listener is called
+    with the dict of quotes each time new ones are stored.
+    """
+
+    def __init__(self, ttl=15.0, maxsize=1024, max_stale=60.0):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.max_stale = max_stale
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.listeners = list()
+        self._entries = OrderedDict()
+        self._flights = dict()
+        self._refresher = None
+        self._lock = threading.Lock()
+
+    def get_many(self, symbols, fetch):
+        """Return quotes for symbols, calling fetch(symbols) only for the missing or expired ones."""
+
+        quotes = dict()
+        waiting = dict()
+        leading = list()
+        refreshing = list()
+        now = time.monotonic()
+
+        with self._lock:
+            for symbol in symbols:
+                entry = self._entries.get(symbol)
+
+                # Serve fresh quotes straight from the cache
+                if entry is not None and now - entry[0] < self.ttl:
+                    self._entries.move_to_end(symbol)
+                    quotes[symbol] = entry[1]
+                    self.hits += 1
+                    continue
+
+                # Serve recently expired quotes too, refreshing them in the background
+                if entry is not None and now - entry[0] < self.ttl + self.max_stale:
+                    quotes[symbol] = entry[1]
+                    self.stale_hits += 1
+                    if symbol not in self._flights:
+                        refreshing.append(symbol)
+                    continue
+
+                self.misses += 1
+
+                # Wait for another thread already fetching this symbol
+                if symbol in self._flights:
+                    waiting[symbol] = self._flights[symbol]
+                else:
+                    leading.append(symbol)
+
+            flight = self._take_off(leading)
+            refresh = self._take_off(refreshing)
+            if refreshing and self._refresher is None:
+                self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="quote-refresh")
+
+        if refreshing:
+            self._refresher.submit(self._fetch, refreshing, refresh, fetch)
+
+        # Fetch the symbols nobody else is fetching
+        if leading:
+            quotes.update(self._fetch(leading, flight, fetch))
+
+        for symbol, other in waiting.items():
+            other.done.wait()
+            if symbol in other.quotes:
+                quotes[symbol] = other.quotes[symbol]
+
+        return quotes
+
+    def refresh(self, symbols, fetch):
+        """Fetch and store quotes for symbols whatever their age, e.g. from a background poller.
+
+        Symbols another thread is already fetching are left to it, so they
+        are only requested once.
+        """
+        with self._lock:
+            leading = [symbol for symbol in symbols if symbol not in self._flights]
+            flight = self._take_off(leading)
+        return self._fetch(leading, flight, fetch) if leading else dict()
+
+    def _take_off(self, symbols):
+        """Mark symbols as being fetched (caller holds the lock), returning their flight"""
+        flight = _Flight()
+        for symbol in symbols:
+            self._flights[symbol] = flight
+        return flight
+
+    def _fetch(self, symbols, flight, fetch):
+        """Fetch the quotes of the symbols of flight and store them, returning them"""
+        fetched = dict()
+        try:
+            flight.quotes = fetch(symbols)
+            fetched = dict(flight.quotes)
+        finally:
+            with self._lock:
+                fetched_at = time.monotonic()
+                for symbol in symbols:
+                    del self._flights[symbol]
+                    if symbol in flight.quotes:
+                        self._store(symbol, flight.quotes[symbol], fetched_at)
+
+                    # Fall back to the last known quote when the upstream API fails
+                    elif symbol in self._entries:
+                        flight.quotes[symbol] = self._entries[symbol][1]
+                        self.stale_hits += 1
+            flight.done.set()
+        self._notify(fetched)
+        return flight.quotes
+
+    def age(self, symbol):
+        """Return the seconds since the quote of symbol was fetched, None if it isn't cached"""
+        with self._lock:
+            entry = self._entries.get(symbol)
+            return None if entry is None else time.monotonic() - entry[0]
+
+    def _store(self, symbol, quote, fetched_at):
+        """Store quote and evict the least recently used symbols beyond maxsize"""
+        self._entries[symbol] = (fetched_at, quote)
+        self._entries.move_to_end(symbol)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _notify(self, quotes):
+        """Pass newly stored quotes to the listeners"""
+        if quotes:
+            for listener in self.listeners:
+                listener(quotes)
+
+    def clear(self):
+        """Drop every cached quote"""
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        """Stop the background refresh thread once the refreshes in progress are done"""
+        with self._lock:
+            refresher, self._refresher = self._refresher, None
+        if refresher is not None:
+            refresher.shutdown()
+
+    def stats(self):
+        """Return the cache counters"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits
+            }
@@ -0,0 +1,127 @@
+import os
+import requests
+import time
+import urllib.parse
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class QuoteClient:
+    """IEX quote client sharing a pool of keep-alive connections.
+
+    Requests time out after timeout=(connect, read) seconds and are retried
+    with exponential backoff when IEX answers 429 or a 5xx error. Batches
+    of quotes are fetched at once, up to one per pooled connection. Every
+    listener is called with the endpoint, seconds and failure of each request.
+    """
+
+    # IEX accepts at most 100 symbols per batch request
+    BATCH_SIZE = 100
+
+    def __init__(self, base_url="https://cloud.iexapis.com/stable", api_key=None,
+                 timeout=(3.05, 10), retries=3, backoff=0.3, pool_size=10):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.listeners = list()
+
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=["GET"], respect_retry_after_header=True)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Threads are only started with the first request sending several batches
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="iex")
+
+    def quote_many(self, symbols):
+        """Fetch quotes for symbols, returning a dict keyed by symbol."""
+        symbols = list(symbols)
+        batches = [symbols[i:i + self.BATCH_SIZE] for i in range(0, len(symbols), self.BATCH_SIZE)]
+
+        # Most lookups fit in one batch, which is fetched without handing it to another thread
+        if len(batches) <= 1:
+            return self._quote_batch(batches[0]) if batches else dict()
+
+        quotes = dict()
+        for batch in self._executor.map(self._quote_batch, batches):
+            quotes.update(batch)
+        return quotes
+
+    def _get(self, endpoint, url):
+        """Return the response to a GET of url, None if it failed"""
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException:
+            response = None
+        for listener in self.listeners:
+            listener(endpoint, time.perf_counter() - started, response is None)
+        return response
+
+    def chart(self, symbol, range_="1y"):
+        """Fetch the daily prices of symbol over range_ (e.g. 1m, 1y, 5y), oldest first."""
+
+        # Contact API
+        api_key = self.api_key or os.environ.get("API_KEY")
+        response = self._get("chart", f"{self.base_url}/stock/{urllib.parse.quote_plus(symbol)}/chart/{range_}?token={api_key}")
+        if response is None:
+            return list()
+
+        # Parse response, skipping days without a close
+        try:
+            bars = response.json()
+        except ValueError:
+            return list()
+
+        prices = list()
+        for bar in bars if isinstance(bars, list) else []:
+            try:
+                prices.append({
+                    "stocks_symbol": symbol.upper(),
+                    "date": date.fromisoformat(bar["date"]),
+                    "open": bar.get("open"),
+                    "high": bar.get("high"),
+                    "low": bar.get("low"),
+                    "close": float(bar["close"]),
+                    "volume": bar.get("volume")
+                })
+            except (KeyError, TypeError, ValueError):
+                continue
+        return prices
+
+    def _quote_batch(self, symbols):
+        """Fetch quotes for at most BATCH_SIZE symbols with one request"""
+
+        # Contact API
+        api_key = self.api_key or os.environ.get("API_KEY")
+        response = self._get("batch", f"{self.base_url}/stock/market/batch"
+                                      f"?symbols={urllib.parse.quote_plus(','.join(symbols))}&types=quote&token={api_key}")
+        if response is None:
+            return dict()
+
+        # Parse response, skipping any symbol IEX doesn't know
+        try:
+            batch = response.json()
+        except ValueError:
+            return dict()
+
+        quotes = dict()
+        for symbol in symbols:
+            try:
+                quote = batch[symbol]["quote"]
+                quotes[symbol] = {
+                    "name": quote["companyName"],
+                    "price": float(quote["latestPrice"]),
+                    "symbol": quote["symbol"]
+                }
+            except (KeyError, TypeError, ValueError):
+                continue
+        return quotes
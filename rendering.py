@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import os
+import threading
+
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    # Responses are only gzipped without the brotli package
+    brotli = None
+
+
+class FragmentCache:
+    """Thread-safe cache of rendered parts of pages, e.g. a page of the stocks list.
+
+    Fragments are rendered once and served until invalidate() is called,
+    keeping the maxsize most recently used ones.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._fragments = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, render):
+        """Return the fragment stored under key, calling render() to make it if missing"""
+        with self._lock:
+            if key in self._fragments:
+                self._fragments.move_to_end(key)
+                self.hits += 1
+                return self._fragments[key]
+            self.misses += 1
+            generation = self._generation
+
+        fragment = render()
+
+        # Don't store a fragment rendered from data invalidated in the meantime
+        with self._lock:
+            if generation == self._generation:
+                self._fragments[key] = fragment
+                while len(self._fragments) > self.maxsize:
+                    self._fragments.popitem(last=False)
+        return fragment
+
+    def invalidate(self):
+        """Drop every fragment, e.g. once the data they show changed"""
+        with self._lock:
+            self._fragments.clear()
+            self._generation += 1
+
+    def __len__(self):
+        return len(self._fragments)
+
+
+class StaticFingerprints:
+    """Short hashes of the content of static files, added to their URLs so browsers can cache them for good.
+
+    Hashes are computed once per file; with check_modified, they're computed
+    again whenever a file changes, e.g. while developing.
+    """
+
+    def __init__(self, folder, check_modified=False):
+        self.folder = folder
+        self.check_modified = check_modified
+        self._hashes = dict()
+        self._lock = threading.Lock()
+
+    def get(self, filename):
+        """Return the hash of a static file, None if it doesn't exist"""
+        path = os.path.join(self.folder, filename)
+        entry = self._hashes.get(filename)
+        if entry is not None and not self.check_modified:
+            return entry[1]
+
+        try:
+            mtime = os.path.getmtime(path)
+            if entry is None or entry[0] != mtime:
+                with open(path, "rb") as file:
+                    entry = (mtime, hashlib.md5(file.read()).hexdigest()[:12])
+                with self._lock:
+                    self._hashes[filename] = entry
+        except OSError:
+            return None
+        return entry[1]
+
+
+def precompile_templates(app):
+    """Compile every template of app now instead of on its first render"""
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+
+def compress(response, accept_encodings, min_size=1024, level=6):
+    """Compress the body of response with brotli or gzip, whichever the client prefers, if it's at least min_size.
+
+    Streamed responses, e.g. exports and live prices, and files are sent as they are.
+    """
+    if response.status_code != 200 or response.direct_passthrough or response.is_streamed \
+            or "Content-Encoding" in response.headers or response.mimetype == "text/event-stream":
+        return response
+
+    encoding = accept_encodings.best_match(["br", "gzip"] if brotli is not None else ["gzip"])
+    data = response.get_data()
+    if encoding is None or len(data) < min_size:
+        return response
+
+    if encoding == "br":
+        response.set_data(brotli.compress(data, quality=level))
+    else:
+        response.set_data(gzip.compress(data, compresslevel=level))
+    response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+
+    # The compressed body is only equivalent to the page the ETag was computed from, not identical to it
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,179 @@
+import hashlib
+import secrets
+import threading
+import time
+
+from datetime import datetime, timedelta
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """Session data kept on the server, identified by the random sid of the session cookie"""
+
+    def __init__(self, data=None, sid=None, new=True):
+        def on_update(self):
+            self.modified = True
+        super().__init__(data, on_update)
+        self.sid = sid or secrets.token_urlsafe(32)
+        self.new = new
+        self.modified = False
+        self.replaced = None
+
+    def clear(self):
+        """Empty the session under a new sid, so a sid known before logging in is useless after"""
+        if not self.new and self.replaced is None:
+            self.replaced = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        super().clear()
+
+
+class StoreSessionInterface(SessionInterface):
+    """Base of the server-side sessions, stored by subclasses with load(), store() and delete().
+
+    Sessions are written when they change, or when over half of their
+    lifetime has passed so active sessions don't expire, instead of on
+    every request. Only a hash of the sid is stored, so reading the store
+    doesn't give away valid session cookies.
+    """
+
+    serializer = TaggedJSONSerializer()
+
+    @staticmethod
+    def key(sid):
+        return hashlib.sha256(sid.encode()).hexdigest()
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(app.session_cookie_name)
+        if sid:
+            stored = self.load(self.key(sid))
+            if stored is not None:
+                data, expires = stored
+                session = ServerSession(self.serializer.loads(data), sid=sid, new=False)
+                session.expires = expires
+                return session
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        # Forget cleared and emptied sessions, e.g. after logging out
+        if session.replaced:
+            self.delete(self.key(session.replaced))
+        if not session:
+            if session.replaced:
+                response.delete_cookie(app.session_cookie_name, domain=domain, path=path)
+            return
+
+        lifetime = app.permanent_session_lifetime
+        expires = datetime.utcnow() + lifetime
+        if session.modified or session.new or getattr(session, "expires", expires) - datetime.utcnow() < lifetime / 2:
+            self.store(self.key(session.sid), self.serializer.dumps(dict(session)), expires)
+            response.set_cookie(app.session_cookie_name, session.sid, expires=self.get_expiration_time(app, session),
+                                httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                                secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+    def load(self, key):
+        """Return the (data, expiry) of the session stored under key, None if missing or expired"""
+        raise NotImplementedError
+
+    def store(self, key, data, expires):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+
+class DatabaseSessionInterface(StoreSessionInterface):
+    """Sessions stored in a database table, shared by every process using the database.
+
+    Expired sessions are swept at most every sweep_interval seconds.
+    """
+
+    def __init__(self, db, table, sweep_interval=3600.0):
+        self.db = db
+        self.table = table
+        self.sweep_interval = sweep_interval
+        self._swept = time.monotonic()
+
+    def load(self, key):
+        # Use a connection of its own, so the session never touches the transactions of the routes
+        with self.db.engine.connect() as connection:
+            row = connection.execute(self.db.select(self.table.c.data, self.table.c.expires).
+                                     where(self.table.c.id == key)).first()
+        if row is None or row.expires <= datetime.utcnow():
+            return None
+        return row.data, row.expires
+
+    def store(self, key, data, expires):
+        with self.db.engine.begin() as connection:
+            updated = connection.execute(self.table.update().where(self.table.c.id == key).
+                                         values(data=data, expires=expires)).rowcount
+            if not updated:
+                connection.execute(self.table.insert().values(id=key, data=data, expires=expires))
+        if time.monotonic() - self._swept > self.sweep_interval:
+            self.sweep()
+
+    def delete(self, key):
+        with self.db.engine.begin() as connection:
+            connection.execute(self.table.delete().where(self.table.c.id == key))
+
+    def sweep(self):
+        """Delete the expired sessions, returning how many there were"""
+        self._swept = time.monotonic()
+        with self.db.engine.begin() as connection:
+            return connection.execute(self.table.delete().where(self.table.c.expires <= datetime.utcnow())).rowcount
+
+
+class KeyValueSessionInterface(StoreSessionInterface):
+    """Sessions stored in Redis, or anything with the get(), setex() and delete() of a Redis client.
+
+    The store expires the sessions itself.
+    """
+
+    def __init__(self, client, prefix="session:"):
+        self.client = client
+        self.prefix = prefix
+
+    def load(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        value = value.decode() if isinstance(value, bytes) else value
+        expires, data = value.split(" ", 1)
+        return data, datetime.fromisoformat(expires)
+
+    def store(self, key, data, expires):
+        ttl = max(1, int((expires - datetime.utcnow()).total_seconds()))
+        self.client.setex(self.prefix + key, ttl, f"{expires.isoformat()} {data}")
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+
+class MemoryStore:
+    """In-process stand-in for a Redis client, for tests and single process deployments"""
+
+    def __init__(self):
+        self._values = dict()
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        with self._lock:
+            value, expires = self._values.get(name, (None, None))
+            if value is not None and expires <= time.monotonic():
+                del self._values[name]
+                return None
+            return value
+
+    def setex(self, name, time_, value):
+        seconds = time_.total_seconds() if isinstance(time_, timedelta) else time_
+        with self._lock:
+            self._values[name] = (value, time.monotonic() + seconds)
+        return True
+
+    def delete(self, *names):
+        with self._lock:
+            return sum(self._values.pop(name, None) is not None for name in names)
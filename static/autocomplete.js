@@ -0,0 +1,20 @@
+// Suggest stocks in the datalist of every input with a data-autocomplete attribute
+document.querySelectorAll("input[data-autocomplete]").forEach(function(input) {
+    const datalist = document.getElementById(input.getAttribute("list"));
+    input.addEventListener("input", function() {
+        if (!input.value.trim()) {
+            return;
+        }
+        fetch("/api/v1/symbols?q=" + encodeURIComponent(input.value))
+            .then(function(response) { return response.ok ? response.json() : {symbols: []}; })
+            .then(function(data) {
+                datalist.innerHTML = "";
+                data.symbols.forEach(function(stock) {
+                    const option = document.createElement("option");
+                    option.value = stock.symbol;
+                    option.textContent = stock.company_name;
+                    datalist.appendChild(option);
+                });
+            });
+    });
+});
@@ -0,0 +1,142 @@
+import re
+import threading
+
+from bisect import bisect_left
+
+
+# Characters a stock symbol can be made of, e.g. BRK.B
+SYMBOL_PATTERN = re.compile(r"^[A-Z][A-Z0-9.\-]{0,9}$")
+
+
+def trigrams(text):
+    """Return the set of three letter sequences of text"""
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SymbolIndex:
+    """In-memory search index over the stocks list.
+
+    Symbols and the words of company names are kept sorted for prefix
+    searches, and company names are indexed by trigram for searches
+    inside names. loader is a callable returning (symbol, company_name,
+    sector) rows; it's called again after invalidate(). With listed_only,
+    only listed symbols are valid.
+    """
+
+    def __init__(self, loader=None, listed_only=True):
+        self.loader = loader
+        self.listed_only = listed_only
+        self.load_errors = 0
+        self._stocks = list()
+        self._symbols = list()
+        self._words = list()
+        self._trigrams = dict()
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        """Reload the stocks on the next search"""
+        self._stale = True
+
+    def load(self):
+        """Load the stocks now instead of on the first search"""
+        self.invalidate()
+        self._ensure_loaded()
+
+    def _ensure_loaded(self):
+        if not self._stale or self.loader is None:
+            return
+        with self._lock:
+            if self._stale:
+                try:
+                    rows = self.loader()
+                except Exception:
+                    # Keep the stocks loaded before, e.g. while the database is locked, and try again on the next call
+                    self.load_errors += 1
+                    return
+                self._build(rows)
+                self._stale = False
+
+    def _build(self, rows):
+        stocks, symbols, words, index = list(), list(), list(), dict()
+        for i, (symbol, company_name, sector) in enumerate(rows):
+            stocks.append({"symbol": symbol.upper(), "company_name": company_name, "sector": sector})
+            symbols.append((symbol.upper(), i))
+            name = company_name.lower()
+            words.extend((word, i) for word in set(re.findall(r"[a-z0-9&]+", name)))
+            for trigram in trigrams(name):
+                index.setdefault(trigram, set()).add(i)
+
+        self._stocks, self._symbols, self._words, self._trigrams = stocks, sorted(symbols), sorted(words), index
+
+    def _prefixed(self, keys, prefix):
+        """Return the ids of the sorted (key, id) pairs whose key starts with prefix"""
+        ids = list()
+        for key, i in keys[bisect_left(keys, (prefix, -1)):]:
+            if not key.startswith(prefix):
+                break
+            ids.append(i)
+        return ids
+
+    def __contains__(self, symbol):
+        self._ensure_loaded()
+        keys = self._symbols
+        position = bisect_left(keys, (symbol.upper(), -1))
+        return position < len(keys) and keys[position][0] == symbol.upper()
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._stocks)
+
+    def __iter__(self):
+        self._ensure_loaded()
+        return iter(self._stocks)
+
+    def get(self, symbol, default=None):
+        """Return the company name of a listed symbol, so the index can stand in for a dict of names"""
+        self._ensure_loaded()
+        keys = self._symbols
+        position = bisect_left(keys, (symbol.upper(), -1))
+        if position < len(keys) and keys[position][0] == symbol.upper():
+            return self._stocks[keys[position][1]]["company_name"]
+        return default
+
+    def is_valid(self, symbol):
+        """Check symbol without contacting IEX: well formed and, with listed_only, listed"""
+        if not symbol or not SYMBOL_PATTERN.match(symbol.upper()):
+            return False
+
+        # Without a stocks list there is nothing to check against
+        return not self.listed_only or not len(self) or symbol in self
+
+    def search(self, query, sector=None, limit=10):
+        """Return the stocks best matching query: symbol prefix, then name word prefix, then name substring"""
+        self._ensure_loaded()
+        query = query.strip()
+        if not query:
+            return list()
+
+        ranked = list(self._prefixed(self._symbols, query.upper()))
+        ranked += self._prefixed(self._words, query.lower())
+
+        # Match inside company names through the trigrams of the query
+        name = query.lower()
+        if len(name) >= 3:
+            candidates = set.intersection(*(self._trigrams.get(trigram, set()) for trigram in trigrams(name)))
+            ranked += sorted(i for i in candidates if name in self._stocks[i]["company_name"].lower())
+
+        results, seen = list(), set()
+        for i in ranked:
+            stock = self._stocks[i]
+            if i in seen or (sector and stock["sector"] != sector):
+                continue
+            seen.add(i)
+            results.append(stock)
+            if len(results) == limit:
+                break
+        return results
+
+    def sectors(self):
+        """Return the sectors of the listed stocks"""
+        self._ensure_loaded()
+        return sorted(set(stock["sector"] for stock in self._stocks))
@@ -0,0 +1,45 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from application import create_app, stop_background  # noqa: E402
+from database import db  # noqa: E402
+from fake_iex import FakeIEX  # noqa: E402
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Application on an empty database of its own, with simulated quotes"""
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'finance.db'}",
+        "MARKET_DATA": "random_walk",
+        "ORDER_MATCHER": "0",
+        "SESSION_BACKEND": "cookie",
+        "SECRET_KEY": "test",
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    stop_background(app)
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """Client logged in as a newly registered user"""
+    client = app.test_client()
+    client.post("/register", data={"username": "test", "email": "test@example.com",
+                                   "password": "secret", "confirmation": "secret"})
+    return client
+
+
+@pytest.fixture
+def fake_iex():
+    """Local fake IEX server, stopped after the test"""
+    server = FakeIEX().start()
+    yield server
+    server.close()
@@ -0,0 +1,26 @@
+from analytics import Trades, analyze
+
+import numpy as np
+
+
+def test_analyze_without_trades():
+    trades = Trades([], *(np.empty(0, dtype=dtype) for dtype in (np.int64, np.int64, np.float64, np.float64)))
+    result = analyze(trades, dict(), 10000.0)
+    assert result["positions"] == dict()
+    assert result["portfolio"]["total_value"] == 10000.0
+    assert result["portfolio"]["return"] == 0.0
+
+
+def test_new_user_without_history(client):
+    assert client.get("/").status_code == 200
+    response = client.get("/api/v1/analytics")
+    assert response.status_code == 200
+    assert response.json["positions"] == dict()
+
+
+def test_analytics_page(client):
+    client.post("/buy", data={"symbol": "AAPL", "shares": "2"})
+    response = client.get("/analytics")
+    assert response.status_code == 200
+    assert b"AAPL" in response.data
+    assert b"Performance" not in client.get("/").data
@@ -0,0 +1,59 @@
+import time
+
+from datetime import datetime
+
+import pytest
+
+from database import db
+from models import Transaction, User
+
+
+@pytest.mark.parametrize("limit", [0, -5])
+def test_history_limit_at_least_one(app, client, limit):
+    with app.app_context():
+        user_id = User.query.filter_by(username="test").one().id
+        db.session.add_all([Transaction(user_id=user_id, stocks_symbol="AAPL", shares=1, price=100,
+                                        transaction_date=datetime(2021, 1, day)) for day in range(1, 4)])
+        db.session.commit()
+
+    page = client.get(f"/api/v1/history?limit={limit}").get_json()
+    assert len(page["transactions"]) == 1
+    assert page["next"] is not None
+
+    page = client.get(f"/api/v1/history?limit={limit}&cursor={page['next']}").get_json()
+    assert len(page["transactions"]) == 1
+
+
+@pytest.mark.parametrize("limit", [0, -5])
+def test_orders_and_symbols_limit_at_least_one(client, limit):
+    assert client.get(f"/api/v1/orders?limit={limit}").status_code == 200
+    assert client.get(f"/api/v1/symbols?q=a&limit={limit}").status_code == 200
+
+
+def test_quotes_as_of(client):
+    quote = client.get("/api/v1/quote/aapl").get_json()
+    assert quote["symbol"] == "AAPL"
+    assert abs(datetime.fromisoformat(quote["as_of"]) - datetime.utcnow()).total_seconds() < 5
+
+    quotes = client.get("/api/v1/quotes?symbols=AAPL,MSFT").get_json()
+    assert set(quotes) == {"AAPL", "MSFT"}
+    assert all(quote["as_of"] for quote in quotes.values())
+
+
+def test_price_poller_last_refresh_metric(app, client):
+    assert "price_poller_last_refresh_timestamp_seconds 0" in client.get("/metrics").get_data(as_text=True)
+
+    app.extensions["price_poller"].refresh()
+    metrics = client.get("/metrics").get_data(as_text=True)
+    line = next(line for line in metrics.splitlines() if line.startswith("price_poller_last_refresh_timestamp_seconds "))
+    assert abs(float(line.split()[1]) - time.time()) < 5
+
+
+def test_quotes_rejects_more_than_a_batch(client):
+    symbols = ",".join(f"S{i}" for i in range(101))
+    response = client.get(f"/api/v1/quotes?symbols={symbols}")
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "more than 100 symbols"
+
+    # Repeated symbols count once
+    assert client.get(f"/api/v1/quotes?symbols={',aapl' * 150}").status_code == 200
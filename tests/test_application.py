@@ -0,0 +1,46 @@
+import threading
+
+from application import create_app, stop_background
+from database import db
+from helpers import lookup, quote_cache
+
+
+def test_apps_keep_their_own_state(tmp_path):
+    apps = [create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / f'finance{i}.db'}",
+                        "MARKET_DATA": "random_walk", "SIMULATOR_SEED": str(i), "QUOTE_CACHE_TTL": 10.0 * (i + 1),
+                        "SYMBOLS_LISTED_ONLY": "0", "SESSION_BACKEND": "cookie", "SECRET_KEY": "test"})
+            for i in range(3)]
+    threads = threading.active_count()
+    try:
+        for app in apps:
+            app.test_client().get("/login")
+
+        # Every app matches and ranks its own quotes, through listeners of its own cache
+        for i, app in enumerate(apps):
+            cache = app.extensions["quote_cache"]
+            assert cache.ttl == 10.0 * (i + 1)
+            assert cache.listeners == [app.extensions["order_matcher"].on_quotes,
+                                       app.extensions["leaderboard"].on_quotes]
+            with app.app_context():
+                assert quote_cache.ttl == cache.ttl
+                assert lookup("AAPL") is not None
+            assert cache.age("AAPL") is not None
+            assert all(other.extensions["quote_cache"].age("AAPL") is None for other in apps[i + 1:])
+        assert threading.active_count() == threads + 6
+    finally:
+        for app in apps:
+            stop_background(app)
+
+    assert threading.active_count() == threads
+    assert all(app.extensions["quote_cache"].listeners == [] for app in apps)
+
+
+def test_database_settings_from_config(tmp_path):
+    app = create_app({"SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'finance.db'}", "MARKET_DATA": "random_walk",
+                      "DB_POOL_SIZE": 3, "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_CACHE_SIZE": "-1000"})
+    with app.app_context():
+        assert db.engine.pool.size() == 3
+        assert db.session.execute(db.text("PRAGMA journal_mode")).scalar() == "delete"
+        assert db.session.execute(db.text("PRAGMA cache_size")).scalar() == -1000
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,32 @@
+from database import db
+from models import Transaction, User
+
+
+def backtest(app, *args):
+    return app.test_cli_runner().invoke(args=["backtest", "buy_and_hold", "AAPL", "MSFT", "--simulate", "30", *args])
+
+
+def test_save_refuses_application_database(app, client):
+    result = backtest(app, "--save", app.config["SQLALCHEMY_DATABASE_URI"], "--overwrite")
+
+    assert result.exit_code == 1
+    assert "database of the application" in result.output
+    with app.app_context():
+        assert User.query.filter_by(username="test").count() == 1
+        assert User.query.filter_by(username="backtest").count() == 0
+
+
+def test_save_overwrites_only_when_asked(app, tmp_path):
+    uri = f"sqlite:///{tmp_path / 'backtest.db'}"
+    assert backtest(app, "--save", uri).exit_code == 0
+
+    result = backtest(app, "--save", uri)
+    assert result.exit_code == 1
+    assert "--overwrite" in result.output
+
+    assert backtest(app, "--save", uri, "--overwrite").exit_code == 0
+    engine = db.create_engine(uri, {})
+    with engine.connect() as connection:
+        assert connection.execute(db.select([db.func.count()]).select_from(User.__table__)).scalar() == 1
+        assert connection.execute(db.select([db.func.count()]).select_from(Transaction.__table__)).scalar() == 2
+    engine.dispose()
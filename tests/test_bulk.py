@@ -0,0 +1,52 @@
+import pytest
+
+import bulk
+from models import Position, Transaction
+
+
+def test_import_transactions(app):
+    rows = [{"user_id": "1", "symbol": "aapl", "shares": "3", "price": "120.5", "transaction_date": "2021-01-04 10:00:00"}]
+    with app.app_context():
+        count, user_ids = bulk.import_rows("transactions", rows)
+        assert (count, user_ids) == (1, {1})
+        assert Transaction.query.one().stocks_symbol == "AAPL"
+
+
+@pytest.mark.parametrize("column, value", [("shares", "x"), ("price", "abc"), ("transaction_date", "yesterday")])
+def test_import_malformed_row(app, column, value):
+    row = {"user_id": "1", "symbol": "AAPL", "shares": "3", "price": "120.5", "transaction_date": "2021-01-04"}
+    with app.app_context():
+        with pytest.raises(ValueError, match=f"row 1: invalid {column}"):
+            bulk.import_rows("transactions", [dict(row, **{column: value})])
+        assert Transaction.query.count() == 0
+
+
+def test_import_symbol_of_another_type(app):
+    row = {"user_id": 1, "symbol": 7, "shares": 3, "price": 120.5, "transaction_date": "2021-01-04"}
+    with app.app_context():
+        with pytest.raises(ValueError, match="row 1: invalid symbol 7"):
+            bulk.import_rows("transactions", [row])
+
+
+def test_import_data_command_rebuilds_chunks_before_failure(app, tmp_path):
+    path = tmp_path / "transactions.csv"
+    path.write_text("user_id,symbol,shares,price,transaction_date\n"
+                    "1,AAPL,3,100,2021-01-04\n"
+                    "1,AAPL,2,130,2021-01-05\n"
+                    "2,MSFT,1,200,2021-01-05\n"
+                    "2,MSFT,x,200,2021-01-06\n")
+    result = app.test_cli_runner().invoke(args=["import-data", "transactions", str(path), "--chunk-size", "2"])
+    assert result.exit_code == 1
+    assert "row 4: invalid shares 'x'" in result.output
+    with app.app_context():
+        assert Transaction.query.count() == 2
+        assert [(position.user_id, position.stocks_symbol, position.shares, float(position.cost_basis))
+                for position in Position.query] == [(1, "AAPL", 5, 560.0)]
+
+
+def test_import_data_command_reports_malformed_row(app, tmp_path):
+    path = tmp_path / "users.csv"
+    path.write_text("username,email,password,cash\nbob,bob@example.com,hash,lots\n")
+    result = app.test_cli_runner().invoke(args=["import-data", "users", str(path)])
+    assert result.exit_code == 1
+    assert "row 1: invalid cash 'lots'" in result.output
@@ -0,0 +1,79 @@
+import time
+
+import pytest
+
+from leaderboard import Leaderboard
+
+
+class Market:
+    """Transactions and accounts of the users, as read from the database"""
+
+    def __init__(self):
+        self.transactions = list()
+        self.cash = dict()
+        self.reads = list()
+
+    def trade(self, user_id, symbol, shares, price):
+        self.transactions.append((len(self.transactions) + 1, user_id, symbol, shares, price))
+        self.cash[user_id] = self.cash.get(user_id, 10000.0) - shares * price
+
+    def trades(self, after_id, limit):
+        self.reads.append(after_id)
+        return [row for row in self.transactions if row[0] > after_id][:limit]
+
+    def accounts(self, user_ids):
+        return [(user_id, f"user{user_id}", self.cash[user_id]) for user_id in user_ids]
+
+
+def leaderboard(market, **kwargs):
+    return Leaderboard(market.trades, market.accounts, lambda: {"AAPL": "Information Technology", "XOM": "Energy"},
+                       **kwargs)
+
+
+def test_rank_users_and_stocks():
+    market = Market()
+    market.trade(1, "AAPL", 10, 100.0)
+    market.trade(2, "XOM", 20, 50.0)
+    market.trade(2, "AAPL", 5, 100.0)
+    board = leaderboard(market)
+
+    top = board.refresh()
+    assert top["users"] == 2
+    assert [stock["symbol"] for stock in top["most_held"]] == ["AAPL", "XOM"]
+    assert top["market_value"] == 2500.0
+
+    # A quote moves the value of the holders at the next refresh
+    board.on_quotes({"xom": {"price": 60.0}})
+    top = board.refresh()
+    assert [(user["username"], user["value"]) for user in top["value"]] == [("user2", 10200.0), ("user1", 10000.0)]
+    assert top["return"][0]["return"] == pytest.approx(0.02)
+    assert [(sector["sector"], sector["value"]) for sector in top["sectors"]] == \
+        [("Information Technology", 1500.0), ("Energy", 1200.0)]
+
+
+def test_refresh_reads_new_trades_only():
+    market = Market()
+    market.trade(1, "AAPL", 10, 100.0)
+    board = leaderboard(market)
+    board.refresh()
+
+    market.trade(1, "AAPL", -10, 120.0)
+    top = board.refresh()
+    assert market.reads == [0, 1]
+    assert top["value"][0]["value"] == 10200.0
+    assert top["most_held"] == []
+
+
+def test_thread_refreshes_until_stopped():
+    market = Market()
+    board = leaderboard(market, interval=0.01)
+    board.start()
+    try:
+        deadline = time.monotonic() + 5
+        while board.refreshes < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        board.stop()
+        board.join(5)
+    assert board.refreshes >= 3
+    assert not board.is_alive()
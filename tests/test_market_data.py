@@ -0,0 +1,39 @@
+import math
+import time
+
+from market_data import RandomWalkProvider
+
+
+def test_price_is_reproducible():
+    first, second = RandomWalkProvider(seed=1), RandomWalkProvider(seed=1)
+    for tick in (0, 10, 11, 5000):
+        assert first.price("AAPL", tick) == second.price("aapl", tick)
+    assert first.price("AAPL", 5000) != RandomWalkProvider(seed=2).price("AAPL", 5000)
+
+
+def test_earlier_tick_starts_over():
+    provider = RandomWalkProvider()
+    start = provider.price("AAPL", 0)
+    assert 10 <= start <= 500
+    provider.price("AAPL", 1000)
+    assert provider.price("AAPL", 0) == start
+
+
+def test_price_after_long_idle_is_fast():
+    # An hour at 100 ticks per second, for 20 symbols never priced before
+    now = [0.0]
+    provider = RandomWalkProvider(tick_rate=100, clock=lambda: now[0])
+    now[0] = 3600.0
+    started = time.perf_counter()
+    quotes = provider.quote_many([f"S{i}" for i in range(20)])
+    assert time.perf_counter() - started < 0.1
+    assert all(quote["price"] > 0 for quote in quotes.values())
+
+
+def test_jump_matches_ticks_volatility():
+    # n ticks of volatility v move the log price by v * sqrt(n)
+    provider = RandomWalkProvider(volatility=0.001)
+    symbols = [f"S{i}" for i in range(2000)]
+    returns = [math.log(provider.price(symbol, 10000) / provider.price(symbol, 0)) for symbol in symbols]
+    deviation = math.sqrt(sum(value ** 2 for value in returns) / len(returns))
+    assert 0.09 < deviation < 0.11
@@ -0,0 +1,35 @@
+from datetime import datetime
+
+import pytest
+
+from database import db
+from models import Order
+
+
+@pytest.mark.parametrize("now, expires", [
+    # Summer, EDT: the close is 20:00 UTC
+    (datetime(2021, 7, 1, 15, 0), datetime(2021, 7, 1, 20, 0)),
+    (datetime(2021, 7, 1, 20, 0), datetime(2021, 7, 2, 20, 0)),
+    # Winter, EST: the close is 21:00 UTC
+    (datetime(2021, 1, 4, 20, 30), datetime(2021, 1, 4, 21, 0)),
+    (datetime(2021, 1, 4, 21, 30), datetime(2021, 1, 5, 21, 0)),
+    # Past midnight UTC it's still the evening of the previous day in New York
+    (datetime(2021, 1, 5, 2, 0), datetime(2021, 1, 5, 21, 0)),
+    # After the close on the day before DST starts or ends, the next close is in the new offset
+    (datetime(2021, 3, 13, 22, 0), datetime(2021, 3, 14, 20, 0)),
+    (datetime(2021, 11, 6, 21, 0), datetime(2021, 11, 7, 21, 0)),
+])
+def test_day_end_at_new_york_close(now, expires):
+    assert Order.day_end(now) == expires
+
+
+def test_init_db_drops_indexes_removed_from_models(app):
+    with app.app_context():
+        db.session.execute(db.text("CREATE INDEX ix_transaction_user_id_stocks_symbol "
+                                   "ON \"transaction\" (user_id, stocks_symbol)"))
+        db.session.commit()
+    result = app.test_cli_runner().invoke(args=["init-db"])
+    assert result.exit_code == 0
+    with app.app_context():
+        indexes = {index["name"] for index in db.inspect(db.engine).get_indexes("transaction")}
+    assert indexes == {"ix_transaction_user_id_transaction_date", "ix_transaction_user_id_stocks_symbol_transaction_date"}
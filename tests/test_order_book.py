@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from database import db
+from models import Order
+from order_book import OrderBook, OrderMatcher
+from orders import place_order
+
+
+def test_match_pops_crossed_orders_by_price():
+    book = OrderBook()
+    book.add(1, "AAPL", "sell", "limit", limit_price=110)
+    book.add(2, "AAPL", "sell", "limit", limit_price=105)
+    book.add(3, "AAPL", "sell", "limit", limit_price=120)
+    book.add(4, "AAPL", "buy", "limit", limit_price=90)
+    book.add(5, "aapl", "buy", "limit", limit_price=95)
+
+    assert book.match("AAPL", 100) == ([], [])
+    assert book.match("AAPL", 112) == ([2, 1], [])
+    assert book.match("AAPL", 89) == ([5, 4], [])
+    assert book.match("MSFT", 1000) == ([], [])
+    assert len(book) == 1 and 3 in book
+
+
+def test_removed_order_is_skipped():
+    book = OrderBook()
+    book.add(1, "AAPL", "sell", "limit", limit_price=110)
+    book.add(2, "AAPL", "sell", "limit", limit_price=115)
+    book.remove(1)
+
+    assert len(book) == 1
+    assert book.match("AAPL", 120) == ([2], [])
+    assert book.symbols() == []
+
+
+def test_stop_orders_fill_once_crossed():
+    book = OrderBook()
+    book.add(1, "AAPL", "sell", "stop", stop_price=95)
+    book.add(2, "AAPL", "buy", "stop", stop_price=105)
+
+    assert book.match("AAPL", 100) == ([], [])
+    assert book.match("AAPL", 94) == ([1], [])
+    assert book.match("AAPL", 105) == ([2], [])
+
+
+def test_stop_limit_order_rests_as_limit_once_triggered():
+    book = OrderBook()
+    book.add(1, "AAPL", "buy", "stop_limit", limit_price=104, stop_price=105)
+    book.add(2, "AAPL", "sell", "stop_limit", limit_price=93, stop_price=95)
+
+    # Reaching the stop of a buy turns it into a limit order below the price
+    assert book.match("AAPL", 106) == ([], [1])
+    assert book.match("AAPL", 103) == ([1], [])
+
+    # The limit of a sell can fill with the same price that triggers it
+    assert book.match("AAPL", 94) == ([2], [2])
+
+    # An order resting again as a limit order is restored already triggered
+    book.add(3, "AAPL", "buy", "stop_limit", limit_price=104, stop_price=105, triggered=True)
+    assert book.match("AAPL", 104) == ([3], [])
+
+
+def test_day_order_expires_at_day_end(client, app):
+    with app.app_context():
+        order = place_order(1, "AAPL", "buy", "limit", 1, limit_price=1, time_in_force="day")
+        assert order.expires == Order.day_end(order.created)
+        assert Order.expire(order.expires - timedelta(seconds=1)) == []
+        assert Order.expire(order.expires) == [order.id]
+        assert db.session.query(Order.status).filter_by(id=order.id).scalar() == "expired"
+
+
+def test_matcher_fills_and_expires_in_background():
+    book = OrderBook()
+    book.add(1, "AAPL", "sell", "limit", limit_price=110)
+    book.add(2, "AAPL", "buy", "limit", limit_price=90)
+    filled = list()
+    matcher = OrderMatcher(book, lambda order_id, price: filled.append((order_id, price)), lambda order_id: None,
+                           lambda: [2], interval=0.01)
+
+    # Quotes aren't queued while no thread matches them
+    matcher.on_quotes({"AAPL": {"price": 111}})
+    assert matcher._quotes.empty()
+
+    matcher.start()
+    try:
+        matcher.on_quotes({"AAPL": {"price": 111}})
+        deadline = time.monotonic() + 5
+        while len(book) and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        matcher.stop()
+        matcher.join(5)
+    assert filled == [(1, 111)]
+    assert len(book) == 0
+    assert not matcher.is_alive()
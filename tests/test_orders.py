@@ -0,0 +1,47 @@
+import pytest
+
+from models import Position, Transaction, User
+from orders import OrderError, basket_from_weights, execute_basket, execute_order
+
+PRICES = {"AAPL": 100.0, "MSFT": 250.0, "XOM": 50.0}
+
+
+def holdings(user_id):
+    return {position.stocks_symbol: position.shares for position in Position.query.filter_by(user_id=user_id)
+            if position.shares}
+
+
+def test_basket_trades_every_leg(client, app):
+    with app.app_context():
+        execute_order(1, "XOM", 10, PRICES["XOM"])
+        execute_basket(1, [("AAPL", 20), ("MSFT", 10), ("XOM", -4)], PRICES)
+        assert holdings(1) == {"AAPL": 20, "MSFT": 10, "XOM": 6}
+        assert float(User.query.get(1).cash) == 10000 - 500 - 2000 - 2500 + 200
+
+
+@pytest.mark.parametrize("legs, error", [
+    # Every leg is affordable on its own, not all of them
+    ([("AAPL", 50), ("MSFT", 20), ("XOM", -5)], "can't afford"),
+    ([("AAPL", 1), ("XOM", -11)], "too many shares of XOM"),
+    ([("AAPL", 1), ("MSFT", -1)], "no shares own of MSFT"),
+])
+def test_rejected_leg_rolls_back_the_basket(client, app, legs, error):
+    with app.app_context():
+        execute_order(1, "XOM", 10, PRICES["XOM"])
+        with pytest.raises(OrderError, match=error):
+            execute_basket(1, legs, PRICES)
+        assert holdings(1) == {"XOM": 10}
+        assert Transaction.query.count() == 1
+        assert float(User.query.get(1).cash) == 9500
+
+
+def test_weights_become_whole_share_legs():
+    # 10000 in cash and 1000 of XOM: 60% is 6600 (66 AAPL), 30% is 3300 (13.2 MSFT) and XOM is sold
+    legs = basket_from_weights({"AAPL": 0.6, "MSFT": 0.3}, {"XOM": 20}, PRICES, 10000.0)
+    assert legs == [("AAPL", 66), ("MSFT", 13), ("XOM", -20)]
+
+    # Owned shares already on target aren't traded
+    assert basket_from_weights({"AAPL": 0.5}, {"AAPL": 50}, PRICES, 5000.0) == []
+
+    with pytest.raises(OrderError):
+        basket_from_weights({"AAPL": 0.6, "MSFT": 0.5}, {}, PRICES, 10000.0)
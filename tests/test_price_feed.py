@@ -0,0 +1,41 @@
+from database import db
+from models import Position, User
+from price_feed import PriceFeed
+
+
+def test_one_lookup_for_every_subscriber():
+    lookups = list()
+
+    def lookup_many(symbols):
+        lookups.append(set(symbols))
+        return {symbol: {"price": float(len(lookups)), "symbol": symbol} for symbol in symbols}
+
+    # The thread of the feed publishes once when the first client subscribes, then waits for the interval
+    feed = PriceFeed(lookup_many, interval=3600)
+    subscriptions = [feed.subscribe([f"S{i % 50}", f"S{(i + 1) % 50}"]) for i in range(1000)]
+    feed.publish(subscriptions)
+
+    assert len(lookups) <= 2
+    assert {f"S{i}" for i in range(50)} in lookups
+    for subscription in subscriptions:
+        changes = subscription.get(timeout=1)
+        while not subscription.changes.empty():
+            changes = subscription.get()
+        assert set(changes) == subscription.symbols
+
+
+def test_stream_holds_no_database_connection(app, client):
+    with app.app_context():
+        user_id = User.query.filter_by(username="test").one().id
+        db.session.add(Position(user_id=user_id, stocks_symbol="AAPL", shares=10, cost_basis=1000))
+        db.session.commit()
+    app.extensions["price_feed"].interval = 0.05
+
+    response = client.get("/stream/portfolio", buffered=False)
+    try:
+        assert next(response.response).startswith(b"data: ")
+        with app.app_context():
+            assert db.engine.pool.checkedout() == 0
+        assert len(app.extensions["price_feed"]) == 1
+    finally:
+        response.close()
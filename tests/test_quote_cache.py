@@ -0,0 +1,123 @@
+import threading
+import time
+
+from price_poller import PricePoller
+from quote_cache import QuoteCache
+
+
+def quote(symbol, price=100.0):
+    return {"name": f"{symbol} Inc", "price": price, "symbol": symbol}
+
+
+class SlowUpstream:
+    """Upstream API answering once released, recording the symbols of every request"""
+
+    def __init__(self):
+        self.requests = list()
+        self.release = threading.Event()
+
+    def quote_many(self, symbols):
+        self.requests.append(list(symbols))
+        self.release.wait(5)
+        return {symbol: quote(symbol, 200.0) for symbol in symbols}
+
+
+def test_expired_quote_served_while_refreshing():
+    cache = QuoteCache(ttl=0.05, max_stale=60)
+    cache.get_many(["AAPL"], lambda symbols: {symbol: quote(symbol) for symbol in symbols})
+    time.sleep(0.1)
+
+    upstream = SlowUpstream()
+    started = time.monotonic()
+    assert cache.get_many(["AAPL"], upstream.quote_many) == {"AAPL": quote("AAPL")}
+    assert time.monotonic() - started < 1
+    assert cache.stale_hits == 1
+
+    # A second read doesn't start another refresh, and the refreshed quote is served once it's in
+    cache.get_many(["AAPL"], upstream.quote_many)
+    upstream.release.set()
+    for i in range(100):
+        if cache.age("AAPL") < 0.05:
+            break
+        time.sleep(0.01)
+    assert cache.get_many(["AAPL"], upstream.quote_many)["AAPL"]["price"] == 200.0
+    assert upstream.requests == [["AAPL"]]
+
+
+def test_quote_too_old_is_fetched():
+    cache = QuoteCache(ttl=0.05, max_stale=0.05)
+    cache.get_many(["AAPL"], lambda symbols: {symbol: quote(symbol) for symbol in symbols})
+    time.sleep(0.15)
+
+    assert cache.get_many(["AAPL"], lambda symbols: {symbol: quote(symbol, 200.0) for symbol in symbols}) == \
+        {"AAPL": quote("AAPL", 200.0)}
+    assert cache.misses == 2
+
+
+def test_poller_shares_the_flight_of_a_miss():
+    cache = QuoteCache()
+    upstream = SlowUpstream()
+    page = threading.Thread(target=cache.get_many, args=(["AAPL", "MSFT"], upstream.quote_many))
+    page.start()
+    while not upstream.requests:
+        time.sleep(0.01)
+
+    poller = PricePoller(lambda: ["AAPL", "MSFT", "XOM"], cache, upstream)
+    polled = threading.Thread(target=poller.refresh)
+    polled.start()
+    while len(upstream.requests) < 2:
+        time.sleep(0.01)
+    upstream.release.set()
+    page.join()
+    polled.join()
+
+    assert upstream.requests == [["AAPL", "MSFT"], ["XOM"]]
+    assert poller.last_refresh is not None
+
+
+def test_fresh_quote_served_until_ttl():
+    cache = QuoteCache(ttl=0.05, max_stale=0)
+    fetched = list()
+
+    def fetch(symbols):
+        fetched.append(list(symbols))
+        return {symbol: quote(symbol, 100.0 + len(fetched)) for symbol in symbols}
+
+    assert cache.get_many(["AAPL"], fetch) == {"AAPL": quote("AAPL", 101.0)}
+    assert cache.get_many(["AAPL"], fetch) == {"AAPL": quote("AAPL", 101.0)}
+    time.sleep(0.1)
+    assert cache.get_many(["AAPL"], fetch) == {"AAPL": quote("AAPL", 102.0)}
+    assert fetched == [["AAPL"], ["AAPL"]]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_least_recently_used_quote_evicted():
+    cache = QuoteCache(maxsize=2)
+    fetch = lambda symbols: {symbol: quote(symbol) for symbol in symbols}
+    cache.get_many(["AAPL", "MSFT"], fetch)
+    cache.get_many(["AAPL"], fetch)
+    cache.get_many(["XOM"], fetch)
+
+    assert cache.age("MSFT") is None
+    assert cache.age("AAPL") is not None and cache.age("XOM") is not None
+    assert cache.stats()["evictions"] == 1 and cache.stats()["size"] == 2
+
+
+def test_concurrent_misses_fetch_once():
+    cache = QuoteCache()
+    upstream = SlowUpstream()
+    results = list()
+    threads = [threading.Thread(target=lambda: results.append(cache.get_many(["AAPL"], upstream.quote_many)))
+               for i in range(8)]
+    for thread in threads:
+        thread.start()
+
+    # Every thread missed before the first one's request came back
+    while cache.misses < len(threads):
+        time.sleep(0.01)
+    upstream.release.set()
+    for thread in threads:
+        thread.join()
+
+    assert upstream.requests == [["AAPL"]]
+    assert results == [{"AAPL": quote("AAPL", 200.0)}] * len(threads)
@@ -0,0 +1,68 @@
+import pytest
+
+from application import create_app
+from database import db
+from models import Position, User
+from quote_client import QuoteClient
+
+
+@pytest.fixture
+def iex_app(tmp_path, fake_iex):
+    """Application getting its quotes from the fake IEX server over HTTP, without caching them"""
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'finance.db'}",
+        "MARKET_DATA": "iex",
+        "API_KEY": "test",
+        "IEX_BASE_URL": fake_iex.url,
+        "QUOTE_CACHE_TTL": 0,
+        "SYMBOLS_LISTED_ONLY": "0",
+        "ORDER_MATCHER": "0",
+        "SESSION_BACKEND": "cookie",
+        "SECRET_KEY": "test",
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def test_quote_many_batches(fake_iex):
+    symbols = [f"S{i}" for i in range(250)] + ["UNKNOWN"]
+    quotes = QuoteClient(base_url=fake_iex.url, api_key="test").quote_many(symbols)
+
+    assert sorted(len(batch) for batch in fake_iex.batches) == [51, 100, 100]
+    assert len(quotes) == 250
+    assert quotes["S0"] == {"name": "S0 Inc", "price": 100.0, "symbol": "S0"}
+
+
+def test_quote_many_fetches_batches_at_once(fake_iex):
+    fake_iex.latency = 0.2
+    quotes = QuoteClient(base_url=fake_iex.url, api_key="test", pool_size=4).quote_many([f"S{i}" for i in range(600)])
+
+    assert len(quotes) == 600
+    assert len(fake_iex.batches) == 6
+    assert fake_iex.max_in_flight == 4
+
+
+def test_quote_many_without_symbols(fake_iex):
+    assert QuoteClient(base_url=fake_iex.url, api_key="test").quote_many([]) == dict()
+    assert fake_iex.batches == []
+
+
+@pytest.mark.parametrize("holdings", [1, 10, 100])
+def test_portfolio_page_one_request(iex_app, fake_iex, holdings):
+    client = iex_app.test_client()
+    client.post("/register", data={"username": "test", "email": "test@example.com",
+                                   "password": "secret", "confirmation": "secret"})
+    with iex_app.app_context():
+        user_id = User.query.filter_by(username="test").one().id
+        db.session.add_all([Position(user_id=user_id, stocks_symbol=f"S{i}", shares=1, cost_basis=100)
+                            for i in range(holdings)])
+        db.session.commit()
+
+    response = client.get("/")
+    assert response.status_code == 200
+    assert f"S{holdings - 1} Inc".encode() in response.data
+    assert len(fake_iex.batches) == 1
+    assert sorted(fake_iex.batches[0]) == sorted(f"S{i}" for i in range(holdings))
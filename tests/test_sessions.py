@@ -0,0 +1,74 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+from application import create_app, stop_background
+from database import db
+from models import StoredSession
+
+
+@pytest.fixture(params=["database", "redis"])
+def app(request, tmp_path):
+    """Application keeping its sessions in the database, or in an in-process stand-in for Redis"""
+    app = create_app({
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'finance.db'}",
+        "MARKET_DATA": "random_walk",
+        "ORDER_MATCHER": "0",
+        "SESSION_BACKEND": request.param,
+        "REDIS_URL": "memory://",
+    })
+    with app.app_context():
+        db.create_all()
+    yield app
+    stop_background(app)
+    with app.app_context():
+        db.engine.dispose()
+
+
+def sid(client, app):
+    return next((cookie.value for cookie in client.cookie_jar if cookie.name == app.session_cookie_name), None)
+
+
+def test_session_round_trip(client, app):
+    assert client.get("/").status_code == 200
+
+    # The cookie only holds the sid, the data stays on the server
+    assert "user_id" not in sid(client, app)
+    other = app.test_client()
+    other.set_cookie("localhost", app.session_cookie_name, sid(client, app))
+    assert other.get("/").status_code == 200
+
+
+def test_logout_forgets_session(client, app):
+    before = sid(client, app)
+    assert client.get("/logout").status_code == 302
+    assert sid(client, app) is None
+
+    # The sid of the logged out session is useless
+    other = app.test_client()
+    other.set_cookie("localhost", app.session_cookie_name, before)
+    assert other.get("/").headers["Location"].endswith("/login")
+    if app.config["SESSION_BACKEND"] == "database":
+        with app.app_context():
+            assert StoredSession.query.count() == 0
+
+
+def test_session_expires(app):
+    app.permanent_session_lifetime = timedelta(seconds=1)
+    client = app.test_client()
+    client.post("/register", data={"username": "test", "email": "test@example.com",
+                                   "password": "secret", "confirmation": "secret"})
+    assert client.get("/").status_code == 200
+    time.sleep(1.1)
+    assert client.get("/").headers["Location"].endswith("/login")
+
+    # Only the database keeps expired sessions until they're swept; Redis drops them itself
+    result = app.test_cli_runner().invoke(args=["sweep-sessions"])
+    if app.config["SESSION_BACKEND"] == "database":
+        assert result.output == "Deleted 1 expired sessions.\n"
+        with app.app_context():
+            assert StoredSession.query.count() == 0
+    else:
+        assert result.exit_code == 1
+        assert "sessions aren't kept in the database" in result.output
@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from application import create_app
+from database import db
+from market import listed_stocks
+from models import Stocks
+from symbol_index import SymbolIndex
+
+STOCKS = [("AAPL", "Apple Inc.", "Information Technology"), ("MSFT", "Microsoft Corp.", "Information Technology"),
+          ("XOM", "Exxon Mobil Corp.", "Energy")]
+
+
+def test_search():
+    index = SymbolIndex(lambda: STOCKS)
+
+    assert [stock["symbol"] for stock in index.search("a")] == ["AAPL"]
+    assert [stock["symbol"] for stock in index.search("corp")] == ["MSFT", "XOM"]
+    assert [stock["symbol"] for stock in index.search("corp", sector="Energy")] == ["XOM"]
+    assert index.is_valid("msft") and not index.is_valid("GOOG") and not index.is_valid("A1!")
+
+
+def test_load_error_is_retried():
+    calls = list()
+
+    def loader():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OperationalError("SELECT", {}, sqlite3.OperationalError("database is locked"))
+        return STOCKS
+
+    index = SymbolIndex(loader)
+    assert index.search("apple") == []
+    assert index.load_errors == 1
+
+    # The next call loads the stocks instead of keeping an empty list for good
+    assert [stock["symbol"] for stock in index.search("apple")] == ["AAPL"]
+    assert not index.is_valid("GOOG")
+    assert len(calls) == 2
+
+
+def test_listed_stocks_without_table(app):
+    with app.app_context():
+        Stocks.__table__.drop(db.engine)
+        assert listed_stocks() == []
+
+
+def test_listed_stocks_locked_database(app, tmp_path):
+    with app.app_context():
+        db.session.add(Stocks(symbol="AAPL", company_name="Apple Inc.", sector="Information Technology"))
+        db.session.commit()
+        db.session.execute(db.text("PRAGMA journal_mode = DELETE"))
+        db.session.remove()
+
+    # Take the write lock from another connection, with a rollback journal so readers are blocked too
+    locked = create_app({"SQLALCHEMY_DATABASE_URI": app.config["SQLALCHEMY_DATABASE_URI"], "MARKET_DATA": "random_walk",
+                         "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_BUSY_TIMEOUT": 0})
+    other = sqlite3.connect(str(tmp_path / "finance.db"), isolation_level=None)
+    other.execute("BEGIN EXCLUSIVE")
+    try:
+        with locked.app_context(), pytest.raises(OperationalError, match="locked"):
+            listed_stocks()
+    finally:
+        other.rollback()
+        other.close()
+
+    with locked.app_context():
+        assert listed_stocks() == [("AAPL", "Apple Inc.", "Information Technology")]
+        db.engine.dispose()
@@ -0,0 +1,570 @@
+import csv
+import io
+import json
+
+from flask import Blueprint, Response, current_app, flash, redirect, render_template, request, session, stream_with_context
+
+from database import db
+from helpers import apology, history_filters, login_required, lookup, lookup_many, percent, symbol_index, usd
+from models import User, Transaction, Position, Order
+from orders import OrderError, cancel_order, execute_order, place_order, trade_basket
+
+
+trading = Blueprint("trading", __name__)
+
+# Number of transactions per page of the history
+HISTORY_PAGE_SIZE = 50
+
+
+def owned_shares(user_id):
+    """Return the symbols and no. of shares of the stocks currently owned by the user"""
+    positions = Position.query.filter_by(user_id=user_id).filter(Position.shares > 0)
+    return {position.stocks_symbol: position.shares for position in positions}
+
+
+@trading.route("/")
+@login_required
+def index():
+    """Show portfolio of stocks"""
+
+    user_id = session["user_id"]
+
+    # Get the current available cash for the user from the database
+    user = User.query.filter_by(id=user_id).first()
+
+    # Get the currently owned stocks i.e symbol and total no. of shares (only positive) for the user
+    owned_stocks = owned_shares(user_id)
+
+    # Assigned the value of cash and total value to be used for index.html
+    cash = float(user.cash)
+    total_value = cash
+
+    # Get the name of company and the current price of all the owned stocks in one batch
+    quotes = lookup_many(stocks for stocks in owned_stocks if owned_stocks[stocks] > 0)
+
+    # Initialize index list for data that will be used in the table in index.html
+    index_ = list()
+    for stocks in owned_stocks:
+        if owned_stocks[stocks] > 0:
+            stocks_info = dict()
+
+            symbol = stocks
+            shares = owned_stocks[stocks]
+
+            quote_ = quotes.get(symbol.upper())
+            if quote_ is None:
+                return apology("problem getting quotes")
+            name = quote_["name"]
+            price = quote_["price"]
+
+            # Get the total amount of each stock and add it to the total value
+            total_price = shares * price
+            total_value += total_price
+
+            # Create dictionary for each stocks to be added to the table in the html
+            stocks_info['symbol'] = symbol
+            stocks_info['name'] = name
+            stocks_info['shares'] = shares
+            stocks_info['price'] = usd(price)
+            stocks_info['total_price'] = usd(total_price)
+
+            index_.append(stocks_info)
+
+    return render_template("index.html", index=index_, cash=usd(cash), total_value=usd(total_value))
+
+
+@trading.route("/analytics")
+@login_required
+def analytics():
+    """Show the cost basis, P&L and returns of every stock ever traded and of the whole portfolio"""
+
+    user_id = session["user_id"]
+    cash = float(User.query.filter_by(id=user_id).first().cash)
+    owned_stocks = owned_shares(user_id)
+    quotes = lookup_many(owned_stocks)
+    prices = {stocks: quotes[stocks.upper()]["price"] for stocks in owned_stocks if stocks.upper() in quotes}
+
+    # numpy is only loaded once a portfolio is analyzed
+    from analytics import portfolio_analytics
+    analytics_ = portfolio_analytics(user_id, prices, cash)
+    performance = list()
+    for symbol, position in analytics_["positions"].items():
+        performance.append({
+            'symbol': symbol,
+            'cost_basis': usd(position["average_cost_basis"]),
+            'realized_pnl': usd(position["realized_pnl"]),
+            'unrealized_pnl': usd(position["unrealized_pnl"]),
+            'time_weighted_return': percent(position["time_weighted_return"]),
+            'money_weighted_return': percent(position["money_weighted_return"])
+        })
+    portfolio = analytics_["portfolio"]
+
+    return render_template("analytics.html", performance=performance, realized_pnl=usd(portfolio["realized_pnl"]),
+                           unrealized_pnl=usd(portfolio["unrealized_pnl"]), portfolio_return=percent(portfolio["return"]))
+
+
+@trading.route("/stream/portfolio")
+@login_required
+def stream_portfolio():
+    """Stream the changed prices and values of the portfolio as server-sent events"""
+
+    user_id = session["user_id"]
+
+    # Get the cash, the owned stocks and their current prices once, when the page connects
+    cash = float(User.query.filter_by(id=user_id).first().cash)
+    owned_stocks = owned_shares(user_id)
+    symbols = {stocks.upper(): stocks for stocks in owned_stocks}
+    prices = {symbol: quote_["price"] for symbol, quote_ in lookup_many(symbols).items()}
+
+    price_feed = current_app.extensions["price_feed"]
+    subscription = price_feed.subscribe(symbols)
+
+    def events():
+        try:
+            while True:
+                changes = subscription.get(timeout=15)
+
+                # Keep the connection open while prices don't move
+                if changes is None:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                stocks_info = dict()
+                for symbol, quote_ in changes.items():
+                    prices[symbol] = quote_["price"]
+                    shares = owned_stocks[symbols[symbol]]
+                    stocks_info[symbols[symbol]] = {
+                        "price": usd(quote_["price"]),
+                        "total_price": usd(shares * quote_["price"])
+                    }
+
+                total_value = cash + sum(owned_stocks[symbols[symbol]] * price for symbol, price in prices.items())
+                data = json.dumps({"stocks": stocks_info, "total_value": usd(total_value)}, separators=(",", ":"))
+                yield f"data: {data}\n\n"
+        finally:
+            price_feed.unsubscribe(subscription)
+
+    return Response(events(), mimetype="text/event-stream", headers={"X-Accel-Buffering": "no"})
+
+
+@trading.route("/buy", methods=["GET", "POST"])
+@login_required
+def buy(stocks_symbol=''):
+    """Buy shares of stock"""
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Assign the data (symbol, number of shares) from the form
+        symbol = request.form.get("symbol").upper()
+
+        # Ensure symbol was entered
+        if not symbol:
+            return apology("missing symbol")
+
+        # Ensure number of shares was submitted
+        elif not request.form.get("shares"):
+            return apology("missing shares")
+
+        shares = int(request.form.get("shares"))
+
+        # Ensure number of shares are valid
+        if shares < 1:
+            return apology("value must be greater than or equal to 1", 400)  # To be checked how to implement in javascript
+
+        # Get the info. of the symbol and check if symbol is valid
+        quote_ = lookup(symbol) if symbol_index.is_valid(symbol) else None
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        # Deduct the price from the cash and add the buy transaction, if the cash is enough
+        try:
+            execute_order(session["user_id"], symbol, shares, quote_["price"])
+        except OrderError as e:
+            return apology(str(e), 400)
+
+        flash(f"Bought {shares} shares of {symbol}!")
+
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("buy.html", stocks_symbol=stocks_symbol)
+
+
+@trading.route("/buy/<stocks_symbol>", methods=["GET", "POST"])
+@login_required
+def buy_home(stocks_symbol):
+    """Buy shares of stock from homepage"""
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Assign the stocks symbol from the homepage
+        symbol = stocks_symbol
+
+        # Ensure number of shares was submitted
+        if not request.form.get("shares"):
+            return apology("missing shares")
+
+        shares = int(request.form.get("shares"))
+
+        # Ensure number of shares are valid
+        if shares < 1:
+            return apology("value must be greater than or equal to 1", 400)
+
+        # Get the info. of the symbol and check if symbol is valid
+        quote_ = lookup(symbol) if symbol_index.is_valid(symbol) else None
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        # Deduct the price from the cash and add the buy transaction, if the cash is enough
+        try:
+            execute_order(session["user_id"], symbol, shares, quote_["price"])
+        except OrderError as e:
+            return apology(str(e), 400)
+
+        flash(f"Bought {shares} shares of {symbol}!")
+
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        # Query the database for the number of shares
+        try:
+            position = Position.query.filter_by(user_id=session["user_id"], stocks_symbol=stocks_symbol).first()
+            num_of_shares = position.shares if position else 0
+        except:
+            return apology("problem in database")
+
+        quote_ = lookup(stocks_symbol) if symbol_index.is_valid(stocks_symbol) else None
+
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        return render_template("buy.html", stocks_symbol=stocks_symbol, num_of_shares=num_of_shares, stock_price=usd(quote_["price"]))
+
+
+@trading.route("/sell", methods=["GET", "POST"])
+@login_required
+def sell(stocks_symbol=''):
+    """Sell shares of stock"""
+
+    user_id = session["user_id"]
+
+    # Query the positions table for the owned stocks (no. of shares > 0) and no. of shares
+    owned_stocks = owned_shares(user_id)
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Assign the symbol from the form
+        symbol = request.form.get("symbol").upper()
+
+        # Ensure symbol was entered
+        if not symbol:
+            return apology("missing symbol")
+
+        # Ensure number of shares was submitted
+        elif not request.form.get("shares"):
+            return apology("missing shares")
+
+        # Assign the number of shares from the form
+        shares = int(request.form.get("shares"))
+
+        # Ensure number of shares are valid
+        if shares < 1:
+            return apology("value must be greater than or equal to 1")
+
+        # Ensure the user owned the stocks
+        elif symbol not in owned_stocks:
+            return apology("no shares own")
+
+        # Ensure the number of owned shares are enough
+        elif shares > owned_stocks[symbol]:
+            return apology("too many shares")
+
+        # Get the quotes of the symbol i.e. price per share
+        quote_ = lookup(symbol)
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        # Add the amount of the sold stocks to the cash and add the sell transaction, if enough shares are owned
+        try:
+            execute_order(user_id, symbol, shares*-1, quote_["price"])
+        except OrderError as e:
+            return apology(str(e))
+
+        flash(f"Sold {shares} shares of {symbol}!")
+
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("sell.html", stocks=owned_stocks, stocks_symbol=stocks_symbol)
+
+
+@trading.route("/sell/<stocks_symbol>", methods=["GET", "POST"])
+@login_required
+def sell_home(stocks_symbol):
+    """Sell shares of stock from homepage"""
+
+    user_id = session["user_id"]
+
+    # Query the positions table for the owned stocks (no. of shares > 0) and no. of shares
+    owned_stocks = owned_shares(user_id)
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Assign the stocks symbol from the homepage
+        symbol = stocks_symbol
+
+        # Ensure number of shares was submitted
+        if not request.form.get("shares"):
+            return apology("missing shares")
+
+        # Assign the number of shares from the form
+        shares = int(request.form.get("shares"))
+
+        # Ensure number of shares are valid
+        if shares < 1:
+            return apology("value must be greater than or equal to 1")
+
+        # Ensure the user owned the stocks
+        elif symbol not in owned_stocks:
+            return apology("no shares own")
+
+        # Ensure the number of owned shares are enough
+        elif shares > owned_stocks[symbol]:
+            return apology("too many shares")
+
+        # Get the quotes of the symbol i.e. price per share
+        quote_ = lookup(symbol)
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        # Add the amount of the sold stocks to the cash and add the sell transaction, if enough shares are owned
+        try:
+            execute_order(user_id, symbol, shares*-1, quote_["price"])
+        except OrderError as e:
+            return apology(str(e))
+
+        flash(f"Sold {shares} shares of {symbol}!")
+
+        # Redirect user to home page
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        quote_ = lookup(stocks_symbol)
+
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        return render_template("sell.html", stocks_symbol=stocks_symbol, num_of_shares=owned_stocks[stocks_symbol], stocks_price=usd(quote_["price"]))
+
+
+@trading.route("/history")
+@login_required
+def history():
+    """Show history of transactions"""
+
+    user_id = session["user_id"]
+
+    # Get the filters and the position in the history from the query string
+    try:
+        filters = history_filters(request.args)
+    except ValueError:
+        return apology("invalid filter", 400)
+
+    # Query one page of transactions, plus one to know if there's a next page
+    transactions = Transaction.history(user_id, limit=HISTORY_PAGE_SIZE + 1, **filters).all()
+    next_cursor = None
+    if len(transactions) > HISTORY_PAGE_SIZE:
+        transactions = transactions[:HISTORY_PAGE_SIZE]
+        next_cursor = transactions[-1].cursor
+
+    # Initialize index dictionary for data that will be used in the table in history.html
+    index_ = dict()
+    for i, transaction in enumerate(transactions):
+        # Get the individual data from the output of the database
+        symbol = transaction.stocks_symbol
+        shares = transaction.shares
+        price = transaction.price
+        transaction_date = transaction.transaction_date
+
+        # Create the list of data to be added to the table in the history.html
+        index_[i] = list()
+        index_[i].append(symbol)
+        index_[i].append(shares)
+        index_[i].append(usd(price))
+        index_[i].append(transaction_date)
+
+    # Keep the filters in the links to the next page and to the export
+    filter_args = {name: value for name, value in request.args.items() if name != "cursor" and value}
+
+    # Render the history.html with the data
+    return render_template("history.html", index=index_, next_cursor=next_cursor, filter_args=filter_args)
+
+
+@trading.route("/history/export")
+@login_required
+def history_export():
+    """Download the whole filtered history of transactions as CSV or JSON"""
+
+    user_id = session["user_id"]
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "json"):
+        return apology("format must be csv or json", 400)
+
+    try:
+        filters = history_filters(request.args)
+    except ValueError:
+        return apology("invalid filter", 400)
+
+    def transactions():
+        # Read the history in batches so memory stays flat however long it is
+        cursor = filters.pop("cursor")
+        while True:
+            batch = Transaction.history(user_id, cursor=cursor, limit=1000, **filters).all()
+            yield from batch
+            if len(batch) < 1000:
+                return
+            cursor = (batch[-1].transaction_date, batch[-1].id)
+            db.session.expunge_all()
+
+    def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["symbol", "shares", "price", "date"])
+        for transaction in transactions():
+            writer.writerow([transaction.stocks_symbol, transaction.shares, float(transaction.price),
+                             transaction.transaction_date.isoformat()])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    def json_rows():
+        separator = "["
+        for transaction in transactions():
+            yield separator + json.dumps({
+                "symbol": transaction.stocks_symbol,
+                "shares": transaction.shares,
+                "price": float(transaction.price),
+                "date": transaction.transaction_date.isoformat()
+            }, separators=(",", ":"))
+            separator = ","
+        yield "]" if separator == "," else "[]"
+
+    rows = csv_rows() if export_format == "csv" else json_rows()
+    mimetype = "text/csv" if export_format == "csv" else "application/json"
+    return Response(stream_with_context(rows), mimetype=mimetype,
+                    headers={"Content-Disposition": f"attachment; filename=history.{export_format}"})
+
+
+@trading.route("/basket", methods=["GET", "POST"])
+@login_required
+def basket():
+    """Buy and sell several stocks at once, or rebalance to target weights"""
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        # Read one leg per line, e.g. "AAPL buy 10" or "AAPL sell 5", or one weight per line, e.g. "AAPL 60%"
+        legs, weights = list(), dict()
+        for line in request.form.get("basket", "").upper().splitlines():
+            words = line.split()
+            if not words:
+                continue
+            elif len(words) == 3 and words[1] in ("BUY", "SELL") and words[2].isdigit() and int(words[2]) > 0:
+                legs.append((words[0], int(words[2]) if words[1] == "BUY" else -int(words[2])))
+            elif len(words) == 2 and words[1].endswith("%"):
+                try:
+                    weights[words[0]] = float(words[1][:-1]) / 100
+                except ValueError:
+                    return apology(f"invalid line {line}")
+            else:
+                return apology(f"invalid line {line}")
+
+        # Ensure the basket has either legs or weights
+        if bool(legs) == bool(weights):
+            return apology("enter either legs or weights")
+
+        try:
+            transactions = trade_basket(session["user_id"], legs=legs, weights=weights)
+        except OrderError as e:
+            return apology(str(e), 400)
+
+        flash(f"Traded {len(transactions)} stocks!")
+        return redirect("/")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        return render_template("basket.html")
+
+
+@trading.route("/orders", methods=["GET", "POST"])
+@login_required
+def orders():
+    """Place limit and stop orders and show the orders of the user"""
+
+    user_id = session["user_id"]
+
+    # User reached route via POST (as by submitting a form via POST)
+    if request.method == "POST":
+
+        symbol = request.form.get("symbol", "").upper()
+
+        # Ensure symbol and number of shares were submitted
+        if not symbol:
+            return apology("missing symbol")
+        elif not request.form.get("shares"):
+            return apology("missing shares")
+
+        try:
+            shares = int(request.form.get("shares"))
+            limit_price = float(request.form["limit_price"]) if request.form.get("limit_price") else None
+            stop_price = float(request.form["stop_price"]) if request.form.get("stop_price") else None
+        except ValueError:
+            return apology("invalid number")
+
+        # Check symbol is valid, and get its price to match the order against right away
+        quote_ = lookup(symbol) if symbol_index.is_valid(symbol) else None
+        if quote_ is None:
+            return apology("invalid symbol", 400)
+
+        try:
+            order = place_order(user_id, symbol, request.form.get("side"), request.form.get("type"), shares,
+                                limit_price, stop_price, request.form.get("time_in_force", "gtc"))
+        except OrderError as e:
+            return apology(str(e), 400)
+
+        current_app.extensions["order_book"].add(order.id, order.stocks_symbol, order.side, order.type,
+                                                 order.limit_price, order.stop_price)
+        current_app.extensions["order_matcher"].on_quotes({symbol: quote_})
+
+        flash(f"Placed {order.type.replace('_', '-')} order to {order.side} {shares} shares of {symbol}!")
+        return redirect("/orders")
+
+    # User reached route via GET (as by clicking a link or via redirect)
+    else:
+        orders_ = Order.query.filter_by(user_id=user_id).order_by(Order.created.desc()).limit(HISTORY_PAGE_SIZE)
+        return render_template("orders.html", orders=orders_)
+
+
+@trading.route("/orders/<int:order_id>/cancel", methods=["POST"])
+@login_required
+def cancel(order_id):
+    """Cancel an open order"""
+    try:
+        cancel_order(session["user_id"], order_id)
+    except OrderError as e:
+        return apology(str(e), 400)
+
+    current_app.extensions["order_book"].remove(order_id)
+    flash("Order cancelled!")
+    return redirect("/orders")